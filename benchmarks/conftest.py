@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Payload corpora shared by the benchmarks.
+
+The payloads are generated rather than captured so that the benchmarks
+run offline and produce the same numbers from one run to the next. Each
+is sized to match the largest payloads seen from real servers.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import struct
+
+import pytest
+
+import valve.rcon
+from valve.source import messages
+
+
+PLAYERS = 255
+RULES = 1000
+PAGES = 20
+PAGE_SIZE = 231
+VDF_ITEMS = 20000
+CONVARS = 4000
+RCON_BODY_SIZE = 4096
+
+
+@pytest.fixture(scope="session")
+def players_payload():
+    """A2S_PLAYER response for a full server of 255 players."""
+    return b"\x44" + struct.pack("<B", PLAYERS) + b"".join(
+        messages.PlayerEntry(
+            index=index,
+            name="Player with a fairly long name {}".format(index),
+            score=index * 7,
+            duration=index * 60.0,
+        ).encode() for index in range(PLAYERS))
+
+
+@pytest.fixture(scope="session")
+def rules_payload():
+    """A2S_RULES response with 1000 rules, as sent by modded servers."""
+    return b"\x45" + struct.pack("<h", RULES) + b"".join(
+        "sm_plugin_setting_{0}\x00value {0}\x00".format(index).encode("ascii")
+        for index in range(RULES))
+
+
+@pytest.fixture(scope="session")
+def master_pages():
+    """Full pages of master server addresses, the last terminated."""
+    header = b"\xFF\xFF\xFF\xFF\x66\x0A"
+    addresses = [struct.pack(">IH", 0x0A000000 + index, 27015)
+                 for index in range(PAGES * PAGE_SIZE - 1)]
+    addresses.append(b"\x00" * 6)
+    return [header + b"".join(addresses[start:start + PAGE_SIZE])
+            for start in range(0, len(addresses), PAGE_SIZE)]
+
+
+@pytest.fixture(scope="session")
+def vdf_document():
+    """A multi-megabyte VDF document in the style of ``items_game.txt``."""
+    lines = ['"items_game"', "{", '\t"items"', "\t{"]
+    for index in range(VDF_ITEMS):
+        lines.extend([
+            '\t\t"{}"'.format(index),
+            "\t\t{",
+            '\t\t\t"name"\t\t"Item {}"'.format(index),
+            '\t\t\t"item_class"\t\t"tf_wearable"',
+            '\t\t\t"item_quality"\t\t"unique"',
+            "\t\t\t\"min_ilevel\"\t\t1",
+            "\t\t\t\"max_ilevel\"\t\t100",
+            '\t\t\t"attributes"',
+            "\t\t\t{",
+            '\t\t\t\t"attribute {}"'.format(index % 50),
+            "\t\t\t\t{",
+            '\t\t\t\t\t"attribute_class"\t\t"mult_dmg"',
+            "\t\t\t\t\t\"value\"\t\t1.25",
+            "\t\t\t\t}",
+            "\t\t\t}",
+            "\t\t}",
+        ])
+    lines.extend(["\t}", "}", ""])
+    return "\n".join(lines)
+
+
+@pytest.fixture(scope="session")
+def cvarlist_text():
+    """Output of the ``cvarlist`` RCON command for 4000 ConVars."""
+    lines = ["cvar list", "--------------"]
+    for index in range(CONVARS):
+        lines.append(
+            "sv_setting_{0:<30} : {0:<8} : , \"sv\", \"rep\" "
+            ": Description of setting {0}".format(index))
+    lines.extend(["--------------",
+                  "{} total convars/concommands".format(CONVARS), ""])
+    return "\n".join(lines)
+
+
+@pytest.fixture(scope="session")
+def cvarlist_stream(cvarlist_text):
+    """The ``cvarlist`` response as the stream of bytes sent by a server.
+
+    The output is split over multiple ``RESPONSE_VALUE`` messages and
+    followed by the multi-part response terminators.
+    """
+    body = cvarlist_text.encode("ascii")
+    response_value = valve.rcon.RCONMessage.Type.RESPONSE_VALUE
+    parts = [body[start:start + RCON_BODY_SIZE]
+             for start in range(0, len(body), RCON_BODY_SIZE)]
+    parts.extend([b"", b"\x00\x01\x00\x00"])
+    return b"".join(valve.rcon.RCONMessage(1, response_value, part).encode()
+                    for part in parts)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Memory allocated while receiving split responses.
+
+This compares receiving and reassembling a split A2S_RULES response via
+:meth:`valve.source.a2s.ServerQuerier.get_response` against the previous
+approach of receiving each datagram into a new 64 KiB :class:`bytes` and
+copying the fragment payloads out of it. The peak memory allocated during
+reassembly, as measured by :mod:`tracemalloc`, is recorded in the
+``peak_bytes`` extra info field.
+
+Run with ``py.test benchmarks/test_allocations.py``. Python 3.9 or later
+is required for :func:`tracemalloc.reset_peak`.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import socket
+import struct
+import sys
+
+import pytest
+
+from valve.source import a2s
+from valve.source import messages
+
+tracemalloc = pytest.importorskip("tracemalloc")
+if not hasattr(tracemalloc, "reset_peak"):
+    pytest.skip("tracemalloc.reset_peak not available",
+                allow_module_level=True)
+
+
+MTU = 1248
+
+
+def _rules(count):
+    return (b"\xFF\xFF\xFF\xFF\x45" + struct.pack("<h", count) + b"".join(
+        "sv_rule_{0}\x00value {0}\x00".format(i).encode("ascii")
+        for i in range(count)))
+
+
+def _split(payload):
+    chunks = [payload[i:i + MTU] for i in range(0, len(payload), MTU)]
+    return [struct.pack("<llBBh", -2, 1, len(chunks), i, MTU)
+            + chunk for i, chunk in enumerate(chunks)]
+
+
+def _legacy_get_response(socket_):
+    # Reassembly as it was done before receiving into pooled buffers.
+    fragments = {}
+    while True:
+        response = messages.Header.decode(socket_.recv(65536))
+        if response["split"] != messages.SPLIT:
+            return response.payload
+        fragment = messages.Fragment.decode(response.payload)
+        fragments[fragment["fragment_id"]] = fragment
+        if len(fragments) == fragment["fragment_count"]:
+            break
+    payload = b"".join(fragments[index].payload
+                       for index in sorted(fragments))
+    if payload.startswith(b"\xFF\xFF\xFF\xFF"):
+        payload = payload[4:]
+    return payload
+
+
+@pytest.yield_fixture
+def querier():
+    querier = a2s.ServerQuerier(("127.0.0.1", 0), timeout=1.0)
+    querier._socket.bind(("127.0.0.1", 0))
+    # Don't block forever if a datagram is dropped
+    querier._socket.settimeout(querier.timeout)
+    yield querier
+    querier.close()
+
+
+@pytest.yield_fixture
+def sender():
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    yield sender
+    sender.close()
+
+
+def _peak(receive, querier, sender, datagrams):
+    # Warm up once so that one-off allocations such as the pool's slabs
+    # aren't counted.
+    for _ in range(2):
+        for datagram in datagrams:
+            sender.sendto(datagram, querier._socket.getsockname())
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        payload = receive()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    return payload, peak
+
+
+# Larger responses risk overflowing the socket's receive buffer
+@pytest.mark.parametrize("count", [100, 1000, 2500])
+def test_peak_allocated(benchmark, querier, sender, count):
+    payload = _rules(count)
+    datagrams = _split(payload)
+    tracemalloc.start()
+    try:
+        legacy_payload, legacy_peak = _peak(
+            lambda: _legacy_get_response(querier._socket),
+            querier, sender, datagrams)
+        pooled_payload, pooled_peak = _peak(
+            querier.get_response, querier, sender, datagrams)
+    finally:
+        tracemalloc.stop()
+    assert pooled_payload == legacy_payload == payload[4:]
+    benchmark.extra_info["bytes"] = len(payload)
+    benchmark.extra_info["datagrams"] = len(datagrams)
+    benchmark.extra_info["peak_bytes"] = pooled_peak
+    benchmark.extra_info["legacy_peak_bytes"] = legacy_peak
+    print("\n{} datagrams: peak {} bytes, previously {} bytes".format(
+        len(datagrams), pooled_peak, legacy_peak), file=sys.stderr)
+    assert pooled_peak < legacy_peak
+
+    def receive():
+        for datagram in datagrams:
+            sender.sendto(datagram, querier._socket.getsockname())
+        return querier.get_response()
+
+    benchmark(receive)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Benchmarks for decoding large payloads.
+
+These cover the codecs on the hot paths of each protocol using the
+corpora from ``conftest.py``: A2S responses with many players and rules,
+pages of master server addresses, multi-megabyte VDF documents and the
+multi-part RCON output of ``cvarlist``. The size of each payload is
+recorded in the ``bytes`` extra info field so that throughput can be
+derived from the mean time.
+
+Run with ``py.test benchmarks/test_codecs.py``. Save the results with
+``--benchmark-autosave`` and compare against them after making changes
+with ``--benchmark-compare``.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import pytest
+import six
+
+import valve.rcon
+import valve.vdf
+from valve.source import messages
+
+import conftest
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["eager", "lazy"])
+def test_players(benchmark, players_payload, lazy):
+    benchmark.extra_info["bytes"] = len(players_payload)
+    response = benchmark(messages.PlayersResponse.decode,
+                         players_payload, lazy)
+    assert len(response["players"]) == conftest.PLAYERS
+
+
+def test_rules(benchmark, rules_payload):
+    benchmark.extra_info["bytes"] = len(rules_payload)
+    response = benchmark(messages.RulesResponse.decode, rules_payload)
+    assert len(response["rules"]) == conftest.RULES
+
+
+def test_master_server_pages(benchmark, master_pages):
+
+    def decode():
+        return [messages.MasterServerPackedResponse.decode(page)
+                for page in master_pages]
+
+    benchmark.extra_info["bytes"] = sum(len(page) for page in master_pages)
+    responses = benchmark(decode)
+    assert sum(len(response["addresses"]) for response in responses) == \
+        conftest.PAGES * conftest.PAGE_SIZE
+
+
+@pytest.mark.skipif(six.PY3, reason="valve.vdf only supports Python 2")
+def test_vdf(benchmark, vdf_document):
+    benchmark.extra_info["bytes"] = len(vdf_document)
+    document = benchmark.pedantic(
+        valve.vdf.loads, (vdf_document,), rounds=3)
+    assert len(document["items_game"]["items"]) == conftest.VDF_ITEMS
+
+
+def test_rcon_messages(benchmark, cvarlist_stream):
+
+    def decode():
+        messages_ = []
+        buffer_ = cvarlist_stream
+        while buffer_:
+            message, buffer_ = valve.rcon.RCONMessage.decode(buffer_)
+            messages_.append(message)
+        return messages_
+
+    benchmark.extra_info["bytes"] = len(cvarlist_stream)
+    assert len(benchmark(decode)) > 2
+
+
+@pytest.mark.parametrize("chunk_size", [4096, 65536])
+def test_rcon_response(benchmark, cvarlist_stream, cvarlist_text,
+                       chunk_size):
+
+    def feed():
+        responses = valve.rcon._ResponseBuffer()
+        for start in range(0, len(cvarlist_stream), chunk_size):
+            responses.feed(cvarlist_stream[start:start + chunk_size])
+        return responses.pop()
+
+    benchmark.extra_info["bytes"] = len(cvarlist_stream)
+    assert benchmark(feed).text == cvarlist_text
+
+
+def test_cvarlist(benchmark, cvarlist_text):
+    rcon = valve.rcon.RCON(("127.0.0.1", 0), "")
+    response = valve.rcon.RCONMessage(
+        1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, cvarlist_text)
+    rcon.execute = lambda command: response
+    benchmark.extra_info["bytes"] = len(cvarlist_text)
+    convars = benchmark(lambda: list(rcon.cvarlist()))
+    assert len(convars) == conftest.CONVARS
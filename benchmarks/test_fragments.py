@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Benchmarks for split-packet reassembly.
+
+These use `pytest-benchmark <https://pypi.org/project/pytest-benchmark/>`_
+and can be ran with ``py.test benchmarks/``. The decoded size of each
+payload is recorded in the ``bytes`` extra info field so that throughput
+can be derived from the mean time.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import bz2
+import struct
+import zlib
+
+import pytest
+
+from valve.source import a2s
+from valve.source import messages
+
+
+MTU = 1248
+
+
+def _rules(count):
+    return (b"\xFF\xFF\xFF\xFF\x45" + struct.pack("<h", count) + b"".join(
+        "sv_rule_{0}\x00value {0}\x00".format(i).encode("ascii")
+        for i in range(count)))
+
+
+def _split(payload, message_id=1):
+    chunks = [payload[i:i + MTU] for i in range(0, len(payload), MTU)]
+    return [struct.pack("<llBBh", -2, message_id, len(chunks), i, MTU)
+            + chunk for i, chunk in enumerate(chunks)]
+
+
+def _split_compressed(payload):
+    return _split(
+        struct.pack("<lL", len(payload), zlib.crc32(payload) & 0xFFFFFFFF)
+        + bz2.compress(payload), message_id=-(1 << 31) | 1)
+
+
+def _reassemble_and_decode(datagrams):
+    fragments = a2s._FragmentBuffer()
+    for datagram in datagrams:
+        payload = fragments.feed(datagram)
+    return messages.RulesResponse.decode(payload)
+
+
+@pytest.mark.parametrize("count", [100, 1000, 5000])
+def test_rules_split(benchmark, count):
+    payload = _rules(count)
+    datagrams = _split(payload)
+    benchmark.extra_info["bytes"] = len(payload)
+    benchmark.extra_info["datagrams"] = len(datagrams)
+    rules = benchmark(_reassemble_and_decode, datagrams)
+    assert len(rules["rules"]) == count
+
+
+@pytest.mark.parametrize("count", [100, 1000, 5000])
+def test_rules_split_compressed(benchmark, count):
+    payload = _rules(count)
+    datagrams = _split_compressed(payload)
+    benchmark.extra_info["bytes"] = len(payload)
+    benchmark.extra_info["datagrams"] = len(datagrams)
+    rules = benchmark(_reassemble_and_decode, datagrams)
+    assert len(rules["rules"]) == count
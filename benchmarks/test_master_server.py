@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Decoding and deduplicating master server addresses.
+
+A million addresses, in pages of 231 as sent by the master server, are
+decoded and deduplicated both as packed integers, as done by
+:meth:`valve.source.master_server.MasterServerQuerier.find`, and as
+``(host, port)`` tuples as was done previously. The benchmark times the
+packed path. The time taken by the previous path and the memory retained
+by each set of unique addresses, as measured by :mod:`tracemalloc`, are
+recorded in the extra info fields.
+
+:func:`test_decode_page` compares decoding a single page in bulk, as
+done by :class:`valve.source.messages.MSAddressArrayField`, against
+unpacking each address in turn and decoding each as a record.
+
+Run with ``py.test benchmarks/test_master_server.py``.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import struct
+import sys
+import timeit
+
+import pytest
+
+from valve.source import messages
+
+tracemalloc = pytest.importorskip("tracemalloc")
+
+
+ADDRESSES = 1000000
+PAGE_SIZE = 231
+
+
+def _pages(count):
+    header = b"\xFF\xFF\xFF\xFF\x66\x0A"
+    addresses = [struct.pack(">IH", 0x0A000000 + index, 27015)
+                 for index in range(count)]
+    addresses.append(b"\x00" * 6)
+    return [header + b"".join(addresses[start:start + PAGE_SIZE])
+            for start in range(0, len(addresses), PAGE_SIZE)]
+
+
+def _tuples(pages):
+    # How addresses were decoded and deduplicated previously.
+    seen = set()
+    for page in pages:
+        response = messages.MasterServerResponse.decode(page)
+        for address in response["addresses"]:
+            if not address.is_null:
+                seen.add((address["host"], address["port"]))
+    return seen
+
+
+def _packed(pages):
+    seen = set()
+    for page in pages:
+        response = messages.MasterServerPackedResponse.decode(page)
+        seen.update(response["addresses"])
+    seen.discard(0)
+    return seen
+
+
+def _retained(function, pages):
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        seen = function(pages)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return seen, retained
+
+
+def test_per_million(benchmark):
+    pages = _pages(ADDRESSES)
+    packed, packed_bytes = _retained(_packed, pages)
+    tuples, tuple_bytes = _retained(_tuples, pages)
+    assert len(packed) == len(tuples) == ADDRESSES
+    del packed, tuples
+    tuple_seconds = timeit.timeit(lambda: _tuples(pages), number=1)
+    scale = 1000000 / ADDRESSES
+    benchmark.extra_info["addresses"] = ADDRESSES
+    benchmark.extra_info["bytes_per_million"] = packed_bytes * scale
+    benchmark.extra_info["tuple_bytes_per_million"] = tuple_bytes * scale
+    benchmark.extra_info["tuple_seconds_per_million"] = tuple_seconds * scale
+    print("\npacked: {:.1f} MB; tuples: {:.1f} MB, {:.2f}s".format(
+        packed_bytes * scale / 1e6, tuple_bytes * scale / 1e6,
+        tuple_seconds * scale), file=sys.stderr)
+    assert packed_bytes < tuple_bytes
+    benchmark.pedantic(_packed, (pages,), rounds=3)
+
+
+def _unpack_each(page):
+    # Decoding each address individually
+    return [host << 16 | port for host, port in
+            (struct.unpack_from(">IH", page, offset)
+             for offset in range(6, len(page), 6))]
+
+
+@pytest.mark.parametrize("decode", [
+    lambda page: messages.MasterServerPackedResponse.decode(
+        page)["addresses"],
+    _unpack_each,
+    lambda page: messages.MasterServerCompactResponse.decode(
+        page)["addresses"],
+    lambda page: messages.MasterServerResponse.decode(page)["addresses"],
+], ids=["bulk", "unpack", "records", "messages"])
+def test_decode_page(benchmark, decode):
+    page = _pages(PAGE_SIZE)[0]
+    assert len(benchmark(decode, page)) == PAGE_SIZE
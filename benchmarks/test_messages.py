@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Benchmarks for decoding messages.
+
+Each message is decoded both with its compiled decoder, as used by
+:meth:`valve.source.messages.Message.decode`, and field-by-field as was
+done previously. Run with ``py.test benchmarks/test_messages.py``.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import struct
+
+import pytest
+
+from valve.source import messages
+
+
+INFO_RESPONSE = messages.InfoResponse(
+    response_type=0x49,
+    protocol=17,
+    server_name="A Team Fortress 2 Server | 24/7 2Fort",
+    map="ctf_2fort",
+    folder="tf",
+    game="Team Fortress",
+    app_id=440,
+    player_count=20,
+    max_players=24,
+    bot_count=0,
+    server_type=100,
+    platform=108,
+    password_protected=0,
+    vac_enabled=1,
+    version="4630212",
+).encode()
+
+FRAGMENT = messages.Fragment(
+    message_id=1, fragment_count=2, fragment_id=0, mtu=1248).encode()
+
+
+def _field_by_field(message, packet):
+    values, buffer = messages._decode_fields(message.fields, packet)
+    return message(buffer, **values)
+
+
+@pytest.mark.parametrize("decode", ["compiled", "fields"])
+@pytest.mark.parametrize("message,packet", [
+    (messages.InfoResponse, INFO_RESPONSE),
+    (messages.Fragment, FRAGMENT),
+], ids=["info", "fragment"])
+def test_decode(benchmark, decode, message, packet):
+    if decode == "compiled":
+        decoded = benchmark(message.decode, packet)
+    else:
+        decoded = benchmark(_field_by_field, message, packet)
+    assert decoded.values == message.decode(packet).values
+
+
+def _decode_sliced(message, buffer):
+    # Decoding as it was done before offsets, where the payload of every
+    # element of an array was a copy of the rest of the buffer. This is
+    # quadratic in the size of the buffer.
+    values = {}
+    for field in message.fields:
+        if isinstance(field, messages.MessageArrayField):
+            entries = []
+            for _ in range(field.count(values)):
+                entry = field.element.decode(buffer)
+                buffer = entry.payload
+                entries.append(entry)
+            values[field.name] = entries
+        else:
+            values[field.name], buffer = field.decode(buffer, values)
+    return values, buffer
+
+
+def _players(count):
+    return messages.PlayersResponse(
+        response_type=0x44,
+        player_count=count,
+        players=[messages.PlayerEntry(index=i % 256,
+                                      name="Player {}".format(i),
+                                      score=i, duration=60.0)
+                 for i in range(count)],
+    ).encode()
+
+
+def _rules(count):
+    return (b"\x45" + struct.pack("<h", count) + b"".join(
+        "sv_rule_{0}\x00value {0}\x00".format(i).encode("ascii")
+        for i in range(count)))
+
+
+@pytest.mark.parametrize("decode", ["offsets", "sliced"])
+@pytest.mark.parametrize("message,packet", [
+    (messages.PlayersResponse, _players(64)),
+    (messages.PlayersResponse, _players(255)),
+    (messages.RulesResponse, _rules(1000)),
+    (messages.RulesResponse, _rules(5000)),
+    (messages.RulesResponse, _rules(20000)),
+], ids=["players-64", "players-255",
+        "rules-1000", "rules-5000", "rules-20000"])
+def test_decode_large(benchmark, decode, message, packet):
+    """Decode large packets.
+
+    The ``ns_per_byte`` extra info field is the mean time to decode each
+    byte of the packet. When decoding from offsets this remains constant
+    as the packet grows, whereas slicing grows linearly with its size.
+    """
+    benchmark.extra_info["bytes"] = len(packet)
+    if decode == "offsets":
+        values = benchmark(message.decode, packet).values
+    else:
+        values, _ = benchmark(_decode_sliced, message, packet)
+    assert len(values[message.fields[-1].name]) == \
+        values[message.fields[1].name]
+    # No stats are collected when run with --benchmark-disable
+    stats = getattr(benchmark, "stats", None)
+    if stats is not None:
+        benchmark.extra_info["ns_per_byte"] = (
+            stats.stats.mean * 1e9 / len(packet))
+
+
+def _poll(packet, lazy):
+    info = messages.InfoResponse.decode(packet, lazy=lazy)
+    return info["player_count"], info["max_players"], info["map"]
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["eager", "lazy"])
+def test_decode_info_few_fields(benchmark, lazy):
+    """Decode an info response, accessing only a few of its fields."""
+    assert benchmark(_poll, INFO_RESPONSE, lazy) == (20, 24, "ctf_2fort")
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Benchmarks for the query paths against local stand-in servers.
+
+These run :meth:`valve.source.master_server.MasterServerQuerier.find` and
+:class:`valve.source.multiplex.MultiplexQuerier` end-to-end against the
+fake servers from :mod:`valve.testing`, so they include the cost of the
+sockets but not of a real network. The number of addresses found or
+servers queried is recorded in the ``servers`` extra info field.
+
+Run with ``py.test benchmarks/test_queries.py``.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import pytest
+
+import valve.testing
+from valve.source import master_server
+from valve.source import multiplex
+from valve.source import pipeline
+
+import conftest
+
+
+FLEET_SIZE = 500
+
+
+@pytest.yield_fixture(scope="module")
+def querier():
+    # Created before the fleet so that its sockets' file descriptors are
+    # low enough to be used with select(). The fleet answers every
+    # request at once, so the responses are spread over a few sockets
+    # to avoid overflowing their receive buffers.
+    querier = multiplex.MultiplexQuerier(timeout=1.0, sockets=4)
+    yield querier
+    querier.close()
+
+
+@pytest.yield_fixture(scope="module")
+def fleet(querier):
+    with valve.testing.FakeA2SFleet(FLEET_SIZE, players=32) as fleet:
+        yield fleet
+
+
+@pytest.yield_fixture(scope="module")
+def master():
+    # Addresses are never queried, so they needn't be real servers
+    addresses = [("10.0.{}.{}".format(index // 256, index % 256), 27015)
+                 for index in range(conftest.PAGES * conftest.PAGE_SIZE)]
+    with valve.testing.FakeMasterServer(
+            {master_server.REGION_EUROPE: addresses}) as master:
+        yield master
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_find(benchmark, master, packed):
+    with master_server.MasterServerQuerier(
+            master.address, rate_limit=False) as msq:
+        addresses = benchmark(
+            lambda: list(msq.find(region="eu", packed=packed)))
+    benchmark.extra_info["servers"] = len(addresses)
+    assert len(addresses) == conftest.PAGES * conftest.PAGE_SIZE
+
+
+@pytest.mark.parametrize("request_", ["info", "players", "rules"])
+def test_multiplex(benchmark, querier, fleet, request_):
+    results = benchmark(
+        lambda: list(querier.query(fleet.addresses, request_)))
+    benchmark.extra_info["servers"] = len(results)
+    assert all(result.ok for result in results)
+
+
+def test_discover(benchmark, querier, fleet):
+    with valve.testing.FakeMasterServer(
+            {master_server.REGION_EUROPE: fleet.addresses}) as master:
+        with master_server.MasterServerQuerier(
+                master.address, rate_limit=False) as msq:
+            results = benchmark(lambda: list(pipeline.discover(
+                msq, region="eu", querier=querier)))
+    benchmark.extra_info["servers"] = len(results)
+    assert all(result.ok for result in results)
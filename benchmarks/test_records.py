@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Memory footprint of decoded message arrays.
+
+This decodes 100,000 player entries and master server addresses both as
+:class:`valve.source.messages.Message` instances and as compact
+:class:`valve.source.messages.Record`\\ s. The memory retained by the
+decoded elements, as measured by :mod:`tracemalloc`, is recorded in the
+``bytes_per_record`` extra info fields. The benchmark itself times the
+compact decoding.
+
+Run with ``py.test benchmarks/test_records.py``.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import struct
+import sys
+
+import pytest
+
+from valve.source import messages
+
+tracemalloc = pytest.importorskip("tracemalloc")
+
+
+RECORDS = 100000
+
+
+def _players(count):
+    return b"".join(struct.pack("<B", index % 256)
+                    + "player {}\x00".format(index).encode("ascii")
+                    + struct.pack("<lf", index, index / 10.0)
+                    for index in range(count))
+
+
+def _addresses(count):
+    return b"".join(struct.pack(">IH", 0x0A000000 + index, 27015)
+                    for index in range(count))
+
+
+def _retained(decode):
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        elements = decode()
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return elements, retained
+
+
+@pytest.mark.parametrize(("element", "encode"), [
+    (messages.PlayerEntry, _players),
+    (messages.MSAddressEntry, _addresses),
+], ids=["players", "addresses"])
+def test_bytes_per_record(benchmark, element, encode):
+    buffer = encode(RECORDS)
+    array = messages.MessageArrayField("", element, RECORDS)
+    compact = messages.MessageArrayField("", element, RECORDS, compact=True)
+    full, full_bytes = _retained(lambda: array.decode_from(buffer, 0)[0])
+    records, record_bytes = _retained(
+        lambda: compact.decode_from(buffer, 0)[0])
+    assert records == full
+    del full
+    benchmark.extra_info["records"] = RECORDS
+    benchmark.extra_info["bytes_per_record"] = record_bytes / RECORDS
+    benchmark.extra_info["message_bytes_per_record"] = full_bytes / RECORDS
+    print("\n{}: {:.1f} bytes per record, {:.1f} per message".format(
+        element.__name__, record_bytes / RECORDS,
+        full_bytes / RECORDS), file=sys.stderr)
+    assert record_bytes < full_bytes
+    benchmark(compact.decode_from, buffer, 0)
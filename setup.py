@@ -49,6 +49,10 @@ setuptools.setup(
             "pytest-cov",
             "pytest-timeout",
         ],
+        "benchmark": [
+            "pytest>=3.6.0",
+            "pytest-benchmark",
+        ],
         "docs": [
             "sphinx",
             "sphinx_rtd_theme",
@@ -3,6 +3,9 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import select
+import socket
+import sys
 import threading
 
 try:
@@ -16,6 +19,12 @@ import valve.source.master_server
 import valve.testing
 
 
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append("test_a2s_async.py")
+    collect_ignore.append("test_rcon_async.py")
+
+
 def srcds_functional(**filter_):
     """Enable SRCDS functional testing for a test case
 
@@ -104,8 +113,63 @@ def pytest_configure():
 @pytest.yield_fixture
 def rcon_server():
     server = valve.testing.TestRCONServer()
-    thread = threading.Thread(target=server.serve_forever)
+    # Connections are handled by their own threads, so the server only
+    # needs to poll briefly for shutdown between accepting them.
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01})
     thread.start()
     yield server
     server.shutdown()
     thread.join()
+
+
+class A2SServer(object):
+    """Local UDP server which answers requests using a handler.
+
+    The handler is called with each raw request datagram and should
+    return a list of raw datagrams to send back in response.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self.address = self._socket.getsockname()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._socket], [], [], 0.01)
+            if not ready:
+                continue
+            request, client = self._socket.recvfrom(65536)
+            self.requests.append(request)
+            for response in self.handler(request):
+                self._socket.sendto(response, client)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._socket.close()
+
+
+@pytest.fixture(autouse=True)
+def challenge_cache():
+    valve.source.a2s.challenge_cache.clear()
+    return valve.source.a2s.challenge_cache
+
+
+@pytest.yield_fixture
+def a2s_server():
+    servers = []
+
+    def factory(handler):
+        servers.append(A2SServer(handler))
+        return servers[-1]
+
+    yield factory
+    for server in servers:
+        server.close()
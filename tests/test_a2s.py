@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import bz2
+import struct
+import zlib
+
+try:
+    import mock
+except ImportError:
+    import unittest.mock as mock
+import pytest
+
+from valve.source import a2s
+from valve.source import messages
+
+
+def _challenge(number):
+    return b"\xFF\xFF\xFF\xFF" + messages.GetChallengeResponse(
+        response_type=0x41, challenge=number).encode()
+
+
+def _players_handler(challenges):
+    """Handler which issues challenges in the given order.
+
+    A new challenge is only issued when the request's challenge doesn't
+    match the current one.
+    """
+    current = [challenges.pop(0)]
+
+    def handler(request):
+        challenge = struct.unpack("<l", request[5:9])[0]
+        if challenge != current[0]:
+            if challenge != -1 and challenges:
+                current[0] = challenges.pop(0)
+            return [_challenge(current[0])]
+        return [b"\xFF\xFF\xFF\xFF\x44\x01\x00foo\x00"
+                b"\x05\x00\x00\x00\x00\x00\x80\x3F"]
+
+    return handler
+
+
+def _rechallenge_handler(request):
+    """Handler which responds to every request with a new challenge."""
+    return [_challenge(struct.unpack("<l", request[5:9])[0] + 1)]
+
+
+class TestChallengeCache(object):
+
+    @pytest.fixture
+    def monotonic(self, monkeypatch):
+        monotonic = mock.Mock(return_value=100.0)
+        monkeypatch.setattr(a2s.monotonic, "monotonic", monotonic)
+        return monotonic
+
+    def test_get_missing(self):
+        assert a2s.ChallengeCache().get(("192.0.2.0", 27015)) is None
+
+    def test_set_get(self):
+        cache = a2s.ChallengeCache()
+        cache.set(("192.0.2.0", 27015), 1234)
+        assert cache.get(("192.0.2.0", 27015)) == 1234
+        assert cache.get(["192.0.2.0", 27015]) == 1234
+        assert cache.get(("192.0.2.0", 27016)) is None
+
+    def test_replace(self):
+        cache = a2s.ChallengeCache()
+        cache.set(("192.0.2.0", 27015), 1234)
+        cache.set(("192.0.2.0", 27015), 5678)
+        assert cache.get(("192.0.2.0", 27015)) == 5678
+
+    def test_expire(self, monotonic):
+        cache = a2s.ChallengeCache(ttl=10.0)
+        cache.set(("192.0.2.0", 27015), 1234)
+        monotonic.return_value = 109.0
+        assert cache.get(("192.0.2.0", 27015)) == 1234
+        monotonic.return_value = 110.0
+        assert cache.get(("192.0.2.0", 27015)) is None
+        assert not len(cache)
+
+    def test_prune(self, monotonic):
+        cache = a2s.ChallengeCache(ttl=10.0)
+        cache.set(("192.0.2.0", 27015), 1234)
+        monotonic.return_value = 111.0
+        cache.set(("192.0.2.1", 27015), 5678)
+        assert len(cache) == 1
+        assert cache.get(("192.0.2.1", 27015)) == 5678
+
+    def test_invalidate(self):
+        cache = a2s.ChallengeCache()
+        cache.set(("192.0.2.0", 27015), 1234)
+        cache.invalidate(("192.0.2.0", 27015))
+        cache.invalidate(("192.0.2.0", 27015))
+        assert cache.get(("192.0.2.0", 27015)) is None
+
+    def test_invalidate_challenge(self):
+        cache = a2s.ChallengeCache()
+        cache.set(("192.0.2.0", 27015), 1234)
+        cache.invalidate(("192.0.2.0", 27015), 5678)
+        assert cache.get(("192.0.2.0", 27015)) == 1234
+        cache.invalidate(("192.0.2.0", 27015), 1234)
+        assert cache.get(("192.0.2.0", 27015)) is None
+
+    def test_clear(self):
+        cache = a2s.ChallengeCache()
+        cache.set(("192.0.2.0", 27015), 1234)
+        cache.clear()
+        assert not len(cache)
+
+
+class TestServerQuerierChallenges(object):
+
+    def test_shared_by_default(self):
+        with a2s.ServerQuerier(("192.0.2.0", 27015)) as querier:
+            assert querier.challenges is a2s.challenge_cache
+
+    def test_cached(self, a2s_server, challenge_cache):
+        server = a2s_server(_players_handler([1234]))
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            assert querier.players()["players"][0]["name"] == "foo"
+            assert len(server.requests) == 2
+            assert challenge_cache.get(server.address) == 1234
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            assert querier.players()["players"][0]["name"] == "foo"
+            assert len(server.requests) == 3
+
+    def test_stale(self, a2s_server, challenge_cache):
+        server = a2s_server(_players_handler([5678]))
+        challenge_cache.set(server.address, 1234)
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            assert querier.players()["players"][0]["name"] == "foo"
+        assert len(server.requests) == 2
+        assert challenge_cache.get(server.address) == 5678
+
+    def test_stale_ignored(self, a2s_server, challenge_cache):
+        handler = _players_handler([5678])
+
+        def ignore_stale(request):
+            if struct.unpack("<l", request[5:9])[0] == 1234:
+                return []
+            return handler(request)
+
+        server = a2s_server(ignore_stale)
+        challenge_cache.set(server.address, 1234)
+        with a2s.ServerQuerier(server.address, timeout=0.2) as querier:
+            with pytest.raises(a2s.valve.source.NoResponseError):
+                querier.players()
+            assert challenge_cache.get(server.address) is None
+            assert querier.players()["players"][0]["name"] == "foo"
+        assert len(server.requests) == 3
+        assert challenge_cache.get(server.address) == 5678
+
+    @pytest.mark.parametrize("query", ["players", "rules"])
+    def test_rechallenged(self, a2s_server, query):
+        server = a2s_server(_rechallenge_handler)
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            with pytest.raises(messages.BrokenMessageError):
+                getattr(querier, query)()
+        # -1 and each of the two challenges accepted
+        assert len(server.requests) == 3
+
+    def test_rechallenged_cached(self, a2s_server, challenge_cache):
+        server = a2s_server(_rechallenge_handler)
+        challenge_cache.set(server.address, 1234)
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            with pytest.raises(messages.BrokenMessageError):
+                querier.players()
+        # The stale challenge then one fresh re-challenge
+        assert [struct.unpack("<l", request[5:9])[0]
+                for request in server.requests] == [1234, 1235, 1236]
+        assert challenge_cache.get(server.address) is None
+
+    def test_private_cache(self, a2s_server, challenge_cache):
+        server = a2s_server(_players_handler([1234, 5678]))
+        cache = a2s.ChallengeCache()
+        with a2s.ServerQuerier(server.address, 1.0, cache) as querier:
+            querier.players()
+            assert cache.get(server.address) == 1234
+            querier.players()
+            assert cache.get(server.address) == 1234
+            assert len(server.requests) == 3
+        assert challenge_cache.get(server.address) is None
+
+
+def _snapshot_handler(challenge, answer=("info", "players", "rules")):
+    """Handler which answers the A2S requests given by ``answer``."""
+
+    def handler(request):
+        request_type = request[4:5]
+        if request_type == b"\x54":
+            if "info" in answer:
+                return [b"\xFF\xFF\xFF\xFF" + messages.InfoResponse(
+                    response_type=0x49, protocol=17, server_name="Snapshot",
+                    map="ctf_2fort", folder="tf", game="Team Fortress",
+                    app_id=440, player_count=1, max_players=24, bot_count=0,
+                    server_type=100, platform=108, password_protected=0,
+                    vac_enabled=1, version="1.0").encode()]
+            return []
+        if struct.unpack("<l", request[5:9])[0] != challenge:
+            return [_challenge(challenge)]
+        if request_type == b"\x55" and "players" in answer:
+            return [b"\xFF\xFF\xFF\xFF\x44\x01\x00foo\x00"
+                    b"\x05\x00\x00\x00\x00\x00\x80\x3F"]
+        if request_type == b"\x56" and "rules" in answer:
+            return [b"\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF"
+                    b"\x45\x01\x00sv_gravity\x00800\x00"]
+        return []
+
+    return handler
+
+
+class TestServerQuerierInfo(object):
+
+    @pytest.mark.parametrize("lazy", [False, True])
+    def test_info(self, a2s_server, lazy):
+        server = a2s_server(_snapshot_handler(1))
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            info = querier.info(lazy=lazy)
+        assert isinstance(info.values, messages.LazyValues) is lazy
+        assert info["server_name"] == "Snapshot"
+        assert info["max_players"] == 24
+
+
+class TestSnapshot(object):
+
+    def test(self, a2s_server):
+        server = a2s_server(_snapshot_handler(1234))
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            snapshot = querier.snapshot()
+        assert snapshot.complete
+        assert not snapshot.errors
+        assert snapshot.address == server.address
+        assert snapshot.info["server_name"] == "Snapshot"
+        assert snapshot.players["players"][0]["name"] == "foo"
+        assert snapshot.rules["rules"] == {"sv_gravity": "800"}
+        assert set(snapshot.timings) == {"info", "players", "rules"}
+        # Info, players and rules with -1 followed by players and
+        # rules with the challenge; only one challenge is needed.
+        assert len(server.requests) == 5
+        assert [request[4:5] for request in server.requests[:3]] == \
+            [b"\x54", b"\x55", b"\x56"]
+
+    def test_cached_challenge(self, a2s_server, challenge_cache):
+        server = a2s_server(_snapshot_handler(1234))
+        challenge_cache.set(server.address, 1234)
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            assert querier.snapshot().complete
+        assert len(server.requests) == 3
+
+    def test_stale_challenge_ignored(self, a2s_server, challenge_cache):
+        handler = _snapshot_handler(1234)
+
+        def ignore_stale(request):
+            if request[4:5] != b"\x54" \
+                    and struct.unpack("<l", request[5:9])[0] == 5678:
+                return []
+            return handler(request)
+
+        server = a2s_server(ignore_stale)
+        challenge_cache.set(server.address, 5678)
+        with a2s.ServerQuerier(server.address, timeout=0.2) as querier:
+            snapshot = querier.snapshot()
+            assert set(snapshot.errors) == {"players", "rules"}
+            assert challenge_cache.get(server.address) is None
+            assert querier.snapshot().complete
+        assert challenge_cache.get(server.address) == 1234
+
+    def test_rechallenged(self, a2s_server, challenge_cache):
+        info = _snapshot_handler(1234, ("info",))
+
+        def rechallenge(request):
+            if request[4:5] == b"\x54":
+                return info(request)
+            return _rechallenge_handler(request)
+
+        server = a2s_server(rechallenge)
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            snapshot = querier.snapshot()
+        assert snapshot.info is not None
+        for section in ("players", "rules"):
+            assert isinstance(snapshot.errors[section],
+                              messages.BrokenMessageError)
+        # Info, players and rules then each of the two challenges
+        assert len(server.requests) == 7
+        assert challenge_cache.get(server.address) is None
+
+    def test_partial(self, a2s_server):
+        server = a2s_server(_snapshot_handler(1234, ("info", "players")))
+        with a2s.ServerQuerier(server.address, timeout=0.2) as querier:
+            snapshot = querier.snapshot()
+        assert not snapshot.complete
+        assert snapshot.info is not None
+        assert snapshot.players is not None
+        assert snapshot.rules is None
+        assert set(snapshot.timings) == {"info", "players"}
+        assert isinstance(snapshot.errors["rules"],
+                          a2s.valve.source.NoResponseError)
+
+    def test_interleaved_fragments(self):
+        fragments = a2s._FragmentBuffer()
+        first = [struct.pack("<lLBBh", -2, 1, 2, i, 4) + chunk
+                 for i, chunk in enumerate([b"\x49ab", b"cd"])]
+        second = [struct.pack("<lLBBh", -2, 2, 2, i, 4) + chunk
+                  for i, chunk in enumerate([b"\x44ef", b"gh"])]
+        assert fragments.feed(first[0]) is None
+        assert fragments.feed(second[1]) is None
+        assert fragments.feed(b"\xFF\xFF\xFF\xFF\x41") == b"\x41"
+        assert fragments.feed(second[0]) == b"\x44efgh"
+        assert fragments.feed(first[1]) == b"\x49abcd"
+
+
+def _compressed_fragments(payload, size=64,
+                          crc32=None, decompressed_size=None):
+    """Split a payload into bz2-compressed fragments."""
+    if crc32 is None:
+        crc32 = zlib.crc32(payload) & 0xFFFFFFFF
+    if decompressed_size is None:
+        decompressed_size = len(payload)
+    compressed = struct.pack(
+        "<lL", decompressed_size, crc32) + bz2.compress(payload)
+    chunks = [compressed[i:i + size]
+              for i in range(0, len(compressed), size)]
+    return [struct.pack("<llBBh", -2, -(1 << 31) | 7, len(chunks), i, size)
+            + chunk for i, chunk in enumerate(chunks)]
+
+
+class TestFragmentBuffer(object):
+
+    RULES = (b"\xFF\xFF\xFF\xFF\x45\xE8\x03" + b"".join(
+        "rule_{0}\x00{0}\x00".format(i).encode("ascii")
+        for i in range(1000)))
+
+    def test_not_split(self):
+        assert a2s._FragmentBuffer().feed(
+            b"\xFF\xFF\xFF\xFF\x49foo") == b"\x49foo"
+
+    def test_split_header(self):
+        fragments = a2s._FragmentBuffer()
+        assert fragments.feed(
+            struct.pack("<lLBBh", -2, 1, 2, 1, 4) + b"bar") is None
+        assert fragments.feed(struct.pack("<lLBBh", -2, 1, 2, 0, 4)
+                              + b"\xFF\xFF\xFF\xFF\x49foo") == b"\x49foobar"
+
+    def test_compressed(self):
+        fragments = a2s._FragmentBuffer()
+        datagrams = _compressed_fragments(self.RULES)
+        assert len(datagrams) > 2
+        # Out of order
+        for datagram in datagrams[:0:-1]:
+            assert fragments.feed(datagram) is None
+        payload = fragments.feed(datagrams[0])
+        rules = messages.RulesResponse.decode(payload)
+        assert rules["rule_count"] == 1000
+        assert rules["rules"]["rule_999"] == "999"
+
+    def test_compressed_bad_crc(self):
+        fragments = a2s._FragmentBuffer()
+        datagrams = _compressed_fragments(self.RULES, crc32=1234)
+        for datagram in datagrams[:-1]:
+            fragments.feed(datagram)
+        with pytest.raises(messages.BrokenMessageError):
+            fragments.feed(datagrams[-1])
+
+    def test_compressed_bad_size(self):
+        fragments = a2s._FragmentBuffer()
+        datagrams = _compressed_fragments(
+            self.RULES, decompressed_size=len(self.RULES) + 1)
+        for datagram in datagrams[:-1]:
+            fragments.feed(datagram)
+        with pytest.raises(messages.BrokenMessageError):
+            fragments.feed(datagrams[-1])
+
+    def test_compressed_bomb(self, monkeypatch):
+        decompressor = bz2.BZ2Decompressor()
+        decompress = mock.Mock(wraps=decompressor.decompress)
+        monkeypatch.setattr(a2s.bz2, "BZ2Decompressor", mock.Mock(
+            return_value=mock.Mock(decompress=decompress)))
+        fragments = a2s._FragmentBuffer()
+        # 16 MiB of zeros compresses to a single small fragment
+        datagrams = _compressed_fragments(
+            b"\x00" * (16 * 1024 * 1024), size=1024, decompressed_size=100)
+        assert len(datagrams) == 1
+        with pytest.raises(messages.BrokenMessageError):
+            fragments.feed(datagrams[0])
+        if a2s._BZ2_MAX_LENGTH:
+            assert decompress.call_args[1] == {"max_length": 101}
+
+    def test_compressed_corrupt(self):
+        fragments = a2s._FragmentBuffer()
+        datagrams = _compressed_fragments(self.RULES)
+        datagrams[1] = datagrams[1][:12] + b"\x00" * len(datagrams[1][12:])
+        for datagram in datagrams[:-1]:
+            fragments.feed(datagram)
+        with pytest.raises(messages.BrokenMessageError):
+            fragments.feed(datagrams[-1])
+
+    def test_compressed_rules(self, a2s_server):
+
+        def handler(request):
+            if struct.unpack("<l", request[5:9])[0] == -1:
+                return [_challenge(1)]
+            return _compressed_fragments(self.RULES, 1248)
+
+        server = a2s_server(handler)
+        with a2s.ServerQuerier(server.address, timeout=1.0) as querier:
+            rules = querier.rules()
+        assert len(rules["rules"]) == 1000
+
+    def _receive(self, pool, datagram):
+        space = pool.reserve()
+        space[:len(datagram)] = datagram
+        return pool.claim(len(datagram))
+
+    def test_pooled_released(self):
+        pool = a2s._BufferPool()
+        fragments = a2s._FragmentBuffer(pool)
+        datagram = b"\xFF\xFF\xFF\xFF\x49foo"
+        view, slab = self._receive(pool, datagram)
+        assert fragments.feed(view, slab) == b"\x49foo"
+        assert slab.references == 0
+        assert slab.offset == 0
+
+    def test_pooled_split(self):
+        pool = a2s._BufferPool()
+        fragments = a2s._FragmentBuffer(pool)
+        first = self._receive(
+            pool, struct.pack("<lLBBh", -2, 1, 2, 1, 4) + b"bar")
+        assert fragments.feed(*first) is None
+        assert first[1].references == 1
+        second = self._receive(pool, struct.pack("<lLBBh", -2, 1, 2, 0, 4)
+                               + b"\xFF\xFF\xFF\xFF\x49foo")
+        assert second[1] is first[1]
+        payload = fragments.feed(*second)
+        assert payload == b"\x49foobar"
+        assert isinstance(payload, bytes)
+        assert first[1].references == 0
+
+    def test_pooled_broken(self):
+        pool = a2s._BufferPool()
+        fragments = a2s._FragmentBuffer(pool)
+        view, slab = self._receive(pool, b"\x00\x00\x00\x00")
+        with pytest.raises(messages.BrokenMessageError):
+            fragments.feed(view, slab)
+        assert slab.references == 0
+
+    def test_pooled_clear(self):
+        pool = a2s._BufferPool()
+        fragments = a2s._FragmentBuffer(pool)
+        view, slab = self._receive(
+            pool, struct.pack("<lLBBh", -2, 1, 2, 1, 4) + b"bar")
+        fragments.feed(view, slab)
+        fragments.clear()
+        assert slab.references == 0
+
+
+class TestBufferPool(object):
+
+    def test_reuse(self):
+        pool = a2s._BufferPool()
+        space = pool.reserve()
+        assert len(space) >= pool.datagram_size
+        view, slab = pool.claim(10)
+        pool.release(slab)
+        assert pool.reserve().obj is slab.buffer
+        assert slab.offset == 0
+
+    def test_held(self):
+        pool = a2s._BufferPool(slab_size=16, datagram_size=8)
+        pool.reserve()[:4] = b"abcd"
+        view, first = pool.claim(4)
+        pool.reserve()
+        _, second = pool.claim(8)
+        assert second is first
+        # Not enough space left in the first slab for another datagram
+        pool.reserve()
+        _, third = pool.claim(8)
+        assert third is not first
+        assert view.tobytes() == b"abcd"
+        pool.release(first)
+        assert first.references == 1
+        pool.release(second)
+        assert first.references == 0
+        # The first slab is recycled once the current one is full
+        pool.reserve()
+        _, fourth = pool.claim(8)
+        assert fourth is third
+        pool.reserve()
+        assert pool._current is first
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError):
+            a2s._BufferPool(slab_size=8, datagram_size=16)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import asyncio
+import struct
+
+import pytest
+
+import valve.source
+from valve.source import a2s_async
+from valve.source import messages
+
+
+def _info(server_name):
+    return b"\xFF\xFF\xFF\xFF" + messages.InfoResponse(
+        response_type=0x49,
+        protocol=17,
+        server_name=server_name,
+        map="ctf_2fort",
+        folder="tf",
+        game="Team Fortress",
+        app_id=440,
+        player_count=1,
+        max_players=24,
+        bot_count=0,
+        server_type=100,
+        platform=108,
+        password_protected=0,
+        vac_enabled=1,
+        version="1.0",
+    ).encode()
+
+
+def _rules_handler(request):
+    challenge = struct.unpack("<l", request[5:9])[0]
+    if challenge == -1:
+        return [b"\xFF\xFF\xFF\xFF" + messages.GetChallengeResponse(
+            response_type=0x41, challenge=99).encode()]
+    return [b"\xFF\xFF\xFF\xFF\x45\x01\x00sv_gravity\x00800\x00"]
+
+
+@pytest.yield_fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+class TestAsyncServerQuerier(object):
+
+    def test_info(self, loop, a2s_server):
+        server = a2s_server(lambda request: [_info("Async")])
+
+        async def test():
+            async with a2s_async.AsyncServerQuerier(server.address) as query:
+                return await query.info()
+
+        info = loop.run_until_complete(test())
+        assert info["server_name"] == "Async"
+
+    def test_rules(self, loop, a2s_server):
+        server = a2s_server(_rules_handler)
+
+        async def test():
+            async with a2s_async.AsyncServerQuerier(server.address) as query:
+                return await query.rules()
+
+        rules = loop.run_until_complete(test())
+        assert rules["rules"] == {"sv_gravity": "800"}
+        assert len(server.requests) == 2
+
+    def test_ping(self, loop, a2s_server):
+        server = a2s_server(lambda request: [_info("Async")])
+
+        async def test():
+            async with a2s_async.AsyncServerQuerier(server.address) as query:
+                return await query.ping()
+
+        assert loop.run_until_complete(test()) >= 0
+
+    def test_timeout(self, loop, a2s_server):
+        server = a2s_server(lambda request: [])
+
+        async def test():
+            async with a2s_async.AsyncServerQuerier(
+                    server.address, timeout=0.1) as query:
+                return await query.info()
+
+        with pytest.raises(valve.source.NoResponseError):
+            loop.run_until_complete(test())
+
+    def test_stale_challenge(self, loop, a2s_server, challenge_cache):
+
+        def ignore_stale(request):
+            if struct.unpack("<l", request[5:9])[0] == 1234:
+                return []
+            return _rules_handler(request)
+
+        server = a2s_server(ignore_stale)
+        challenge_cache.set(server.address, 1234)
+
+        async def test():
+            async with a2s_async.AsyncServerQuerier(
+                    server.address, timeout=0.2) as query:
+                with pytest.raises(valve.source.NoResponseError):
+                    await query.rules()
+                assert challenge_cache.get(server.address) is None
+                return await query.rules()
+
+        rules = loop.run_until_complete(test())
+        assert rules["rules"] == {"sv_gravity": "800"}
+        assert challenge_cache.get(server.address) == 99
+
+    def test_rechallenged(self, loop, a2s_server):
+        server = a2s_server(lambda request: [
+            b"\xFF\xFF\xFF\xFF" + messages.GetChallengeResponse(
+                response_type=0x41,
+                challenge=struct.unpack("<l", request[5:9])[0] + 1).encode()])
+
+        async def test():
+            async with a2s_async.AsyncServerQuerier(
+                    server.address, timeout=1.0) as query:
+                return await query.rules()
+
+        with pytest.raises(messages.BrokenMessageError):
+            loop.run_until_complete(test())
+        assert len(server.requests) == 3
+
+    def test_closed(self, loop):
+        querier = a2s_async.AsyncServerQuerier(("127.0.0.1", 27015))
+        querier.close()
+        with pytest.raises(valve.source.QuerierClosedError):
+            loop.run_until_complete(querier.info())
+
+
+class TestQuery(object):
+
+    def test(self, loop, a2s_server):
+        servers = [a2s_server(lambda request, i=i: [_info(str(i))])
+                   for i in range(5)]
+        silent = a2s_server(lambda request: [])
+        addresses = [server.address for server in servers]
+        results = loop.run_until_complete(a2s_async.query(
+            addresses + [silent.address], concurrency=2, timeout=0.2))
+        assert [result.response["server_name"]
+                for result in results[:-1]] == ["0", "1", "2", "3", "4"]
+        assert all(result.ok for result in results[:-1])
+        assert isinstance(results[-1].error, valve.source.NoResponseError)
+
+    def test_invalid_request(self, loop):
+        with pytest.raises(ValueError):
+            loop.run_until_complete(a2s_async.query([], "foo"))
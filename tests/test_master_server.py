@@ -4,11 +4,18 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import os
+import socket
+import struct
+import threading
+import time
+
 try:
     import mock
 except ImportError:
     import unittest.mock as mock
 import pytest
+import six
 
 import valve.source
 from valve.source import a2s
@@ -251,7 +258,7 @@ class TestQuery(object):
             master_server.MasterServerQuerier, "request", mock.Mock())
         monkeypatch.setattr(
             master_server.MasterServerQuerier, "get_response", mock.Mock())
-        return master_server.MasterServerQuerier()
+        return master_server.MasterServerQuerier(rate_limit=False)
 
     @pytest.fixture
     def request_(self, monkeypatch):
@@ -267,7 +274,7 @@ class TestQuery(object):
             return responses.pop(0)
 
         monkeypatch.setattr(
-            messages.MasterServerResponse,
+            messages.MasterServerPackedResponse,
             "decode",
             mock_decode)
 
@@ -277,10 +284,9 @@ class TestQuery(object):
                           "start_port": b"26122",
                           "start_host": "255.255.255.255"}
                 for address in batch:
-                    fields["addresses"].append(
-                        messages.MSAddressEntry(host=address[0],
-                                                port=address[1]))
-                responses.append(messages.MasterServerResponse(**fields))
+                    fields["addresses"].append(util.pack_address(*address))
+                responses.append(
+                    messages.MasterServerPackedResponse(**fields))
 
         return add_response
 
@@ -382,3 +388,513 @@ class TestQuery(object):
         ])
         # `find` invokes `query` once for every region; so only one region
         assert list(msq.find(region="eu", duplicates=method)) == addresses
+
+    def test_retry_same_page(self, msq, request_, response):
+        msq.retries = 1
+        response([("192.0.2.1", 27015)], [("0.0.0.0", 0)])
+        msq.get_response.side_effect = [
+            b"", valve.source.NoResponseError, b""]
+        addresses = list(msq._query(master_server.REGION_REST, ""))
+        assert addresses == [("192.0.2.1", 27015)]
+        assert msq.request.call_count == 3
+        assert request_.call_args[1]["address"] == "192.0.2.1:27015"
+
+    def test_rate_limiter(self, msq, response):
+        msq.retries = 1
+        response([("192.0.2.1", 27015)], [("0.0.0.0", 0)])
+        msq.get_response.side_effect = [
+            b"", valve.source.NoResponseError, b""]
+        msq.rate_limiter = mock.Mock()
+        list(msq._query(master_server.REGION_REST, ""))
+        assert msq.rate_limiter.acquire.call_count == 3
+        assert msq.rate_limiter.success.call_count == 2
+        assert msq.rate_limiter.timeout.call_count == 1
+
+    def test_progress(self, msq, response):
+        response([("8.8.8.8", 27015)], [("8.8.4.4", 27015), ("0.0.0.0", 0)])
+        progress = []
+        addresses = list(msq._query(
+            master_server.REGION_REST, "", progress.append))
+        assert len(addresses) == 2
+        assert progress == [
+            master_server.RegionProgress(
+                master_server.REGION_REST, 1, 1, False, None),
+            master_server.RegionProgress(
+                master_server.REGION_REST, 2, 2, True, None),
+        ]
+
+    def test_progress_no_response(self, msq, request_, response):
+        msq.get_response.side_effect = valve.source.NoResponseError
+        progress = []
+        assert list(msq._query(
+            master_server.REGION_REST, "", progress.append)) == []
+        region, pages, addresses, done, error = progress[-1]
+        assert (pages, addresses, done) == (0, 0, True)
+        assert isinstance(error, valve.source.NoResponseError)
+
+
+    def test_retry(self, msq, request_, response):
+        response([("192.0.2.1", 27015), ("0.0.0.0", 0)])
+        msq.get_response.side_effect = [
+            valve.source.NoResponseError, valve.source.NoResponseError, b""]
+        cursor = master_server.Cursor(master_server.REGION_REST)
+        addresses = list(msq.resume([cursor], retries=2, backoff=0))
+        assert addresses == [("192.0.2.1", 27015)]
+        assert msq.request.call_count == 3
+        assert cursor.done
+
+    def test_out_of_retries(self, msq, request_, response):
+        response([("192.0.2.1", 27015)])
+        msq.get_response.side_effect = [
+            b"", valve.source.NoResponseError, valve.source.NoResponseError]
+        cursor = master_server.Cursor(master_server.REGION_REST)
+        progress = []
+        addresses = list(msq.resume(
+            [cursor], retries=1, backoff=0, progress=progress.append))
+        assert addresses == [("192.0.2.1", 27015)]
+        assert not cursor.done
+        assert cursor.address == "192.0.2.1:27015"
+        assert isinstance(progress[-1].error, valve.source.NoResponseError)
+
+    def test_resume(self, msq, request_, response):
+        response([("192.0.2.2", 27015), ("0.0.0.0", 0)])
+        msq.get_response.side_effect = None
+        cursor = master_server.Cursor(
+            master_server.REGION_REST, r"\empty\1", "192.0.2.1:27015")
+        addresses = list(msq.resume([cursor]))
+        assert addresses == [("192.0.2.2", 27015)]
+        assert request_.call_args[1] == {
+            "region": master_server.REGION_REST,
+            "address": "192.0.2.1:27015",
+            "filter": r"\empty\1",
+        }
+
+    def test_skip_done(self, msq, request_):
+        cursor = master_server.Cursor(master_server.REGION_REST, done=True)
+        assert list(msq.resume([cursor])) == []
+        assert not request_.called
+
+    def test_checkpoint(self, msq, request_, response, tmpdir):
+        response([("192.0.2.1", 27015)], [("0.0.0.0", 0)])
+        path = str(tmpdir.join("cursors.json"))
+        cursor = master_server.Cursor(master_server.REGION_REST)
+        query = msq.resume([cursor], checkpoint=path)
+        assert next(query) == ("192.0.2.1", 27015)
+        assert not tmpdir.listdir()
+        assert list(query) == []
+        saved, = master_server.load_cursors(path)
+        assert saved.done
+
+
+def _master_server_handler(regions, page_size=2):
+    """Serve pages of the given addresses for each numeric region."""
+
+    def handler(request):
+        region = six.indexbytes(request, 1)
+        if region not in regions:
+            return []
+        cursor = request[2:request.index(b"\x00", 2)].decode("ascii")
+        addresses = regions[region] + [("0.0.0.0", 0)]
+        if cursor != "0.0.0.0:0":
+            host, port = cursor.split(":")
+            addresses = addresses[addresses.index((host, int(port))) + 1:]
+        return [b"\xFF\xFF\xFF\xFF\x66\x0A" + b"".join(
+            socket.inet_aton(host) + struct.pack(">H", port)
+            for host, port in addresses[:page_size])]
+
+    return handler
+
+
+class TestParallel(object):
+
+    REGIONS = {
+        master_server.REGION_US_EAST_COAST: [
+            ("192.0.2.{}".format(i), 27015) for i in range(5)],
+        master_server.REGION_US_WEST_COAST: [
+            ("198.51.100.{}".format(i), 27015) for i in range(3)]
+        + [("192.0.2.0", 27015)],
+    }
+
+    @pytest.yield_fixture
+    def msq(self, a2s_server):
+        server = a2s_server(_master_server_handler(self.REGIONS))
+        msq = master_server.MasterServerQuerier(
+            server.address, timeout=0.5, rate_limit=False, retries=0)
+        msq.server = server
+        yield msq
+        msq.close()
+
+    @pytest.mark.parametrize("duplicates", [
+        master_server.Duplicates.KEEP,
+        master_server.Duplicates.SKIP,
+    ])
+    def test_same_as_serial(self, msq, duplicates):
+        serial = list(msq.find(region="na", duplicates=duplicates))
+        parallel = list(msq.find(
+            region="na", duplicates=duplicates, parallel=True))
+        assert sorted(parallel) == sorted(serial)
+        assert len(set(parallel)) == 8
+
+    def test_interleaved(self, msq):
+        list(msq.find(region="na", parallel=True))
+        regions = [six.indexbytes(request, 1)
+                   for request in msq.server.requests]
+        # Both regions are requested before either has finished
+        assert regions[:2] in ([0, 1], [1, 0])
+        assert len(regions) == 6
+
+    def test_progress(self, msq):
+        progress = []
+        list(msq.find(region="na", parallel=True, progress=progress.append))
+        final = {update.region: update
+                 for update in progress if update.done}
+        assert final == {
+            master_server.REGION_US_EAST_COAST: master_server.RegionProgress(
+                master_server.REGION_US_EAST_COAST, 3, 5, True, None),
+            master_server.REGION_US_WEST_COAST: master_server.RegionProgress(
+                master_server.REGION_US_WEST_COAST, 3, 4, True, None),
+        }
+        assert len(progress) == 6
+
+    def test_packed(self, msq):
+        addresses = list(msq.find(region="na-east", packed=True))
+        assert addresses == [
+            util.pack_address(*address) for address in
+            self.REGIONS[master_server.REGION_US_EAST_COAST]]
+
+    def test_no_response(self, msq):
+        progress = []
+        addresses = list(msq.find(region=["na-east", "eu"], parallel=True,
+                                  progress=progress.append))
+        assert sorted(addresses) == sorted(
+            self.REGIONS[master_server.REGION_US_EAST_COAST])
+        europe, = [update for update in progress
+                   if update.region == master_server.REGION_EUROPE]
+        assert europe.done
+        assert europe.pages == 0
+        assert isinstance(europe.error, valve.source.NoResponseError)
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_resume_mid_page(self, msq, parallel):
+        expected = self.REGIONS[master_server.REGION_US_EAST_COAST]
+        cursors = [master_server.Cursor(master_server.REGION_US_EAST_COAST)]
+        query = msq.resume(cursors, parallel=parallel)
+        # Stop after the first address of the second page
+        addresses = [next(query) for _ in range(3)]
+        query.close()
+        assert cursors[0].address == "192.0.2.1:27015"
+        addresses.extend(msq.resume(cursors, parallel=parallel))
+        assert addresses == expected[:3] + expected[2:]
+        assert cursors[0].done
+
+    def test_stop_early(self, msq):
+        find = msq.find(region="na", parallel=True)
+        next(find)
+        find.close()
+
+    def test_closed(self, msq):
+        msq.close()
+        with pytest.raises(valve.source.QuerierClosedError):
+            list(msq.find(parallel=True))
+
+    def test_retry_parallel(self, a2s_server):
+        attempts = []
+        handler = _master_server_handler(self.REGIONS)
+
+        def flaky(request):
+            # Drop the first request for each page
+            attempts.append(request)
+            if attempts.count(request) == 1:
+                return []
+            return handler(request)
+
+        server = a2s_server(flaky)
+        cursors = [master_server.Cursor(master_server.REGION_US_EAST_COAST)]
+        with master_server.MasterServerQuerier(
+                server.address, timeout=0.1, rate_limit=False) as msq:
+            addresses = list(msq.resume(
+                cursors, parallel=True, retries=1, backoff=0))
+        assert addresses == self.REGIONS[master_server.REGION_US_EAST_COAST]
+        assert cursors[0].done
+        assert len(server.requests) == 6
+
+    def test_late_response_while_backing_off(self, a2s_server):
+        handler = _master_server_handler(self.REGIONS)
+        requests = []
+
+        def late(request):
+            # Respond to the first request after it has timed out
+            requests.append(request)
+            if len(requests) == 1:
+                time.sleep(0.15)
+            return handler(request)
+
+        server = a2s_server(late)
+        cursors = [master_server.Cursor(master_server.REGION_US_EAST_COAST)]
+        cpu_start = sum(os.times()[:2])
+        with master_server.MasterServerQuerier(
+                server.address, timeout=0.1, rate_limit=False) as msq:
+            addresses = list(msq.resume(
+                cursors, master_server.Duplicates.KEEP,
+                parallel=True, retries=1, backoff=0.5))
+        # Spinning would use about as much CPU time as the backoff
+        assert sum(os.times()[:2]) - cpu_start < 0.25
+        assert addresses == self.REGIONS[master_server.REGION_US_EAST_COAST]
+        assert cursors[0].done
+        assert len(server.requests) == 4
+
+
+class TestCursor(object):
+
+    def test_dict(self):
+        cursor = master_server.Cursor(
+            master_server.REGION_EUROPE, r"\gamedir\tf", "192.0.2.1:27015")
+        assert cursor.to_dict() == {
+            "region": master_server.REGION_EUROPE,
+            "filter": r"\gamedir\tf",
+            "address": "192.0.2.1:27015",
+            "done": False,
+        }
+        assert master_server.Cursor.from_dict(cursor.to_dict()) == cursor
+
+    def test_from_dict_invalid(self):
+        with pytest.raises(ValueError):
+            master_server.Cursor.from_dict({"region": 0})
+
+    def test_save_load(self, tmpdir):
+        path = str(tmpdir.join("cursors.json"))
+        cursors = [
+            master_server.Cursor(master_server.REGION_EUROPE),
+            master_server.Cursor(master_server.REGION_ASIA, r"\empty\1",
+                                 "192.0.2.1:27015", True),
+        ]
+        master_server.save_cursors(path, cursors)
+        master_server.save_cursors(path, cursors)
+        assert master_server.load_cursors(path) == cursors
+        assert tmpdir.listdir() == [tmpdir.join("cursors.json")]
+
+    def test_load_invalid(self, tmpdir):
+        path = tmpdir.join("cursors.json")
+        path.write("[]")
+        with pytest.raises(ValueError):
+            master_server.load_cursors(str(path))
+
+    def test_cursors(self):
+        msq = master_server.MasterServerQuerier()
+        try:
+            assert msq.cursors(region="na", empty=True) == [
+                master_server.Cursor(master_server.REGION_US_EAST_COAST,
+                                     r"\empty\1"),
+                master_server.Cursor(master_server.REGION_US_WEST_COAST,
+                                     r"\empty\1"),
+            ]
+        finally:
+            msq.close()
+
+
+
+class TestFindCache(object):
+
+    ADDRESSES = [("192.0.2.{}".format(i), 27015) for i in range(5)]
+    KEY = ((master_server.REGION_EUROPE,), r"\gamedir\tf")
+
+    @pytest.fixture
+    def server(self, a2s_server):
+        return a2s_server(_master_server_handler(
+            {master_server.REGION_EUROPE: self.ADDRESSES}))
+
+    @pytest.yield_fixture
+    def msq(self, server):
+        msq = master_server.MasterServerQuerier(
+            server.address, timeout=0.5, cache=master_server.FindCache(),
+            rate_limit=False, retries=0)
+        yield msq
+        msq.close()
+
+    def test_get_put(self, monkeypatch):
+        monkeypatch.setattr(master_server.time, "time", lambda: 1000.0)
+        cache = master_server.FindCache(ttl=10)
+        assert cache.get(self.KEY) is None
+        cache.put(self.KEY, [1, 2, 3])
+        assert list(cache.get(self.KEY)) == [1, 2, 3]
+        assert len(cache) == 1
+        monkeypatch.setattr(master_server.time, "time", lambda: 1010.0)
+        assert cache.get(self.KEY) is None
+        assert len(cache) == 0
+
+    def test_lru(self):
+        cache = master_server.FindCache(maxsize=2)
+        cache.put(((0,), ""), [1])
+        cache.put(((1,), ""), [2])
+        cache.get(((0,), ""))
+        cache.put(((2,), ""), [3])
+        assert cache.get(((1,), "")) is None
+        assert list(cache.get(((0,), ""))) == [1]
+        assert list(cache.get(((2,), ""))) == [3]
+
+    def test_path(self, tmpdir, monkeypatch):
+        path = str(tmpdir.join("cache.json"))
+        cache = master_server.FindCache(ttl=10, path=path)
+        cache.put(self.KEY, [0xC00002016987])
+        cache.put(((0,), ""), [])
+        loaded = master_server.FindCache(path=path)
+        assert list(loaded.get(self.KEY)) == [0xC00002016987]
+        assert list(loaded.get(((0,), ""))) == []
+        later = time.time() + 10
+        monkeypatch.setattr(master_server.time, "time", lambda: later)
+        assert len(master_server.FindCache(path=path)) == 0
+
+    def test_path_invalid(self, tmpdir):
+        path = tmpdir.join("cache.json")
+        path.write("{}")
+        with pytest.raises(ValueError):
+            master_server.FindCache(path=str(path))
+
+    def test_find(self, msq, server):
+        assert list(msq.find(region="eu", gamedir="tf")) == self.ADDRESSES
+        assert len(server.requests) == 3
+        assert list(msq.find(region="eu", gamedir="tf")) == self.ADDRESSES
+        assert len(server.requests) == 3
+        assert list(msq.cache.get(self.KEY)) == [
+            util.pack_address(*address) for address in self.ADDRESSES]
+        list(msq.find(region="eu", gamedir="cstrike"))
+        assert len(server.requests) == 6
+
+    def test_incomplete(self, msq, server):
+        find = msq.find(region="eu", gamedir="tf")
+        next(find)
+        find.close()
+        assert msq.cache.get(self.KEY) is None
+        list(msq.find(region=["eu", "af"], gamedir="tf"))
+        assert len(msq.cache) == 0
+
+    def test_coalesce(self, a2s_server):
+        handler = _master_server_handler(
+            {master_server.REGION_EUROPE: self.ADDRESSES})
+
+        def slow(request):
+            time.sleep(0.05)
+            return handler(request)
+
+        server = a2s_server(slow)
+        cache = master_server.FindCache()
+        results = []
+
+        def find():
+            with master_server.MasterServerQuerier(
+                    server.address, timeout=1.0, cache=cache,
+                    rate_limit=False) as msq:
+                results.append(list(msq.find(region="eu", gamedir="tf")))
+
+        threads = [threading.Thread(target=find) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [self.ADDRESSES] * 3
+        assert len(server.requests) == 3
+
+    @pytest.mark.timeout(timeout=5, method="thread")
+    def test_interleaved(self, msq, server):
+        first = msq.find(region="eu", gamedir="tf")
+        second = msq.find(region="eu", gamedir="tf")
+        assert next(first) == self.ADDRESSES[0]
+        assert list(second) == self.ADDRESSES
+        assert list(first) == self.ADDRESSES[1:]
+        assert len(server.requests) == 6
+        assert msq.cache._in_flight == {}
+
+    @pytest.mark.timeout(timeout=5, method="thread")
+    def test_abandoned(self, server):
+        cache = master_server.FindCache()
+        results = []
+
+        def find():
+            with master_server.MasterServerQuerier(
+                    server.address, timeout=0.2, cache=cache,
+                    rate_limit=False) as msq:
+                results.append(list(msq.find(region="eu", gamedir="tf")))
+
+        with master_server.MasterServerQuerier(
+                server.address, timeout=0.2, cache=cache,
+                rate_limit=False) as msq:
+            # Started but neither finished nor closed
+            abandoned = msq.find(region="eu", gamedir="tf")
+            next(abandoned)
+            thread = threading.Thread(target=find)
+            thread.start()
+            thread.join()
+            assert results == [self.ADDRESSES]
+            assert list(cache.get(self.KEY)) == [
+                util.pack_address(*address) for address in self.ADDRESSES]
+            abandoned.close()
+        assert cache._in_flight == {}
+
+
+class TestRateLimiter(object):
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        now = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        monkeypatch.setattr(
+            master_server.monotonic, "monotonic", lambda: now[0])
+        monkeypatch.setattr(master_server.time, "sleep", sleep)
+        return sleeps
+
+    def test_burst(self, clock):
+        limiter = master_server.RateLimiter(rate=2.0, burst=3)
+        for _ in range(3):
+            limiter.acquire()
+        assert clock == []
+        limiter.acquire()
+        assert clock == [0.5]
+
+    def test_success(self, clock):
+        limiter = master_server.RateLimiter(
+            rate=2.0, maximum=3.0, increase=0.5)
+        limiter.success()
+        assert limiter.rate == 2.5
+        limiter.success()
+        limiter.success()
+        assert limiter.rate == 3.0
+
+    def test_timeout(self, clock):
+        limiter = master_server.RateLimiter(
+            rate=2.0, burst=5, minimum=0.5, decrease=0.5)
+        limiter.timeout()
+        assert limiter.rate == 1.0
+        limiter.acquire()
+        assert clock == []
+        limiter.acquire()
+        assert clock == [1.0]
+        limiter.timeout()
+        limiter.timeout()
+        assert limiter.rate == 0.5
+
+    @pytest.mark.parametrize("kwargs", [
+        {"rate": 0.1, "minimum": 0.2},
+        {"rate": 100.0, "maximum": 50.0},
+        {"decrease": 1.0},
+        {"decrease": 0},
+    ])
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            master_server.RateLimiter(**kwargs)
+
+    def test_default(self):
+        with master_server.MasterServerQuerier() as msq:
+            assert msq.rate_limiter is None
+            assert msq.retries == 0
+        with master_server.MasterServerQuerier(rate_limit=True) as msq:
+            assert isinstance(msq.rate_limiter, master_server.RateLimiter)
+        limiter = master_server.RateLimiter()
+        with master_server.MasterServerQuerier(rate_limit=limiter) as msq:
+            assert msq.rate_limiter is limiter
+        with master_server.MasterServerQuerier(rate_limit=False) as msq:
+            assert msq.rate_limiter is None
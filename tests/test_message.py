@@ -5,6 +5,8 @@ from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
 import inspect
+import pickle
+import struct
 
 try:
     from mock import Mock
@@ -14,6 +16,7 @@ import pytest
 import six
 
 from valve.source import messages
+from valve.source import util
 
 
 class TestUseDefault(object):
@@ -117,7 +120,8 @@ class TestMessageField(object):
             field.validate("10")
 
     def test_validate_exception(self):
-        field = messages.MessageField("", validators=[Mock(side_effect=Exception)])
+        field = messages.MessageField(
+            "", validators=[Mock(side_effect=Exception)])
         with pytest.raises(messages.BrokenMessageError):
             field.validate(5)
 
@@ -175,6 +179,27 @@ class TestMessageField(object):
             field("").encode(value)
 
 
+    @pytest.mark.parametrize("buffer", [
+        b"\xFF\x2A\x00\x01",
+        bytearray(b"\xFF\x2A\x00\x01"),
+        memoryview(b"\xFF\x2A\x00\x01"),
+    ])
+    def test_decode_from(self, buffer):
+        value, offset = messages.ShortField("").decode_from(buffer, 1)
+        assert value == 42
+        assert offset == 3
+
+    @pytest.mark.parametrize("offset", [3, 4, 5])
+    def test_decode_from_exhausted(self, offset):
+        with pytest.raises(messages.BufferExhaustedError):
+            messages.ShortField("").decode_from(b"\xFF\x2A\x00\x01", offset)
+
+    def test_decode_from_validated(self):
+        field = messages.ByteField("", validators=[lambda x: x == 5])
+        with pytest.raises(messages.BrokenMessageError):
+            field.decode_from(b"\x05\x06", 1)
+
+
 class TestStringField(object):
 
     def test_encode(self):
@@ -204,6 +229,26 @@ class TestStringField(object):
             field.decode(b"\xFF\xFF\xFF")
 
 
+    @pytest.mark.parametrize("buffer", [
+        b"\xFFHello\x00\x02",
+        memoryview(b"\xFFHello\x00\x02"),
+    ])
+    def test_decode_from(self, buffer):
+        decoded, offset = messages.StringField("").decode_from(buffer, 1)
+        assert isinstance(decoded, six.text_type)
+        assert decoded == "Hello"
+        assert offset == 7
+
+    def test_decode_from_no_null_terminator(self):
+        with pytest.raises(messages.BufferExhaustedError):
+            messages.StringField("").decode_from(
+                memoryview(b"\x00\xFF\xFF"), 1)
+
+    def test_decode_from_empty(self):
+        with pytest.raises(messages.BufferExhaustedError):
+            messages.StringField("").decode_from(b"Hello\x00", 6)
+
+
 class TestMessageArrayField(object):
 
     @pytest.fixture
@@ -275,6 +320,16 @@ class TestMessageArrayField(object):
         assert isinstance(remnants, bytes)
         assert remnants == b"\x22"
 
+    def test_decode_from(self):
+        class Message(messages.Message):
+            fields = messages.ShortField("field"),
+        array = messages.MessageArrayField("", Message, 3)
+        array.count.minimum = 2
+        values, offset = array.decode_from(
+            memoryview(b"\xFF\x01\x00\x02\x00\x22"), 1)
+        assert [value["field"] for value in values] == [1, 2]
+        assert offset == 5
+
     def test_deocde_value_of(self):
         assert messages.MessageArrayField.value_of("f")({"f": 26}) == 26
 
@@ -498,12 +553,388 @@ class TestMessage(object):
 
     # TODO: more complex structures, e.g. ArrayField and DictFields
 
+INFO_RESPONSE = (b"\x49\x11Server\x00ctf_2fort\x00tf\x00Team Fortress\x00"
+                 b"\xB8\x01\x10\x18\x00d\x6C\x00\x01"
+                 b"1.0.0\x00\x80\x87\x69")
+
+
+class TestCompiledDecoder(object):
+
+    @pytest.mark.parametrize("message,packet", [
+        (messages.InfoResponse, INFO_RESPONSE),
+        (messages.PlayersResponse,
+            b"\x44\x02\x00foo\x00\x05\x00\x00\x00\x00\x00\x80\x3F"
+            b"\x01bar\x00\xFF\xFF\xFF\xFF\x00\x00\x00\x40"),
+        (messages.RulesResponse, b"\x45\x02\x00a\x00b\x00c\x00d\x00"),
+        (messages.Fragment, b"\x01\x00\x00\x80\x02\x01\xE0\x04\xFF"),
+        (messages.MasterServerResponse,
+            b"\xFF\xFF\xFF\xFF\x66\x0A\x01\x02\x03\x04\x69\x87"),
+    ])
+    def test_identical(self, message, packet):
+        expected_values, expected_payload = messages._decode_fields(
+            message.fields, packet)
+        decoded = message.decode(packet)
+        assert decoded.values == expected_values
+        assert type(decoded.payload) is type(expected_payload)
+        assert decoded.payload == expected_payload
+
+    def test_converters(self):
+        info = messages.InfoResponse.decode(INFO_RESPONSE)
+        assert info["server_type"] == util.ServerType(100)
+        assert info["platform"] == util.Platform(108)
+        assert info["app_id"] == 440
+        assert info.payload == b"\x80\x87\x69"
+
+    @pytest.mark.parametrize("packet", [
+        b"",
+        b"\x00",
+        b"\x49",
+        INFO_RESPONSE[:-10],
+        INFO_RESPONSE[:30],
+        b"\x49\x11Server",
+    ])
+    def test_identical_errors(self, packet):
+        with pytest.raises(messages.BrokenMessageError) as expected:
+            messages._decode_fields(messages.InfoResponse.fields, packet)
+        with pytest.raises(messages.BrokenMessageError) as excinfo:
+            messages.InfoResponse.decode(packet)
+        assert type(excinfo.value) is type(expected.value)
+
+    @pytest.mark.parametrize("message,packet", [
+        (messages.InfoResponse, INFO_RESPONSE[:-10]),
+        (messages.InfoResponse, INFO_RESPONSE[:30]),
+        (messages.InfoResponse, b"\x49\x11Server"),
+        (messages.PlayersResponse, b"\x44\x01\x00foo"),
+        (messages.PlayersResponse, b"\x44\x01\x00foo\x00\x05\x00"),
+    ])
+    def test_truncated_memoryview(self, message, packet):
+        with pytest.raises(messages.BrokenMessageError) as expected:
+            message.decode(packet)
+        with pytest.raises(messages.BrokenMessageError) as excinfo:
+            message.decode(memoryview(packet))
+        assert type(excinfo.value) is type(expected.value)
+        assert str(excinfo.value) == str(expected.value)
+
+    def test_merged(self):
+
+        class Message(messages.Message):
+            fields = (
+                messages.ByteField("byte"),
+                messages.ShortField("short"),
+                messages.LongField("long"),
+                messages.FloatField("float"),
+                messages.MSAddressEntryPortField("port"),
+            )
+
+        decoder = Message._decoder()
+        assert len(decoder._steps) == 2
+        decoded = Message.decode(
+            b"\x01\x02\x00\x03\x00\x00\x00\x00\x00\x80\x3F\x1B\x39")
+        assert decoded.values == {
+            "byte": 1, "short": 2, "long": 3, "float": 1.0, "port": 6969}
+
+    def test_recompiled(self):
+
+        class Message(messages.Message):
+            fields = messages.ByteField("byte"),
+
+        assert Message.decode(b"\x01\x02")["byte"] == 1
+        Message.fields = messages.ShortField("short"),
+        assert Message.decode(b"\x01\x02")["short"] == 0x0201
+
+    def test_not_shared_with_subclass(self):
+
+        class Message(messages.Message):
+            fields = messages.ByteField("byte"),
+
+        class SubMessage(Message):
+            fields = messages.ShortField("short"),
+
+        assert Message.decode(b"\x01\x02").values == {"byte": 1}
+        assert SubMessage.decode(b"\x01\x02").values == {"short": 0x0201}
+
+    def test_not_a_field(self):
+        field = Mock()
+        field.name = "mock"
+        field.decode.return_value = ("value", b"\x02")
+
+        class Message(messages.Message):
+            fields = (messages.ByteField("byte"), field)
+
+        decoded = Message.decode(b"\x01\xFF\x02")
+        assert decoded.values == {"byte": 1, "mock": "value"}
+        assert decoded.payload == b"\x02"
+        assert field.decode.call_args[0][0] == b"\xFF\x02"
+
+
+class TestMessageDecodeFrom(object):
+
+    def test_decode_from(self):
+        entry, offset = messages.PlayerEntry.decode_from(
+            b"\xFF\x00foo\x00\x05\x00\x00\x00\x00\x00\x80\x3F\xEE", 1)
+        assert entry.values == {
+            "index": 0, "name": "foo", "score": 5, "duration": 1.0}
+        assert offset == 14
+        assert entry.payload == b"\xEE"
+
+    def test_memoryview(self):
+        packet = memoryview(bytearray(INFO_RESPONSE))
+        info = messages.InfoResponse.decode(packet)
+        assert info.values == messages.InfoResponse.decode(
+            INFO_RESPONSE).values
+        assert isinstance(info.payload, memoryview)
+        assert info.payload.obj is packet.obj
+        assert info.payload.tobytes() == b"\x80\x87\x69"
+
+    def test_payload_lazy(self):
+        packet = INFO_RESPONSE
+        info = messages.InfoResponse.decode(packet)
+        assert info._remainder == (packet, len(packet) - 3)
+        assert info.payload == b"\x80\x87\x69"
+        assert info._remainder is None
+
+    def test_payload_set(self):
+        info = messages.InfoResponse.decode(INFO_RESPONSE)
+        info.payload = b"foo"
+        assert info.payload == b"foo"
+
+    def test_rules_prefix(self):
+        rules = messages.RulesResponse.decode(
+            memoryview(b"\xFF\xFF\xFF\xFF\x45\x01\x00a\x00b\x00"))
+        assert rules["rules"] == {"a": "b"}
+
+    def test_legacy_field(self):
+
+        class Field(messages.ByteField):
+
+            def decode(self, buffer, values={}):
+                return "legacy", buffer[1:]
+
+        class Message(messages.Message):
+            fields = (
+                messages.ByteField("first"),
+                Field("legacy"),
+                messages.ByteField("last"),
+            )
+
+        message, offset = Message.decode_from(b"\x00\x01\x02\x03\x04", 1)
+        assert message.values == {"first": 1, "legacy": "legacy", "last": 3}
+        assert offset == 4
+        assert message.payload == b"\x04"
+
+    def test_players_linear(self):
+        # Every element's payload would otherwise be a copy of the rest
+        # of the packet.
+        players = messages.PlayersResponse.decode(
+            b"\x44\x40" + (b"\x00foo\x00" + b"\x00" * 8) * 64)
+        assert len(players["players"]) == 64
+        assert all(player._remainder is not None
+                   for player in players["players"])
+
+
+class TestLazyDecode(object):
+
+    def test_values(self):
+        eager = messages.InfoResponse.decode(INFO_RESPONSE)
+        lazy = messages.InfoResponse.decode(INFO_RESPONSE, lazy=True)
+        assert isinstance(lazy.values, messages.LazyValues)
+        assert lazy.values.deferred
+        assert list(lazy) == list(eager)
+        assert lazy == eager
+        assert not lazy.values.deferred
+        assert lazy.payload == eager.payload
+
+    def test_deferred(self):
+        info = messages.InfoResponse.decode(INFO_RESPONSE, lazy=True)
+        # Validated fields are decoded eagerly
+        assert "response_type" not in info.values.deferred
+        assert "map" in info.values.deferred
+        assert "platform" in info.values.deferred
+        assert "map" in info
+        assert "map" in info.values.deferred
+        assert info["map"] == "ctf_2fort"
+        assert "map" not in info.values.deferred
+        assert info["player_count"] == 16
+        assert info["platform"] == util.Platform(108)
+        assert len(info) == len(messages.InfoResponse.fields)
+
+    def test_memoryview(self):
+        info = messages.InfoResponse.decode(
+            memoryview(INFO_RESPONSE), lazy=True)
+        assert info["server_name"] == "Server"
+        assert info["version"] == "1.0.0"
+
+    def test_set_delete(self):
+        info = messages.InfoResponse.decode(INFO_RESPONSE, lazy=True)
+        info["map"] = "cp_badlands"
+        assert info["map"] == "cp_badlands"
+        del info["game"]
+        assert "game" not in info
+        with pytest.raises(KeyError):
+            info["game"]
+        info["extra"] = 1
+        assert list(info)[-1] == "extra"
+
+    @pytest.mark.parametrize("packet", [
+        b"",
+        b"\x00",
+        b"\x49",
+        INFO_RESPONSE[:-10],
+        INFO_RESPONSE[:30],
+        b"\x49\x11Server",
+    ])
+    def test_identical_errors(self, packet):
+        with pytest.raises(messages.BrokenMessageError) as expected:
+            messages.InfoResponse.decode(packet)
+        with pytest.raises(messages.BrokenMessageError) as excinfo:
+            messages.InfoResponse.decode(packet, lazy=True)
+        assert type(excinfo.value) is type(expected.value)
+        assert str(excinfo.value) == str(expected.value)
+
+    def test_array_count(self):
+        players = messages.PlayersResponse.decode(
+            b"\x44\x02" + (b"\x00foo\x00" + b"\x00" * 8) * 2, lazy=True)
+        assert len(players["players"]) == 2
+        assert players["player_count"] == 2
+
+    def test_segments(self):
+
+        class Message(messages.Message):
+            fields = (
+                messages.StringField("first"),
+                messages.ByteField("count"),
+                messages.MessageArrayField(
+                    "array", messages.PlayerEntry,
+                    messages.MessageArrayField.value_of("count")),
+                messages.ShortField("short"),
+                messages.StringField("last"),
+            )
+
+        packet = (b"foo\x00\x01\x00bar\x00" + b"\x00" * 8
+                  + b"\x2A\x00baz\x00")
+        message = Message.decode(packet, lazy=True)
+        assert message.values.deferred == {"first", "short", "last"}
+        assert message == Message.decode(packet)
+
+    def test_rules(self):
+        packet = b"\xFF\xFF\xFF\xFF\x45\x01\x00a\x00b\x00"
+        rules = messages.RulesResponse.decode(packet, lazy=True)
+        assert rules["rules"] == {"a": "b"}
+        assert rules["rule_count"] == 1
+
+
+class TestRecord(object):
+
+    PLAYERS = (b"\x00foo\x00\x01\x00\x00\x00\x00\x00\x80\x3F"
+               b"\x01bar\x00\x02\x00\x00\x00\x00\x00\x00\x40")
+
+    def test_record_type(self):
+        record_type = messages.PlayerEntry.record_type()
+        assert issubclass(record_type, messages.Record)
+        assert record_type.message is messages.PlayerEntry
+        assert record_type.__name__ == "PlayerEntry"
+        assert messages.PlayerEntry.record_type() is record_type
+
+    def test_recreated(self):
+
+        class Message(messages.Message):
+            fields = messages.ByteField("byte"),
+
+        assert list(Message.record_type()._fields) == ["byte"]
+        Message.fields = messages.ShortField("short"),
+        assert list(Message.record_type()._fields) == ["short"]
+
+    def test_compact(self):
+        compact = messages.MessageArrayField(
+            "", messages.PlayerEntry, 2, compact=True)
+        players, offset = compact.decode_from(self.PLAYERS, 0)
+        expected, expected_offset = messages.MessageArrayField(
+            "", messages.PlayerEntry, 2).decode_from(self.PLAYERS, 0)
+        assert offset == expected_offset == len(self.PLAYERS)
+        assert players == expected
+        for player in players:
+            assert isinstance(player, messages.Record)
+            assert not hasattr(player, "__dict__")
+        assert players[0]["name"] == "foo"
+        assert list(players[1]) == ["index", "name", "score", "duration"]
+        assert dict(players[1]) == {
+            "index": 1, "name": "bar", "score": 2, "duration": 2.0}
+
+    def test_compact_remnants(self):
+        compact = messages.MessageArrayField(
+            "", messages.PlayerEntry, messages.MessageArrayField.all(),
+            compact=True)
+        players, remnants = compact.decode(self.PLAYERS + b"\x02baz")
+        assert [player["name"] for player in players] == ["foo", "bar"]
+        assert remnants == b"\x02baz"
+
+    def test_read_only(self):
+        record = messages.MSAddressEntry.record_type()._make(
+            {"host": "0.0.0.0", "port": 0})
+        with pytest.raises(TypeError):
+            record["host"] = "127.0.0.1"
+        with pytest.raises(KeyError):
+            record["foo"]
+        assert "host" in record
+        assert "foo" not in record
+        assert len(record) == 2
+
+    def test_properties(self):
+        record_type = messages.MSAddressEntry.record_type()
+        assert record_type._make({"host": "0.0.0.0", "port": 0}).is_null
+        assert not record_type._make(
+            {"host": "127.0.0.1", "port": 27015}).is_null
+        assert messages.Fragment.record_type()._make({
+            "message_id": -1,
+            "fragment_count": 1,
+            "fragment_id": 0,
+            "mtu": 1248,
+        }).is_compressed
+
+    def test_pickle(self):
+        record = messages.MSAddressEntry.record_type()._make(
+            {"host": "127.0.0.1", "port": 27015})
+        unpickled = pickle.loads(pickle.dumps(record, 2))
+        assert type(unpickled) is type(record)
+        assert unpickled == record
+
+    def test_encode(self):
+        array = messages.MessageArrayField("", messages.PlayerEntry, 2)
+        values = {"index": 0, "name": "foo", "score": 1, "duration": 1.0}
+        record = messages.PlayerEntry.record_type()._make(values)
+        message = messages.PlayerEntry(**values)
+        assert array.encode([record, message]) == array.encode([message] * 2)
+
+    def test_master_server_response(self):
+        packet = (b"\xFF\xFF\xFF\xFF\x66\x0A"
+                  b"\x7F\x00\x00\x01\x69\x87\x00\x00\x00\x00\x00\x00")
+        response = messages.MasterServerResponse.decode(packet)
+        assert all(isinstance(address, messages.MSAddressEntry)
+                   for address in response["addresses"])
+        compact = messages.MasterServerCompactResponse.decode(packet)
+        assert compact["addresses"] == response["addresses"]
+        first, last = compact["addresses"]
+        assert isinstance(first, messages.Record)
+        assert (first["host"], first["port"]) == ("127.0.0.1", 27015)
+        assert not first.is_null
+        assert last.is_null
+
+
 class TestFragment(object):
 
     def test_is_compressed(self):
-        assert messages.Fragment(message_id=(1 << 31) - 1).is_compressed
+        assert messages.Fragment(message_id=-(1 << 31) | 1).is_compressed
+        assert messages.Fragment(message_id=-1).is_compressed
+        assert not messages.Fragment(message_id=(1 << 31) - 1).is_compressed
         assert not messages.Fragment(message_id=1 << 30).is_compressed
 
+    def test_compression_data(self):
+        data = messages.FragmentCompressionData.decode(
+            b"\x00\x10\x00\x00\xEF\xBE\xAD\xDE\x42")
+        assert data["decompressed_size"] == 4096
+        assert data["crc32"] == 0xDEADBEEF
+        assert data.payload == b"\x42"
+
 
 class TestMSAddressEntry(object):
 
@@ -524,3 +955,51 @@ class TestMSAddressEntry(object):
             b"\x00\x00\x00\x00\x00\x00").is_null
         assert not messages.MSAddressEntry.decode(
             b"\x01\x02\x03\x04\x69\x87").is_null
+
+
+class TestMSAddressArrayField(object):
+
+    def test_decode(self):
+        addresses, remnants = messages.MSAddressArrayField("").decode(
+            b"\xC0\x00\x02\x01\x69\x87\x00\x00\x00\x00\x00\x00\xFF")
+        assert list(addresses) == [0xC00002016987, 0]
+        assert remnants == b"\xFF"
+
+    def test_decode_from(self):
+        buffer = memoryview(b"\xFF\xC0\x00\x02\x01\x69\x87")
+        addresses, offset = messages.MSAddressArrayField("").decode_from(
+            buffer, 1)
+        assert list(addresses) == [0xC00002016987]
+        assert offset == 7
+
+    @pytest.mark.parametrize("typecode", [
+        messages._PACKED_ADDRESS_TYPE,
+        None,
+    ])
+    def test_decode_many(self, monkeypatch, typecode):
+        monkeypatch.setattr(messages, "_PACKED_ADDRESS_TYPE", typecode)
+        expected = [0xC0000200 + index << 16 | index
+                    for index in range(0, 50000, 7)]
+        buffer = b"\x00" + b"".join(
+            struct.pack(">IH", address >> 16, address & 0xFFFF)
+            for address in expected) + b"\x00\x00"
+        addresses, offset = messages.MSAddressArrayField("").decode_from(
+            buffer, 1)
+        assert list(addresses) == expected
+        assert offset == len(buffer) - 2
+
+    def test_encode(self):
+        field = messages.MSAddressArrayField("")
+        encoded = field.encode([0xC00002016987, 0])
+        assert encoded == b"\xC0\x00\x02\x01\x69\x87" + b"\x00" * 6
+        assert list(field.decode(encoded)[0]) == [0xC00002016987, 0]
+
+    def test_response(self):
+        packet = (b"\xFF\xFF\xFF\xFF\x66\x0A"
+                  b"\x7F\x00\x00\x01\x69\x87\x00\x00\x00\x00\x00\x00")
+        packed = messages.MasterServerPackedResponse.decode(packet)
+        records = messages.MasterServerResponse.decode(packet)
+        assert [util.unpack_address(address)
+                for address in packed["addresses"]] == [
+            (record["host"], record["port"])
+            for record in records["addresses"]]
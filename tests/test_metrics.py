@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import pytest
+
+import valve.metrics
+import valve.rcon
+import valve.source
+import valve.testing
+from valve.source import a2s
+from valve.source import master_server
+
+
+@pytest.yield_fixture
+def aggregator():
+    aggregator = valve.metrics.Aggregator()
+    valve.metrics.add_observer(aggregator)
+    yield aggregator
+    valve.metrics.remove_observer(aggregator)
+
+
+class TestObservers(object):
+
+    def test_add_remove(self):
+        observer = valve.metrics.Observer()
+        valve.metrics.add_observer(observer)
+        assert observer in valve.metrics.observers
+        valve.metrics.remove_observer(observer)
+        assert observer not in valve.metrics.observers
+        with pytest.raises(ValueError):
+            valve.metrics.remove_observer(observer)
+
+    def test_notify(self):
+        observer = pytest.Mock()
+        valve.metrics.add_observer(observer)
+        try:
+            valve.metrics.notify("sent", None, ("127.0.0.1", 1), 10)
+        finally:
+            valve.metrics.remove_observer(observer)
+        observer.sent.assert_called_once_with(None, ("127.0.0.1", 1), 10)
+
+    def test_timed(self):
+        observer = pytest.Mock()
+        valve.metrics.add_observer(observer)
+        try:
+            assert valve.metrics.timed(None, "info", len, b"abc") == 3
+        finally:
+            valve.metrics.remove_observer(observer)
+        source, message, duration = observer.decoded.call_args[0]
+        assert source is None
+        assert message == "info"
+        assert duration >= 0
+
+    def test_timed_disabled(self, monkeypatch):
+        monkeypatch.setattr(valve.metrics, "notify", pytest.Mock())
+        assert valve.metrics.timed(None, "info", len, b"abc") == 3
+        assert not valve.metrics.notify.called
+
+
+class TestAggregator(object):
+
+    def test_histogram(self):
+        histogram = valve.metrics.Histogram([1, 2, 3])
+        for value in [0.5, 1, 1.5, 2.5, 10]:
+            histogram.observe(value)
+        assert histogram.counts == [2, 1, 1, 1]
+        assert histogram.count == 5
+        assert histogram.sum == 15.5
+
+    def test_render(self):
+        aggregator = valve.metrics.Aggregator(namespace="test")
+        source = a2s.ServerQuerier(("127.0.0.1", 1))
+        source.close()
+        aggregator.sent(source, None, 25)
+        aggregator.received(source, None, 100)
+        aggregator.responded(source, None, 20.0)
+        aggregator.decoded(source, "info", 0.02)
+        rendered = aggregator.render().splitlines()
+        assert "# TYPE test_requests_total counter" in rendered
+        assert 'test_requests_total{querier="ServerQuerier"} 1' in rendered
+        assert 'test_sent_bytes_total{querier="ServerQuerier"} 25' \
+            in rendered
+        assert 'test_received_bytes_total{querier="ServerQuerier"} 100' \
+            in rendered
+        assert "# TYPE test_response_latency_seconds histogram" in rendered
+        assert ('test_response_latency_seconds_bucket'
+                '{querier="ServerQuerier",le="0.01"} 0') in rendered
+        assert ('test_response_latency_seconds_bucket'
+                '{querier="ServerQuerier",le="0.025"} 1') in rendered
+        assert ('test_response_latency_seconds_bucket'
+                '{querier="ServerQuerier",le="+Inf"} 1') in rendered
+        assert ('test_response_latency_seconds_count'
+                '{querier="ServerQuerier"} 1') in rendered
+        assert ('test_decode_seconds_count'
+                '{message="info",querier="ServerQuerier"} 1') in rendered
+
+    def test_clear(self):
+        aggregator = valve.metrics.Aggregator()
+        aggregator.sent(None, None, 25)
+        aggregator.clear()
+        assert aggregator.counter("requests_total", querier="NoneType") == 0
+
+
+class TestInstrumentation(object):
+
+    def test_server_querier(self, aggregator):
+        with valve.testing.FakeA2SFleet(1, players=2) as fleet:
+            with a2s.ServerQuerier(fleet.addresses[0], timeout=0.5) as server:
+                server.players()
+        labels = {"querier": "ServerQuerier"}
+        assert aggregator.counter("requests_total", **labels) == 2
+        assert aggregator.counter("sent_bytes_total", **labels) == 18
+        assert aggregator.counter("received_bytes_total", **labels) > 0
+        assert aggregator.histogram(
+            "response_latency_seconds", **labels).count == 2
+        assert aggregator.histogram(
+            "decode_seconds", message="players", **labels).count == 2
+
+    def test_server_querier_timeout(self, aggregator):
+        with valve.testing.FakeA2SFleet(1, loss=1.0) as fleet:
+            with a2s.ServerQuerier(fleet.addresses[0], timeout=0.1) as server:
+                with pytest.raises(valve.source.NoResponseError):
+                    server.info()
+        assert aggregator.counter(
+            "timeouts_total", querier="ServerQuerier") == 1
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_master_server(self, aggregator, parallel):
+        addresses = [("192.0.2.{}".format(i), 27015) for i in range(5)]
+        with valve.testing.FakeMasterServer(
+                {master_server.REGION_EUROPE: addresses},
+                page_size=2) as master:
+            with master_server.MasterServerQuerier(
+                    master.address, timeout=0.5, rate_limit=False) as msq:
+                list(msq.find(region="eu", parallel=parallel))
+        labels = {"querier": "MasterServerQuerier"}
+        assert aggregator.counter("requests_total", **labels) == 3
+        assert aggregator.counter("received_bytes_total", **labels) == \
+            3 * 6 + 6 * 6
+        assert aggregator.histogram(
+            "response_latency_seconds", **labels).count == 3
+        assert aggregator.histogram(
+            "decode_seconds", message="addresses", **labels).count == 3
+
+    @pytest.mark.parametrize("parallel", [False, True])
+    def test_master_server_timeout(self, aggregator, parallel):
+        with valve.testing.FakeMasterServer({}, loss=1.0) as master:
+            with master_server.MasterServerQuerier(
+                    master.address, timeout=0.1,
+                    rate_limit=False, retries=0) as msq:
+                list(msq.find(region="eu", parallel=parallel))
+        assert aggregator.counter(
+            "timeouts_total", querier="MasterServerQuerier") == 1
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_rcon(self, aggregator, rcon_server):
+        e_request = rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
+        e_request.respond(
+            1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+        with valve.rcon.RCON(rcon_server.server_address, b"password"):
+            pass
+        labels = {"querier": "RCON"}
+        assert aggregator.counter("requests_total", **labels) == 1
+        assert aggregator.counter("sent_bytes_total", **labels) == 22
+        assert aggregator.counter("received_bytes_total", **labels) == 14
+        assert aggregator.histogram(
+            "response_latency_seconds", **labels).count == 1
+        assert aggregator.histogram(
+            "decode_seconds", message="rcon", **labels).count >= 1
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_rcon_timeout(self, request, aggregator, rcon_server):
+        rcon_server.expect(1, valve.rcon.RCONMessage.Type.AUTH, b"")
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"", 0.5)
+        rcon.connect()
+        request.addfinalizer(rcon.close)
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            rcon.authenticate()
+        assert aggregator.counter("timeouts_total", querier="RCON") == 1
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import struct
+
+import pytest
+
+import valve.source
+from valve.source import messages
+from valve.source import multiplex
+
+
+def _info(server_name):
+    return b"\xFF\xFF\xFF\xFF" + messages.InfoResponse(
+        response_type=0x49,
+        protocol=17,
+        server_name=server_name,
+        map="ctf_2fort",
+        folder="tf",
+        game="Team Fortress",
+        app_id=440,
+        player_count=1,
+        max_players=24,
+        bot_count=0,
+        server_type=100,
+        platform=108,
+        password_protected=0,
+        vac_enabled=1,
+        version="1.0",
+    ).encode()
+
+
+def _challenge(number):
+    return b"\xFF\xFF\xFF\xFF" + messages.GetChallengeResponse(
+        response_type=0x41, challenge=number).encode()
+
+
+def _players(*names):
+    return b"\xFF\xFF\xFF\xFF" + messages.PlayersResponse(
+        response_type=0x44,
+        player_count=len(names),
+        players=[messages.PlayerEntry(index=i, name=name,
+                                      score=0, duration=1.0)
+                 for i, name in enumerate(names)],
+    ).encode()
+
+
+def _split(payload, size):
+    chunks = [payload[i:i + size] for i in range(0, len(payload), size)]
+    return [struct.pack("<lLBBh", -2, 1, len(chunks), i, size) + chunk
+            for i, chunk in enumerate(chunks)]
+
+
+def _info_handler(server_name):
+
+    def handler(request):
+        return [_info(server_name)]
+
+    return handler
+
+
+def _players_handler(*names):
+
+    def handler(request):
+        challenge = struct.unpack("<l", request[5:9])[0]
+        if challenge == -1:
+            return [_challenge(1234)]
+        assert challenge == 1234
+        return [_players(*names)]
+
+    return handler
+
+
+@pytest.yield_fixture
+def querier():
+    querier = multiplex.MultiplexQuerier(timeout=0.5)
+    yield querier
+    querier.close()
+
+
+class TestMultiplexQuerier(object):
+
+    def test_info(self, a2s_server, querier):
+        servers = [a2s_server(_info_handler("Server {}".format(i)))
+                   for i in range(5)]
+        results = list(querier.info(server.address for server in servers))
+        assert len(results) == 5
+        names = {}
+        for result in results:
+            assert result.ok
+            assert result.request == "info"
+            assert result.latency >= 0
+            names[result.address] = result.response["server_name"]
+        assert names == {server.address: "Server {}".format(i)
+                         for i, server in enumerate(servers)}
+        assert not len(querier)
+
+    def test_players_challenge(self, a2s_server, querier):
+        server = a2s_server(_players_handler("foo", "bar"))
+        result, = list(querier.players([server.address]))
+        assert result.ok
+        assert [player["name"] for player in
+                result.response["players"]] == ["foo", "bar"]
+        assert len(server.requests) == 2
+
+    def test_split(self, a2s_server, querier):
+        payload = _info("Split")
+        server = a2s_server(lambda request: _split(payload[4:], 16))
+        result, = list(querier.info([server.address]))
+        assert result.ok
+        assert result.response["server_name"] == "Split"
+
+    def test_timeout(self, a2s_server, querier):
+        silent = a2s_server(lambda request: [])
+        responsive = a2s_server(_info_handler("Alive"))
+        results = {result.address: result for result in
+                   querier.info([silent.address, responsive.address])}
+        assert results[responsive.address].ok
+        assert not results[silent.address].ok
+        assert isinstance(results[silent.address].error,
+                          valve.source.NoResponseError)
+        assert results[silent.address].response is None
+
+    def test_broken_response(self, a2s_server, querier):
+        server = a2s_server(lambda request: [b"\xFF\xFF\xFF\xFF\x00"])
+        result, = list(querier.info([server.address]))
+        assert isinstance(result.error, messages.BrokenMessageError)
+
+    def test_rechallenged(self, a2s_server, querier):
+        server = a2s_server(lambda request: [
+            _challenge(struct.unpack("<l", request[5:9])[0] + 1)])
+        result, = list(querier.players([server.address]))
+        assert isinstance(result.error, messages.BrokenMessageError)
+        assert len(server.requests) == 3
+
+    def test_max_in_flight(self, a2s_server):
+        servers = [a2s_server(_info_handler("Server"))
+                   for i in range(4)]
+        with multiplex.MultiplexQuerier(max_in_flight=1) as querier:
+            in_flight = []
+            for result in querier.info(server.address
+                                       for server in servers):
+                in_flight.append(len(querier))
+            assert max(in_flight) <= 1
+        assert len(in_flight) == 4
+
+    def test_duplicate_address(self, a2s_server, querier):
+        server = a2s_server(_info_handler("Server"))
+        results = list(querier.info([server.address] * 3))
+        assert len(results) == 3
+        assert all(result.ok for result in results)
+        assert len(server.requests) == 3
+
+    def test_sockets(self, a2s_server):
+        servers = [a2s_server(_info_handler("Server"))
+                   for i in range(6)]
+        with multiplex.MultiplexQuerier(sockets=3) as querier:
+            results = list(querier.info(server.address
+                                        for server in servers))
+        assert all(result.ok for result in results)
+        assert len(results) == 6
+
+    def test_submit_poll(self, a2s_server, querier):
+        server = a2s_server(_info_handler("Server"))
+        querier.submit(server.address)
+        assert len(querier) == 1
+        results = []
+        while len(querier):
+            results.extend(querier.poll(timeout=0.1))
+        assert len(results) == 1
+        assert results[0].ok
+
+    def test_submit_invalid_request(self, querier):
+        with pytest.raises(ValueError):
+            querier.submit(("127.0.0.1", 27015), "foo")
+
+    def test_closed(self):
+        querier = multiplex.MultiplexQuerier()
+        querier.close()
+        with pytest.raises(valve.source.QuerierClosedError):
+            querier.submit(("127.0.0.1", 27015))
+        with pytest.raises(valve.source.QuerierClosedError):
+            querier.poll()
+        querier.close()
+
+    def test_invalid_sockets(self):
+        with pytest.raises(ValueError):
+            multiplex.MultiplexQuerier(sockets=0)
+
+    def test_snapshot_partial(self, a2s_server, querier):
+
+        def handler(request):
+            if request[4:5] == b"\x54":
+                return [_info("Partial")]
+            return []
+
+        server = a2s_server(handler)
+        result, = list(querier.snapshot([server.address]))
+        assert not result.ok
+        assert isinstance(result.error, valve.source.NoResponseError)
+        assert result.response.info["server_name"] == "Partial"
+        assert result.response.players is None
+        assert set(result.response.errors) == {"players", "rules"}
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import socket
+import struct
+
+import pytest
+import six
+
+import valve.source
+from valve.source import master_server
+from valve.source import messages
+from valve.source import pipeline
+
+
+def _info(map_, player_count=1):
+    return messages.InfoResponse(
+        response_type=0x49,
+        protocol=17,
+        server_name="Test",
+        map=map_,
+        folder="tf",
+        game="Team Fortress",
+        app_id=440,
+        player_count=player_count,
+        max_players=24,
+        bot_count=0,
+        server_type=100,
+        platform=108,
+        password_protected=0,
+        vac_enabled=1,
+        version="1.0",
+    )
+
+
+def _info_handler(map_):
+
+    def handler(request):
+        return [b"\xFF\xFF\xFF\xFF" + _info(map_).encode()]
+
+    return handler
+
+
+def _master_server_handler(addresses):
+
+    def handler(request):
+        if six.indexbytes(request, 1) != master_server.REGION_EUROPE:
+            return []
+        return [b"\xFF\xFF\xFF\xFF\x66\x0A" + b"".join(
+            socket.inet_aton(host) + struct.pack(">H", port)
+            for host, port in addresses + [("0.0.0.0", 0)])]
+
+    return handler
+
+
+@pytest.fixture
+def servers(a2s_server):
+    return [
+        a2s_server(_info_handler("ctf_2fort")),
+        a2s_server(_info_handler("ctf_2fort")),
+        a2s_server(_info_handler("cp_badlands")),
+        a2s_server(lambda request: []),
+    ]
+
+
+@pytest.yield_fixture
+def msq(a2s_server, servers):
+    server = a2s_server(_master_server_handler(
+        [server.address for server in servers]))
+    msq = master_server.MasterServerQuerier(
+        server.address, timeout=0.5, rate_limit=False, retries=0)
+    yield msq
+    msq.close()
+
+
+def test_discover(msq, servers):
+    results = list(pipeline.discover(msq, region="eu", map="ctf_2fort"))
+    ok = {result.address for result in results if result.ok}
+    failed = [result for result in results if not result.ok]
+    assert ok == {servers[0].address, servers[1].address}
+    assert len(failed) == 1
+    assert failed[0].address == servers[3].address
+    assert isinstance(failed[0].error, valve.source.NoResponseError)
+
+
+def test_where(msq, servers):
+    results = list(pipeline.discover(
+        msq, region="eu",
+        where=lambda info: info["map"].startswith("cp_")))
+    assert {result.address for result in results if result.ok} == \
+        {servers[2].address}
+
+
+def test_players(msq, servers):
+    results = list(pipeline.discover(msq, "players", region="eu"))
+    assert {result.address for result in results} == \
+        {server.address for server in servers}
+    assert all(result.request == "players" for result in results)
+
+
+@pytest.mark.parametrize(("concurrency", "backlog"), [(1, 1), (2, 1)])
+def test_backpressure(msq, servers, concurrency, backlog):
+    results = list(pipeline.discover(
+        msq, region="eu", concurrency=concurrency, backlog=backlog))
+    assert {result.address for result in results} == \
+        {server.address for server in servers}
+
+
+def test_stop_early(msq, servers):
+    results = pipeline.discover(msq, region="eu", backlog=1)
+    next(results)
+    results.close()
+
+
+def test_find_error():
+    msq = pytest.Mock(timeout=0.5)
+    msq.find.side_effect = valve.source.NoResponseError
+    with pytest.raises(valve.source.NoResponseError):
+        list(pipeline.discover(msq))
+
+
+def test_invalid_request(msq):
+    with pytest.raises(ValueError):
+        next(pipeline.discover(msq, "ping"))
+
+
+@pytest.mark.parametrize(("filters", "expected"), [
+    ({}, True),
+    ({"gamedir": "TF"}, True),
+    ({"gamedir": "csgo"}, False),
+    ({"map": "ctf_2fort"}, True),
+    ({"map": "cp_badlands"}, False),
+    ({"secure": True}, True),
+    ({"secure": False}, False),
+    ({"linux": True}, True),
+    ({"empty": True}, True),
+    ({"noplayers": True}, False),
+    ({"noplayers": False}, True),
+    ({"proxy": True}, False),
+    ({"napp": 440}, False),
+    ({"napp": 730}, True),
+    ({"type": "dedicated"}, True),
+    ({"type": "sourcetv"}, False),
+    ({"gametype": ["payload"]}, True),
+    ({"map": "ctf_2fort", "napp": 440}, False),
+])
+def test_matches(filters, expected):
+    info = messages.InfoResponse.decode(_info("ctf_2fort").encode())
+    assert pipeline.matches(info, **filters) is expected
+
+
+def test_matches_empty():
+    info = messages.InfoResponse.decode(_info("ctf_2fort", 0).encode())
+    assert not pipeline.matches(info, empty=True)
+    assert pipeline.matches(info, noplayers=True)
@@ -4,13 +4,18 @@ from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
 import argparse
+import json
+import os
+import socket
 import textwrap
+import threading
 
 import docopt
 import pytest
 import six
 
 import valve.rcon
+import valve.testing
 
 
 class TestRCONMessage(object):
@@ -221,9 +226,9 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate(self, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"password")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"password")
         with rcon as rcon:
             assert rcon.authenticated is True
@@ -236,7 +241,7 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate_wrong_password(self, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"")
         e_request.respond(
             -1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
@@ -249,7 +254,7 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate_banned(self, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"password")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
         e_request.respond_close()
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         with pytest.raises(valve.rcon.RCONAuthenticationError) as exc:
@@ -261,7 +266,7 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_authenticate_timeout(self, request, rcon_server):
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"", 1.5)
         rcon.connect()
         request.addfinalizer(rcon.close)
@@ -271,16 +276,16 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_execute(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
         request.addfinalizer(rcon.close)
         response = rcon.execute("echo hello")
-        assert response.id == 0
+        assert response.id == 1
         assert response.type is response.Type.RESPONSE_VALUE
         assert response.body == b"hello"
         assert isinstance(response.body, six.binary_type)
@@ -300,19 +305,19 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_execute_no_block(self, request, rcon_server):
         e1_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e1_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e1_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e1_request.respond_terminate_multi_part(1)
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
         e2_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e2_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e2_request.respond_terminate_multi_part(0)
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e2_request.respond_terminate_multi_part(2)
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -320,7 +325,7 @@ class TestRCON(object):
         response_1 = rcon.execute("echo hello", block=False)
         response_2 = rcon.execute("echo hello", block=True)
         assert response_1 is None
-        assert response_2.id == 0
+        assert response_2.id == 2
         assert response_2.type is response_2.Type.RESPONSE_VALUE
         assert response_2.body == b"hello"
         assert isinstance(response_2.body, six.binary_type)
@@ -328,9 +333,9 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_execute_timeout(self, request, rcon_server):
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
         rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
         rcon = valve.rcon.RCON(rcon_server.server_address, b"", 1.5)
         rcon.connect()
         rcon._authenticated = True
@@ -338,13 +343,119 @@ class TestRCON(object):
         with pytest.raises(valve.rcon.RCONTimeoutError):
             rcon.execute("")
 
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_timeout_idle(self, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        cpu_start = sum(os.times()[:2])
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            rcon.execute("", timeout=0.5)
+        # Busy polling would use about as much CPU time as the timeout
+        assert sum(os.times()[:2]) - cpu_start < 0.25
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_timeout_late_response(self, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo one")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        e_request = rcon_server.expect(
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo two")
+        e_request.respond(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"one")
+        e_request.respond_terminate_multi_part(1)
+        e_request.respond(
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"two")
+        e_request.respond_terminate_multi_part(2)
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            rcon.execute("echo one", timeout=0.2)
+        response = rcon.execute("echo two")
+        assert response.id == 2
+        assert response.body == b"two"
+        assert rcon._pending == {}
+
+    @pytest.mark.parametrize("window", [1, 2, 32])
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_many(self, request, rcon_server, window):
+        for id_, text in enumerate(["one", "two", "three"], 1):
+            e_request = rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.EXECCOMMAND,
+                "echo " + text)
+            e_request.respond(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, text)
+            rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+                b"").respond_terminate_multi_part(id_)
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        responses = rcon.execute_many(
+            ["echo one", "echo two", "echo three"], window=window)
+        assert rcon._pending == {}
+        first = next(responses)
+        # The window is refilled before the first response is yielded
+        assert len(rcon._pending) == min(window, 2)
+        responses = [first] + list(responses)
+        assert [response.id for response in responses] == [1, 2, 3]
+        assert [response.body for response in responses] == \
+            [b"one", b"two", b"three"]
+        assert rcon._pending == {}
+
+    @pytest.mark.timeout(timeout=3, method="thread")
+    def test_execute_many_stop_early(self, request, rcon_server):
+        for id_ in [1, 2]:
+            e_request = rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo")
+            e_request.respond(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+            rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+                b"").respond_terminate_multi_part(id_)
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        responses = rcon.execute_many(["echo", "echo"])
+        assert next(responses).id == 1
+        responses.close()
+        assert rcon._pending == {}
+
+    def test_execute_many_not_started(self, request, rcon_server):
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        responses = rcon.execute_many(["echo", "echo"])
+        del responses
+        assert rcon._pending == {}
+        assert rcon._sent == {}
+
+    def test_execute_many_bad_window(self, request, rcon_server):
+        rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+        rcon.connect()
+        rcon._authenticated = True
+        request.addfinalizer(rcon.close)
+        with pytest.raises(ValueError):
+            rcon.execute_many(["echo"], window=0)
+
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_call(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -368,10 +479,10 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_call_text_bad(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -390,10 +501,10 @@ class TestRCON(object):
         2345 total convars/concommands
         """)
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, cvarlist)
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, cvarlist)
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -414,10 +525,10 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_cvarlist_text_bad(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"\xFF")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -427,10 +538,10 @@ class TestRCON(object):
     @pytest.mark.timeout(timeout=3, method="thread")
     def test_cvarlist_malformed(self, request, rcon_server):
         e_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"cvarlist")
         e_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"asdf")
-        e_request.respond_terminate_multi_part(0)
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"asdf")
+        e_request.respond_terminate_multi_part(1)
         rcon = valve.rcon.RCON(rcon_server.server_address, b"")
         rcon.connect()
         rcon._authenticated = True
@@ -438,18 +549,393 @@ class TestRCON(object):
         assert list(rcon.cvarlist()) == []
 
 
+def _connection(request, rcon_server):
+    rcon = valve.rcon.RCON(rcon_server.server_address, b"")
+    rcon.connect()
+    rcon._authenticated = True
+    request.addfinalizer(rcon.close)
+    return rcon
+
+
+@pytest.mark.timeout(timeout=3, method="thread")
+class TestRCONSelector(object):
+
+    def test_execute(self, request, rcon_server):
+        e_request = rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+        e_request.respond(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+            b"").respond_terminate_multi_part(1)
+        connections = [_connection(request, rcon_server) for _ in range(3)]
+        selector = valve.rcon.RCONSelector(timeout=1.0)
+        results = list(selector.execute(connections, "echo hello"))
+        assert len(results) == 3
+        assert {result.connection for result in results} == set(connections)
+        for result in results:
+            assert result.ok
+            assert result.command == "echo hello"
+            assert result.response.body == b"hello"
+            assert result.latency >= 0
+            assert result.connection._pending == {}
+        assert len(selector) == 0
+        assert selector._poller._sockets == {}
+
+    def test_submit_many(self, request, rcon_server):
+        for id_, text in enumerate(["one", "two"], 1):
+            e_request = rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.EXECCOMMAND,
+                "echo " + text)
+            e_request.respond(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, text)
+            rcon_server.expect(
+                id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+                b"").respond_terminate_multi_part(id_)
+        connection = _connection(request, rcon_server)
+        selector = valve.rcon.RCONSelector()
+        selector.submit(connection, "echo one")
+        selector.submit(connection, "echo two")
+        assert len(selector) == 2
+        results = []
+        while len(selector):
+            results.extend(selector.poll())
+        assert [result.response.body for result in results] == \
+            [b"one", b"two"]
+
+    def test_timeout(self, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        connection = _connection(request, rcon_server)
+        selector = valve.rcon.RCONSelector(timeout=0.2)
+        result, = selector.execute([connection], "")
+        assert not result.ok
+        assert isinstance(result.error, valve.rcon.RCONTimeoutError)
+        assert result.response is None
+        assert connection._pending == {}
+        assert not connection.closed
+
+    def test_closed(self, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND,
+            b"quit").respond_close()
+        connection = _connection(request, rcon_server)
+        selector = valve.rcon.RCONSelector(timeout=1.0)
+        result, = selector.execute([connection], "quit")
+        assert isinstance(result.error, valve.rcon.RCONCommunicationError)
+        assert connection.closed
+
+    def test_poll_timeout(self, request, rcon_server):
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"")
+        rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        connection = _connection(request, rcon_server)
+        selector = valve.rcon.RCONSelector()
+        selector.submit(connection, "")
+        assert selector.poll(0.1) == []
+        assert len(selector) == 1
+
+    def test_poll_empty(self):
+        assert valve.rcon.RCONSelector().poll() == []
+
+    def test_submit_not_authenticated(self, request, rcon_server):
+        connection = _connection(request, rcon_server)
+        connection._authenticated = False
+        with pytest.raises(valve.rcon.RCONError):
+            valve.rcon.RCONSelector().submit(connection, "")
+
+
+def _expect_auth(rcon_server, password=b"password"):
+    e_request = rcon_server.expect(
+        1, valve.rcon.RCONMessage.Type.AUTH, password)
+    e_request.respond(1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+
+
+def _expect_echo(rcon_server, id_, text):
+    e_request = rcon_server.expect(
+        id_, valve.rcon.RCONMessage.Type.EXECCOMMAND, "echo " + text)
+    e_request.respond(id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, text)
+    rcon_server.expect(
+        id_, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+        b"").respond_terminate_multi_part(id_)
+
+
+@pytest.mark.timeout(timeout=3, method="thread")
+class TestRCONPool(object):
+
+    def test_reuse(self, rcon_server):
+        _expect_auth(rcon_server)
+        _expect_echo(rcon_server, 2, "a")
+        _expect_echo(rcon_server, 3, "b")
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool(check_after=None) as pool:
+            with pool.connection(address, "password") as first:
+                assert first.execute("echo a").text == "a"
+            with pool.connection(address, "password") as second:
+                assert second.execute("echo b").text == "b"
+            assert first is second
+            assert len(pool._servers[address].idle) == 1
+        assert first.closed
+
+    def test_execute(self, rcon_server):
+        _expect_auth(rcon_server)
+        _expect_echo(rcon_server, 2, "a")
+        _expect_echo(rcon_server, 3, "b")
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool(check_after=None) as pool:
+            assert pool.execute(address, "password", "echo a").text == "a"
+            assert pool.execute(address, "password", "echo b").text == "b"
+            assert pool._servers[address].in_use == 0
+
+    def test_check(self, rcon_server):
+        _expect_auth(rcon_server)
+        _expect_echo(rcon_server, 2, "a")
+        e_request = rcon_server.expect(
+            3, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo")
+        e_request.respond(3, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        rcon_server.expect(
+            3, valve.rcon.RCONMessage.Type.RESPONSE_VALUE,
+            b"").respond_terminate_multi_part(3)
+        _expect_echo(rcon_server, 4, "b")
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool(check_after=0, timeout=1.0) as pool:
+            with pool.connection(address, "password") as first:
+                assert first.execute("echo a").text == "a"
+            with pool.connection(address, "password") as second:
+                assert second.execute("echo b").text == "b"
+            assert first is second
+
+    def test_check_failed(self, rcon_server):
+        _expect_auth(rcon_server)
+        _expect_echo(rcon_server, 2, "a")
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool(check_after=0, timeout=1.0) as pool:
+            with pool.connection(address, "password") as first:
+                first.execute("echo a")
+            pool._servers[address].idle[0][0]._socket.shutdown(
+                socket.SHUT_RDWR)
+            with pool.connection(address, "password") as second:
+                assert second.execute("echo a").text == "a"
+            assert first is not second
+            assert first.closed
+
+    def test_reconnect(self, rcon_server):
+        _expect_auth(rcon_server)
+        _expect_echo(rcon_server, 2, "a")
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool(check_after=None, timeout=1.0) as pool:
+            assert pool.execute(address, "password", "echo a").text == "a"
+            first = pool._servers[address].idle[0][0]
+            first._socket.shutdown(socket.SHUT_RDWR)
+            assert pool.execute(address, "password", "echo a").text == "a"
+            assert first.closed
+            assert pool._servers[address].idle[0][0] is not first
+
+    def test_reconnect_retries(self, rcon_server):
+        _expect_auth(rcon_server)
+        rcon_server.expect(
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND,
+            b"quit").respond_close()
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool(retries=2, timeout=1.0) as pool:
+            with pytest.raises(valve.rcon.RCONCommunicationError):
+                pool.execute(address, "password", "quit")
+            assert pool._servers[address].in_use == 0
+            assert not pool._servers[address].idle
+
+    def test_authentication_failed(self, rcon_server):
+        e_request = rcon_server.expect(
+            1, valve.rcon.RCONMessage.Type.AUTH, b"wrong")
+        e_request.respond(-1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool(timeout=1.0) as pool:
+            with pytest.raises(valve.rcon.RCONAuthenticationError):
+                pool.execute(address, "wrong", "echo")
+            assert pool._servers[address].in_use == 0
+
+    def test_connect_failed(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        address = listener.getsockname()
+        listener.close()
+        with valve.rcon.RCONPool(retries=0) as pool:
+            with pytest.raises(valve.rcon.RCONCommunicationError):
+                pool.execute(address, "password", "echo")
+
+    def test_password_changed(self, rcon_server):
+        _expect_auth(rcon_server)
+        address = rcon_server.server_address
+        with valve.rcon.RCONPool() as pool:
+            with pool.connection(address, "password") as first:
+                pass
+            with pytest.raises(valve.rcon.RCONAuthenticationError):
+                with pool.connection(address, "other"):
+                    pass
+            assert first.closed
+
+    def test_max_connections(self, rcon_server):
+        _expect_auth(rcon_server)
+        address = rcon_server.server_address
+        acquired = threading.Event()
+
+        def borrow():
+            with pool.connection(address, "password"):
+                acquired.set()
+
+        with valve.rcon.RCONPool(max_connections=1) as pool:
+            with pool.connection(address, "password") as connection:
+                thread = threading.Thread(target=borrow)
+                thread.start()
+                assert not acquired.wait(0.2)
+            thread.join()
+            assert acquired.is_set()
+            assert pool._servers[address].idle[0][0] is connection
+
+    def test_max_connections_invalid(self):
+        with pytest.raises(ValueError):
+            valve.rcon.RCONPool(max_connections=0)
+
+
+@pytest.yield_fixture
+def rcon_servers():
+    servers = [valve.testing.TestRCONServer() for _ in range(3)]
+    threads = [threading.Thread(target=server.serve_forever,
+                                kwargs={"poll_interval": 0.01})
+               for server in servers]
+    for thread in threads:
+        thread.start()
+    yield servers
+    for server, thread in zip(servers, threads):
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def _closed_address():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    address = listener.getsockname()
+    listener.close()
+    return address
+
+
+@pytest.mark.timeout(timeout=3, method="thread")
+class TestBroadcast(object):
+
+    def test(self, rcon_servers):
+        for server in rcon_servers:
+            _expect_auth(server)
+            _expect_echo(server, 2, "hello")
+        addresses = [server.server_address for server in rcon_servers]
+        results = list(valve.rcon.broadcast(
+            addresses, "password", "echo hello", concurrency=2))
+        assert {result.address for result in results} == set(addresses)
+        for result in results:
+            assert result.ok
+            assert result.command == "echo hello"
+            assert result.response.text == "hello"
+            assert result.latency >= 0
+
+    def test_passwords(self, rcon_servers):
+        passwords = {}
+        for index, server in enumerate(rcon_servers):
+            password = "password{}".format(index)
+            passwords[server.server_address] = password
+            _expect_auth(server, password)
+            _expect_echo(server, 2, "hello")
+        results = list(valve.rcon.broadcast(
+            passwords.keys(), passwords, "echo hello"))
+        assert all(result.ok for result in results)
+
+    def test_missing_password(self):
+        address = _closed_address()
+        result, = valve.rcon.broadcast([address], {}, "echo hello")
+        assert type(result.error) is valve.rcon.RCONError
+        assert str(result.error) == "No password for {0[0]}:{0[1]}".format(
+            address)
+
+    def test_failures(self, rcon_servers):
+        ok, wrong_password, unresponsive = rcon_servers
+        _expect_auth(ok)
+        _expect_echo(ok, 2, "hello")
+        e_request = wrong_password.expect(
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
+        e_request.respond(
+            -1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+        _expect_auth(unresponsive)
+        unresponsive.expect(
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+        unresponsive.expect(
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"")
+        addresses = [server.server_address for server in rcon_servers]
+        addresses.append(_closed_address())
+        report = valve.rcon.BroadcastReport(valve.rcon.broadcast(
+            addresses, "password", "echo hello", timeout=0.5))
+        assert len(report) == 4
+        assert [result.address for result in report.succeeded] == \
+            [ok.server_address]
+        errors = report.errors()
+        assert sorted(errors) == ["RCONAuthenticationError",
+                                  "RCONCommunicationError",
+                                  "RCONTimeoutError"]
+        assert errors["RCONAuthenticationError"][0].address == \
+            wrong_password.server_address
+        assert errors["RCONTimeoutError"][0].address == \
+            unresponsive.server_address
+        assert errors["RCONCommunicationError"][0].address == addresses[-1]
+        summary = report.as_dict()
+        assert summary["total"] == 4
+        assert summary["succeeded"] == 1
+        assert summary["failed"] == 3
+        assert summary["errors"]["RCONAuthenticationError"] == [{
+            "address": "{0[0]}:{0[1]}".format(wrong_password.server_address),
+            "error": "Wrong password",
+        }]
+        json.dumps(summary)
+
+    def test_pool(self, rcon_servers):
+        for server in rcon_servers:
+            _expect_auth(server)
+            _expect_echo(server, 2, "hello")
+        addresses = [server.server_address for server in rcon_servers]
+        with valve.rcon.RCONPool() as pool:
+            results = list(valve.rcon.broadcast(
+                addresses, "password", "echo hello", pool=pool))
+            assert all(result.ok for result in results)
+            assert sorted(pool._servers) == sorted(addresses)
+            for server in pool._servers.values():
+                assert len(server.idle) == 1
+
+    def test_stop_early(self, rcon_servers):
+        for server in rcon_servers:
+            _expect_auth(server)
+            _expect_echo(server, 2, "hello")
+        addresses = [server.server_address for server in rcon_servers]
+        results = valve.rcon.broadcast(
+            addresses, "password", "echo hello", concurrency=1)
+        assert next(results).ok
+        results.close()
+
+    def test_concurrency_invalid(self):
+        with pytest.raises(ValueError):
+            list(valve.rcon.broadcast([], "password", "", concurrency=0))
+
+
 class TestExecute(object):
 
     def test(self, rcon_server):
         e1_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.AUTH, b"password")
+            1, valve.rcon.RCONMessage.Type.AUTH, b"password")
         e1_request.respond(
-            0, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
+            1, valve.rcon.RCONMessage.Type.AUTH_RESPONSE, b"")
         e2_request = rcon_server.expect(
-            0, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
+            2, valve.rcon.RCONMessage.Type.EXECCOMMAND, b"echo hello")
         e2_request.respond(
-            0, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
-        e2_request.respond_terminate_multi_part(0)
+            2, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"hello")
+        e2_request.respond_terminate_multi_part(2)
         response = valve.rcon.execute(
             rcon_server.server_address, "password", "echo hello")
         assert response == "hello"
@@ -585,3 +1071,65 @@ class TestMain(object):
             valve.rcon._main(["-e", "foo"])
         assert not shell.called
         assert not execute.called
+
+
+class TestMainBroadcast(object):
+
+    @pytest.fixture
+    def broadcast(self, monkeypatch):
+        monkeypatch.setattr(valve.rcon, "broadcast", pytest.Mock())
+        valve.rcon.broadcast.return_value = [
+            valve.rcon.BroadcastResult(
+                ("localhost", 9001), "status",
+                valve.rcon.RCONMessage(
+                    1, valve.rcon.RCONMessage.Type.RESPONSE_VALUE, b"up\n"),
+                None, 12.0),
+            valve.rcon.BroadcastResult(
+                ("localhost", 9002), "status", None,
+                valve.rcon.RCONTimeoutError(), 5000.0),
+        ]
+        return valve.rcon.broadcast
+
+    @pytest.fixture
+    def addresses(self, tmpdir):
+        path = tmpdir.join("servers.txt")
+        path.write("# Servers\nlocalhost:9001\n\nlocalhost:9002\n")
+        return str(path)
+
+    def test(self, capsys, broadcast, addresses):
+        status = valve.rcon._main(["-b", addresses, "-p", "password",
+                                   "-e", "status", "-c", "8", "-t", "2.5"])
+        assert status == 1
+        assert broadcast.call_args[0] == (
+            [("localhost", 9001), ("localhost", 9002)], "password", "status")
+        assert broadcast.call_args[1] == {"concurrency": 8, "timeout": 2.5}
+        assert capsys.readouterr()[0].splitlines() == [
+            "[ok] localhost:9001 (12 ms)",
+            "up",
+            "[failed] localhost:9002: RCONTimeoutError",
+            "1 of 2 servers succeeded",
+            "RCONTimeoutError (1): localhost:9002",
+        ]
+
+    def test_json(self, capsys, broadcast, addresses):
+        valve.rcon._main(["-b", addresses, "-p", "password",
+                          "-e", "status", "--json"])
+        assert broadcast.call_args[1] == {"concurrency": 32, "timeout": 5.0}
+        lines = [json.loads(line)
+                 for line in capsys.readouterr()[0].splitlines()]
+        assert lines[0] == {"address": "localhost:9001", "ok": True,
+                            "response": "up\n", "error": None,
+                            "latency": 12.0}
+        assert lines[1]["ok"] is False
+        assert lines[1]["error"] == "RCONTimeoutError"
+        assert lines[2]["report"]["failed"] == 1
+
+    def test_stdin(self, monkeypatch, broadcast):
+        monkeypatch.setattr("sys.stdin", six.StringIO("localhost:9003\n"))
+        valve.rcon._main(["-b", "-", "-p", "password", "-e", "status"])
+        assert broadcast.call_args[0][0] == [("localhost", 9003)]
+
+    def test_no_command(self, broadcast, addresses):
+        with pytest.raises(docopt.DocoptExit):
+            valve.rcon._main(["-b", addresses, "-p", "password"])
+        assert not broadcast.called
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import asyncio
+
+import pytest
+
+import valve.metrics
+import valve.rcon
+import valve.rcon_async
+
+
+Type = valve.rcon.RCONMessage.Type
+
+
+@pytest.yield_fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.yield_fixture
+def rcon(loop, rcon_server):
+    rcon = valve.rcon_async.AsyncRCON(rcon_server.server_address, b"")
+    yield rcon
+    rcon.close()
+    # Let the transport close the socket so the server's handler exits
+    loop.run_until_complete(asyncio.sleep(0))
+
+
+def _connect(loop, rcon):
+    # The server only sees expectations configured before connecting
+    loop.run_until_complete(rcon.connect())
+    rcon._authenticated = True
+
+
+def _expect_command(rcon_server, id_, command, response):
+    e_request = rcon_server.expect(id_, Type.EXECCOMMAND, command)
+    e_request.respond(id_, Type.RESPONSE_VALUE, response)
+    rcon_server.expect(
+        id_, Type.RESPONSE_VALUE, b"").respond_terminate_multi_part(id_)
+
+
+@pytest.mark.timeout(timeout=3, method="thread")
+class TestAsyncRCON(object):
+
+    def test_authenticate(self, loop, rcon_server):
+        e_request = rcon_server.expect(1, Type.AUTH, b"password")
+        e_request.respond(1, Type.RESPONSE_VALUE, b"")
+        e_request.respond(1, Type.AUTH_RESPONSE, b"")
+
+        async def test():
+            async with valve.rcon_async.AsyncRCON(
+                    rcon_server.server_address, b"password") as rcon:
+                return rcon.authenticated
+
+        assert loop.run_until_complete(test()) is True
+
+    def test_authenticate_wrong_password(self, loop, rcon_server):
+        e_request = rcon_server.expect(1, Type.AUTH, b"")
+        e_request.respond(-1, Type.AUTH_RESPONSE, b"")
+        rcon = valve.rcon_async.AsyncRCON(rcon_server.server_address, b"")
+        loop.run_until_complete(rcon.connect())
+        with pytest.raises(valve.rcon.RCONAuthenticationError) as exc:
+            loop.run_until_complete(rcon.authenticate())
+        assert exc.value.banned is False
+        assert rcon.closed
+
+    def test_authenticate_banned(self, loop, rcon_server):
+        rcon_server.expect(1, Type.AUTH, b"").respond_close()
+        rcon = valve.rcon_async.AsyncRCON(rcon_server.server_address, b"")
+        loop.run_until_complete(rcon.connect())
+        with pytest.raises(valve.rcon.RCONAuthenticationError) as exc:
+            loop.run_until_complete(rcon.authenticate())
+        assert exc.value.banned is True
+
+    def test_authenticate_timeout(self, loop, rcon_server):
+        rcon_server.expect(1, Type.AUTH, b"")
+        rcon = valve.rcon_async.AsyncRCON(
+            rcon_server.server_address, b"", 0.2)
+        loop.run_until_complete(rcon.connect())
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            loop.run_until_complete(rcon.authenticate())
+        assert rcon.closed
+
+    def test_execute(self, loop, rcon_server, rcon):
+        _expect_command(rcon_server, 1, b"echo hello", b"hello")
+        _connect(loop, rcon)
+        response = loop.run_until_complete(rcon.execute("echo hello"))
+        assert response.id == 1
+        assert response.type is Type.RESPONSE_VALUE
+        assert response.body == b"hello"
+
+    def test_execute_concurrent(self, loop, rcon_server, rcon):
+        _expect_command(rcon_server, 1, b"echo a", b"a")
+        _expect_command(rcon_server, 2, b"echo b", b"b")
+        _expect_command(rcon_server, 3, b"echo c", b"c")
+        _connect(loop, rcon)
+        responses = loop.run_until_complete(asyncio.gather(
+            *[rcon.execute("echo " + text) for text in "abc"]))
+        assert [response.id for response in responses] == [1, 2, 3]
+        assert [response.body for response in responses] == \
+            [b"a", b"b", b"c"]
+        assert rcon._pending == {}
+
+    def test_execute_not_authenticated(self, loop, rcon):
+        _connect(loop, rcon)
+        rcon._authenticated = False
+        with pytest.raises(valve.rcon.RCONError):
+            loop.run_until_complete(rcon.execute("foo"))
+
+    def test_execute_not_connected(self, loop):
+        rcon = valve.rcon_async.AsyncRCON(("127.0.0.1", 0), b"")
+        with pytest.raises(valve.rcon.RCONError):
+            loop.run_until_complete(rcon.execute("foo"))
+
+    def test_execute_timeout(self, loop, rcon_server, rcon):
+        rcon_server.expect(1, Type.EXECCOMMAND, b"")
+        rcon_server.expect(1, Type.RESPONSE_VALUE, b"")
+        _connect(loop, rcon)
+        with pytest.raises(valve.rcon.RCONTimeoutError):
+            loop.run_until_complete(rcon.execute("", timeout=0.2))
+        assert not rcon.closed
+        assert rcon._pending == {}
+
+    def test_execute_timeout_observed(self, loop, rcon_server, rcon):
+        rcon_server.expect(1, Type.EXECCOMMAND, b"")
+        rcon_server.expect(1, Type.RESPONSE_VALUE, b"")
+        _connect(loop, rcon)
+        observer = valve.metrics.Observer()
+        valve.metrics.add_observer(observer)
+        try:
+            with pytest.raises(valve.rcon.RCONTimeoutError):
+                loop.run_until_complete(rcon.execute("", timeout=0.2))
+        finally:
+            valve.metrics.remove_observer(observer)
+        assert rcon._sent == {}
+
+    def test_execute_closed(self, loop, rcon_server, rcon):
+        rcon_server.expect(1, Type.EXECCOMMAND, b"quit").respond_close()
+        _connect(loop, rcon)
+        with pytest.raises(valve.rcon.RCONCommunicationError):
+            loop.run_until_complete(rcon.execute("quit"))
+        assert rcon.closed
+
+    def test_wait_closed(self, loop, rcon):
+        _connect(loop, rcon)
+        future = loop.create_future()
+        rcon.close()
+        with pytest.raises(valve.rcon.RCONCommunicationError):
+            loop.run_until_complete(rcon._wait(future, 0.2))
+
+    def test_close(self, loop, rcon_server):
+        rcon = valve.rcon_async.AsyncRCON(rcon_server.server_address, b"")
+        loop.run_until_complete(rcon.connect())
+        rcon.close()
+        rcon.close()
+        assert rcon.closed
+        with pytest.raises(valve.rcon.RCONError):
+            loop.run_until_complete(rcon.connect())
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import pytest
+
+import valve.source
+import valve.testing
+from valve.source import a2s
+from valve.source import master_server
+from valve.source import multiplex
+
+
+@pytest.yield_fixture
+def fleet():
+    fleet = valve.testing.FakeA2SFleet(3, players=2)
+    yield fleet
+    fleet.close()
+
+
+class TestFakeA2SFleet(object):
+
+    def test_info(self, fleet):
+        with multiplex.MultiplexQuerier(timeout=0.5) as querier:
+            results = list(querier.info(fleet.addresses))
+        assert all(result.ok for result in results)
+        assert {result.response["server_name"]: result.address
+                for result in results} == {
+            "Server {}".format(index): address
+            for index, address in enumerate(fleet.addresses)}
+        assert fleet.received == fleet.sent == 3
+
+    def test_challenge(self, fleet):
+        with a2s.ServerQuerier(fleet.addresses[0], timeout=0.5) as server:
+            players = server.players()
+            rules = server.rules()
+        assert [player["name"] for player in players["players"]] == \
+            ["Player 0", "Player 1"]
+        assert rules["rules"] == {"sv_fake": "1"}
+        assert fleet.received == 3
+
+    def test_no_challenge(self):
+        with valve.testing.FakeA2SFleet(
+                1, rules={"a": 1, "b": 2}, challenge=False) as fleet:
+            with a2s.ServerQuerier(fleet.addresses[0], timeout=0.5) as server:
+                assert server.rules()["rules"] == {"a": "1", "b": "2"}
+            assert fleet.received == 1
+
+    def test_split(self):
+        with valve.testing.FakeA2SFleet(1, players=10, split=32) as fleet:
+            with a2s.ServerQuerier(fleet.addresses[0], timeout=0.5) as server:
+                assert server.info()["server_name"] == "Server 0"
+                assert server.players()["player_count"] == 10
+            assert fleet.sent > fleet.received
+
+    def test_loss(self):
+        with valve.testing.FakeA2SFleet(1, loss=1.0) as fleet:
+            with a2s.ServerQuerier(fleet.addresses[0], timeout=0.2) as server:
+                with pytest.raises(valve.source.NoResponseError):
+                    server.info()
+            assert fleet.received == fleet.dropped == 1
+            assert fleet.sent == 0
+
+    def test_latency(self):
+        with valve.testing.FakeA2SFleet(1, latency=0.1, jitter=0.05) as fleet:
+            with a2s.ServerQuerier(fleet.addresses[0], timeout=0.5) as server:
+                assert server.ping() >= 100.0
+
+    def test_threads(self, monkeypatch):
+        monkeypatch.setattr(
+            valve.testing.FakeA2SFleet, "SOCKETS_PER_THREAD", 2)
+        with valve.testing.FakeA2SFleet(5) as fleet:
+            assert len(fleet._threads) == 3
+            with multiplex.MultiplexQuerier(timeout=0.5) as querier:
+                results = list(querier.info(fleet.addresses))
+        assert len(results) == 5
+        assert all(result.ok for result in results)
+
+    @pytest.mark.parametrize("kwargs", [
+        {"latency": -1},
+        {"jitter": -1},
+        {"loss": 1.5},
+        {"split": 0},
+    ])
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            valve.testing.FakeA2SFleet(1, **kwargs)
+
+
+class TestFakeMasterServer(object):
+
+    ADDRESSES = [("192.0.2.{}".format(i), 27015) for i in range(5)]
+
+    @pytest.mark.parametrize("page_size", [1, 2, 5, 231])
+    def test_find(self, page_size):
+        with valve.testing.FakeMasterServer(
+                {master_server.REGION_EUROPE: self.ADDRESSES},
+                page_size=page_size) as master:
+            with master_server.MasterServerQuerier(
+                    master.address, timeout=0.5, rate_limit=False) as msq:
+                assert list(msq.find(region="eu")) == self.ADDRESSES
+                assert list(msq.find(region="sa")) == []
+            assert master.received == len(self.ADDRESSES) // page_size + 2
+
+    def test_fleet(self, fleet):
+        with valve.testing.FakeMasterServer(
+                {master_server.REGION_EUROPE: fleet.addresses[:2],
+                 master_server.REGION_ASIA: fleet.addresses[2:]}) as master:
+            with master_server.MasterServerQuerier(
+                    master.address, timeout=0.5, rate_limit=False) as msq:
+                addresses = list(msq.find(region="all", parallel=True))
+        assert sorted(addresses) == sorted(fleet.addresses)
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            valve.testing.FakeMasterServer({}, page_size=0)
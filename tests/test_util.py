@@ -262,3 +262,34 @@ class TestServerType(object):
     ])
     def test_equality_string(self, server_type, other):
         assert server_type == other
+
+
+class TestPackAddress(object):
+
+    @pytest.mark.parametrize(("address", "packed"), [
+        (("0.0.0.0", 0), 0),
+        (("0.0.0.1", 1), 0x000000010001),
+        (("192.0.2.1", 27015), 0xC00002016987),
+        (("255.255.255.255", 65535), 0xFFFFFFFFFFFF),
+    ])
+    def test_round_trip(self, address, packed):
+        assert util.pack_address(*address) == packed
+        unpacked = util.unpack_address(packed)
+        assert unpacked == address
+        assert isinstance(unpacked[0], six.text_type)
+
+    @pytest.mark.parametrize("address", [
+        ("192.0.2", 27015),
+        ("localhost", 27015),
+        ("192.0.2.1", -1),
+        ("192.0.2.1", 65536),
+    ])
+    def test_invalid(self, address):
+        with pytest.raises(ValueError):
+            util.pack_address(*address)
+
+    def test_order(self):
+        addresses = [("10.0.0.2", 1), ("10.0.0.1", 2), ("9.0.0.1", 27015)]
+        assert sorted(addresses, key=lambda address:
+                      util.pack_address(*address)) == [
+            ("9.0.0.1", 27015), ("10.0.0.1", 2), ("10.0.0.2", 1)]
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Instrumentation hooks for queriers and RCON connections.
+
+:class:`valve.source.a2s.ServerQuerier`,
+:class:`valve.source.master_server.MasterServerQuerier` and
+:class:`valve.rcon.RCON` report what they send and receive to any
+registered observers. By default there are no observers, in which case
+the instrumented code doesn't take any measurements at all.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import bisect
+import collections
+import threading
+
+import monotonic
+import six
+
+
+#: The registered observers. This is replaced rather than modified when
+#: observers are added or removed, so it's safe to iterate over whilst
+#: another thread changes it.
+observers = ()
+
+
+def add_observer(observer):
+    """Register an observer to be notified of measurements.
+
+    :param observer: the :class:`Observer` to add.
+    """
+    global observers
+    observers = observers + (observer,)
+
+
+def remove_observer(observer):
+    """Stop notifying an observer of measurements.
+
+    :param observer: the :class:`Observer` to remove.
+
+    :raises ValueError: if the observer isn't registered.
+    """
+    global observers
+    if observer not in observers:
+        raise ValueError("Observer {!r} is not registered".format(observer))
+    observers = tuple(registered for registered in observers
+                      if registered is not observer)
+
+
+def notify(event, *args):
+    """Notify all the observers of a measurement.
+
+    Instrumented code should check that there are :data:`observers`
+    before taking measurements and calling this.
+
+    :param str event: the name of the :class:`Observer` method to call.
+    :param args: the arguments to pass to the method.
+    """
+    for observer in observers:
+        getattr(observer, event)(*args)
+
+
+def timed(source, message, function, *args):
+    """Call a decoding function, timing it if there are any observers.
+
+    :param source: the querier or connection doing the decoding.
+    :param str message: a short name for what's being decoded.
+    :param function: the function to call with the given arguments.
+
+    :returns: the return value of the function.
+    """
+    if not observers:
+        return function(*args)
+    started = monotonic.monotonic()
+    result = function(*args)
+    notify("decoded", source, message,
+           (monotonic.monotonic() - started) * 1000.0)
+    return result
+
+
+class Observer(object):
+    """Receives measurements from queriers and RCON connections.
+
+    Each method is passed the ``source`` of the measurement, which is the
+    querier or connection it was taken from. All the methods do nothing
+    by default, so subclasses need only implement those they're
+    interested in. Observers are called synchronously from whichever
+    thread is using the source, so they should be quick and thread-safe.
+    """
+
+    def sent(self, source, address, size):
+        """Called when a request is sent.
+
+        :param address: the address the request was sent to.
+        :param int size: the size of the request in bytes.
+        """
+
+    def received(self, source, address, size):
+        """Called when data is received.
+
+        For queriers this is called for each datagram received. For RCON
+        connections it's called for each read from the socket.
+
+        :param address: the address the data was received from.
+        :param int size: the number of bytes received.
+        """
+
+    def responded(self, source, address, latency):
+        """Called when a response to a request is received.
+
+        For queriers this is called for each datagram received, including
+        each fragment of split responses. For RCON connections it's called
+        once for each complete response.
+
+        :param address: the address the response was received from.
+        :param float latency: the number of milliseconds since the request
+            was sent. For queriers this is measured from the most recent
+            request.
+        """
+
+    def timed_out(self, source, address):
+        """Called when waiting for a response times out.
+
+        :param address: the address the response was expected from.
+        """
+
+    def decoded(self, source, message, duration):
+        """Called when a response has been decoded.
+
+        :param str message: a short name for what was decoded, such as
+            ``info`` or ``rcon``.
+        :param float duration: the number of milliseconds spent decoding.
+        """
+
+
+class Histogram(object):
+    """Histogram of observed values.
+
+    :param buckets: the upper bounds of the buckets in ascending order.
+        An implicit bucket with no upper bound is always added.
+
+    :ivar counts: the number of observations in each bucket, with the
+        last being for the implicit unbounded bucket. Unlike the rendered
+        Prometheus buckets, these aren't cumulative.
+    :ivar sum: the sum of all the observed values.
+    :ivar count: the number of observations.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record a value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels):
+    return "{" + ",".join('{}="{}"'.format(
+        name, six.text_type(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound is None else repr(float(bound))
+
+
+class Aggregator(Observer):
+    """In-process aggregator of measurements in the style of Prometheus.
+
+    Measurements are labelled by the class name of their source, e.g.
+    ``ServerQuerier``, and can be exported in the Prometheus text format
+    via :meth:`render`:
+
+    .. code-block:: python
+
+        aggregator = valve.metrics.Aggregator()
+        valve.metrics.add_observer(aggregator)
+        with valve.source.a2s.ServerQuerier(address) as server:
+            server.info()
+        print(aggregator.render())
+
+    The following metrics are recorded, each prefixed by the namespace:
+
+    +--------------------------+-----------+--------------------------+
+    | Metric                   | Type      | Labels                   |
+    +==========================+===========+==========================+
+    | requests_total           | counter   | ``querier``              |
+    +--------------------------+-----------+--------------------------+
+    | sent_bytes_total         | counter   | ``querier``              |
+    +--------------------------+-----------+--------------------------+
+    | received_bytes_total     | counter   | ``querier``              |
+    +--------------------------+-----------+--------------------------+
+    | timeouts_total           | counter   | ``querier``              |
+    +--------------------------+-----------+--------------------------+
+    | response_latency_seconds | histogram | ``querier``              |
+    +--------------------------+-----------+--------------------------+
+    | decode_seconds           | histogram | ``querier``, ``message`` |
+    +--------------------------+-----------+--------------------------+
+
+    :param str namespace: the prefix for each metric's name.
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1,
+                       0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    DECODE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+                      0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+    _COUNTERS = (
+        ("requests_total", "Requests sent."),
+        ("sent_bytes_total", "Bytes sent."),
+        ("received_bytes_total", "Bytes received."),
+        ("timeouts_total", "Timeouts waiting for responses."),
+    )
+    _HISTOGRAMS = (
+        ("response_latency_seconds", "Latency of responses to requests."),
+        ("decode_seconds", "Time spent decoding responses."),
+    )
+
+    def __init__(self, namespace="valve"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {name: collections.Counter()
+                          for name, _ in self._COUNTERS}
+        self._histograms = {name: {} for name, _ in self._HISTOGRAMS}
+
+    def _count(self, name, labels, value=1):
+        labels = tuple(sorted(labels))
+        with self._lock:
+            self._counters[name][labels] += value
+
+    def _observe(self, name, labels, value, buckets):
+        labels = tuple(sorted(labels))
+        with self._lock:
+            histograms = self._histograms[name]
+            if labels not in histograms:
+                histograms[labels] = Histogram(buckets)
+            histograms[labels].observe(value)
+
+    @staticmethod
+    def _labels(source):
+        return (("querier", type(source).__name__),)
+
+    def sent(self, source, address, size):
+        labels = self._labels(source)
+        self._count("requests_total", labels)
+        self._count("sent_bytes_total", labels, size)
+
+    def received(self, source, address, size):
+        self._count("received_bytes_total", self._labels(source), size)
+
+    def responded(self, source, address, latency):
+        self._observe("response_latency_seconds", self._labels(source),
+                      latency / 1000.0, self.LATENCY_BUCKETS)
+
+    def timed_out(self, source, address):
+        self._count("timeouts_total", self._labels(source))
+
+    def decoded(self, source, message, duration):
+        self._observe("decode_seconds",
+                      self._labels(source) + (("message", message),),
+                      duration / 1000.0, self.DECODE_BUCKETS)
+
+    def counter(self, name, **labels):
+        """Get the value of a counter.
+
+        :param str name: the name of the counter without the namespace,
+            e.g. ``requests_total``.
+        :param labels: the counter's labels.
+
+        :raises KeyError: if there's no such counter.
+
+        :returns: the counter's value, which is zero if nothing has been
+            counted for the labels yet.
+        """
+        with self._lock:
+            return self._counters[name][tuple(sorted(labels.items()))]
+
+    def histogram(self, name, **labels):
+        """Get a histogram.
+
+        :param str name: the name of the histogram without the namespace,
+            e.g. ``decode_seconds``.
+        :param labels: the histogram's labels.
+
+        :raises KeyError: if there's no such histogram or nothing has been
+            observed for the labels.
+
+        :returns: a copy of the :class:`Histogram`.
+        """
+        with self._lock:
+            histogram = self._histograms[name][tuple(sorted(labels.items()))]
+            copy = Histogram(histogram.buckets)
+            copy.counts = list(histogram.counts)
+            copy.sum = histogram.sum
+            copy.count = histogram.count
+            return copy
+
+    def clear(self):
+        """Reset all the metrics."""
+        with self._lock:
+            for counter in self._counters.values():
+                counter.clear()
+            for histograms in self._histograms.values():
+                histograms.clear()
+
+    def render(self):
+        """Render the metrics in the Prometheus text exposition format.
+
+        :returns: the metrics as a :class:`str`.
+        """
+        lines = []
+        with self._lock:
+            for name, help_ in self._COUNTERS:
+                name_ = "{}_{}".format(self.namespace, name)
+                lines.append("# HELP {} {}".format(name_, help_))
+                lines.append("# TYPE {} counter".format(name_))
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append("{}{} {}".format(
+                        name_, _format_labels(labels), value))
+            for name, help_ in self._HISTOGRAMS:
+                name_ = "{}_{}".format(self.namespace, name)
+                lines.append("# HELP {} {}".format(name_, help_))
+                lines.append("# TYPE {} histogram".format(name_))
+                for labels, histogram in sorted(
+                        self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (None,),
+                                            histogram.counts):
+                        cumulative += count
+                        lines.append("{}_bucket{} {}".format(
+                            name_, _format_labels(
+                                labels + (("le", _format_bound(bound)),)),
+                            cumulative))
+                    lines.append("{}_sum{} {!r}".format(
+                        name_, _format_labels(labels), histogram.sum))
+                    lines.append("{}_count{} {}".format(
+                        name_, _format_labels(labels), histogram.count))
+        lines.append("")
+        return "\n".join(lines)
@@ -8,10 +8,16 @@ from __future__ import (absolute_import,
 import argparse
 import collections
 import cmd
+import contextlib
 import enum
 import functools
 import getpass
+import io
+import heapq
+import itertools
+import json
 import logging
+import math
 import re
 import select
 import shlex
@@ -19,10 +25,14 @@ import socket
 import struct
 import sys
 import textwrap
+import threading
 
 import docopt
 import monotonic
 import six
+from six.moves import queue
+
+from . import metrics
 
 
 log = logging.getLogger(__name__)
@@ -34,6 +44,7 @@ Usage:
   {program}
   {program} ADDRESS [-p PASSWORD]
   {program} ADDRESS -p PASSWORD -e COMMAND
+  {program} -b FILE -p PASSWORD -e COMMAND [-c N] [-t SECONDS] [--json]
 
 Arguments:
   ADDRESS       Address of the server to connect to. If the port number
@@ -45,6 +56,15 @@ Options:
                 Password to use when authenticating with the server.
   -e COMMAND --execute=COMMAND
                 Command to execute on the server.
+  -b FILE --broadcast=FILE
+                Execute the command on every server listed in FILE, one
+                address per line. Use - to read the addresses from stdin.
+  -c N --concurrency=N
+                Number of servers to broadcast to at once. [default: 32]
+  -t SECONDS --timeout=SECONDS
+                Seconds to wait for each server when broadcasting.
+                [default: 5]
+  --json        Print the broadcast results as lines of JSON.
 
 By default this will create a shell for connecting and issuing commands
 to an RCON server. You can either specify the host and password as
@@ -52,6 +72,10 @@ command-line arguments or use the !connect command once the shell as started.
 
 Alternately, if the --execute option is used then the given command will
 be executed and the response printed to stdout.
+
+With --broadcast the command is executed on many servers concurrently.
+The result from each server is printed as it finishes, followed by a
+summary of any failures. The exit status is non-zero if any failed.
 """
 
 
@@ -306,8 +330,85 @@ class _ResponseBuffer(object):
             self._discard_count += 1
 
 
+class _Poller(object):
+    """Waits for sockets to become readable.
+
+    This uses :func:`select.poll` where it's available as
+    :func:`select.select` can't handle file descriptors greater than
+    ``FD_SETSIZE``, which is easily reached when many connections are
+    open. Otherwise it falls back to :func:`select.select`.
+    """
+
+    def __init__(self):
+        self._poll = select.poll() if hasattr(select, "poll") else None
+        self._sockets = {}
+
+    def __len__(self):
+        return len(self._sockets)
+
+    def register(self, socket_):
+        """Start waiting on a socket."""
+        fileno = socket_.fileno()
+        self._sockets[fileno] = socket_
+        if self._poll is not None:
+            self._poll.register(fileno, select.POLLIN)
+
+    def unregister(self, socket_):
+        """Stop waiting on a socket.
+
+        This works even if the socket has since been closed.
+        """
+        for fileno, registered in list(self._sockets.items()):
+            if registered is socket_:
+                del self._sockets[fileno]
+                if self._poll is not None:
+                    self._poll.unregister(fileno)
+
+    def wait(self, timeout):
+        """Wait for any of the sockets to become readable.
+
+        Sockets that are closed or in an error state are also considered
+        readable, as reading them is how the error is found.
+
+        :param timeout: the maximum number of seconds to wait. If ``None``
+            this will wait indefinitely.
+
+        :returns: a list of the readable sockets.
+        """
+        if timeout is not None:
+            timeout = max(timeout, 0)
+        if self._poll is not None:
+            if timeout is not None:
+                # Rounding down could return before the timeout is
+                # reached and result in spinning on a zero timeout.
+                timeout = int(math.ceil(timeout * 1000))
+            return [self._sockets[fileno] for fileno, _
+                    in self._poll.poll(timeout) if fileno in self._sockets]
+        ready, _, _ = select.select(
+            list(self._sockets.values()), [], [], timeout)
+        return ready
+
+
+def _request_ids():
+    """Generate request IDs.
+
+    IDs increase from one and wrap around before overflowing the signed
+    32-bit field, so they never collide with the ``-1`` servers use to
+    signal failed authentication.
+    """
+    while True:
+        for id_ in six.moves.range(1, 2 ** 31):
+            yield id_
+
+
 class RCON(object):
-    """Represents an RCON connection."""
+    """Represents an RCON connection.
+
+    Each request is sent with a new ID and the ID of each response is used
+    to find the request it's for. Responses that nothing is waiting for,
+    such as those for commands that timed out, are dropped rather than
+    being mistaken for the responses to later commands.
+    """
 
     _REGEX_CVARLIST = re.compile(
         r"-{2,}\n(.+?)-{2,}\n", re.MULTILINE | re.DOTALL)
@@ -318,8 +419,13 @@ class RCON(object):
         self._timeout = timeout if timeout else None
         self._authenticated = False
         self._socket = None
+        self._poller = None
         self._closed = False
         self._responses = _ResponseBuffer()
+        self._ids = _request_ids()
+        self._pending = {}
+        self._sent = {}
+        self._authenticating = None
 
     def __enter__(self):
         self.connect()
@@ -368,46 +474,64 @@ class RCON(object):
         """Determine if the connection has been closed."""
         return self._closed
 
-    @staticmethod
-    def _timer(timeout):
-        """Iterable timeout timer.
+    def _send(self, *messages):
+        """Send messages to the server in a single write.
 
-        :param timeout: the number of seconds to wait before timing out.
-            If ``None`` then the timer will never timeout.
-
-        :raises RCONTimeoutError: once the timeout is reached.
-
-        :returns: an iterable that will yield items until the timeout
-            is reached.
+        :param messages: each :class:`RCONMessage` to send.
         """
-        time_start = monotonic.monotonic()
-        while (timeout is None
-               or monotonic.monotonic() - time_start < timeout):
-            yield
-        raise RCONTimeoutError
+        requests = [message.encode() for message in messages]
+        self._socket.sendall(b"".join(requests))
+        if metrics.observers:
+            sent = monotonic.monotonic()
+            for message, request in zip(messages, requests):
+                self._sent.setdefault(message.id, sent)
+                metrics.notify("sent", self, self._address, len(request))
 
     def _request(self, type_, body):
         """Send a request to the server.
 
         This sends an encoded message with the given type and body to the
-        server. The sent message will have an ID of zero.
+        server. The sent message will have a new ID.
 
         :param RCONMessage.Type type_: the type of message to send.
         :param body: the body of the message to send as either a bytestring
             or Unicode string.
+
+        :returns: the ID of the sent message.
         """
-        request = RCONMessage(0, type_, body)
-        self._socket.sendall(request.encode())
+        id_ = next(self._ids)
+        self._send(RCONMessage(id_, type_, body))
+        return id_
 
-    def _read(self):
+    def _command(self, command):
+        """Send a command to the server.
+
+        The command is followed by an empty ``RESPONSE_VALUE`` with the
+        same ID which prompts the server to terminate the multi-part
+        response to the command.
+
+        :param str command: the command to send.
+
+        :returns: the ID of the command.
+        """
+        id_ = next(self._ids)
+        self._send(RCONMessage(id_, RCONMessage.Type.EXECCOMMAND, command),
+                   RCONMessage(id_, RCONMessage.Type.RESPONSE_VALUE, ""))
+        return id_
+
+    def _read(self, timeout=0):
         """Read bytes from the socket into the response buffer.
 
+        Any complete responses are moved into the pending request table.
+
+        :param timeout: the maximum number of seconds to wait for there to
+            be something to read. If ``None`` this will wait indefinitely.
+
         :raises RCONCommunicationError: if the socket is closed by the
             server or for any other unexpected socket-related error. In
             such cases the connection will also be closed.
         """
-        ready, _, _ = select.select([self._socket], [], [], 0)
-        if not ready:
+        if not self._poller.wait(timeout):
             return
         try:
             i_bytes = self._socket.recv(4096)
@@ -417,27 +541,75 @@ class RCON(object):
         if not i_bytes:
             self.close()
             raise RCONCommunicationError
-        self._responses.feed(i_bytes)
+        if metrics.observers:
+            metrics.notify("received", self, self._address, len(i_bytes))
+        metrics.timed(self, "rcon", self._responses.feed, i_bytes)
+        self._collect()
+
+    def _collect(self):
+        """Match complete responses in the buffer to pending requests."""
+        while True:
+            try:
+                response = self._responses.pop()
+            except RCONError:
+                return
+            id_ = response.id
+            if (id_ == -1 and self._authenticating is not None
+                    and response.type is RCONMessage.Type.AUTH_RESPONSE):
+                # Failed authentication is signalled by an ID of -1
+                id_ = self._authenticating
+            sent = self._sent.pop(id_, None)
+            if self._pending.get(id_, True) is not None:
+                log.debug("Dropping unexpected response %r", response)
+                continue
+            self._pending[id_] = response
+            if metrics.observers and sent is not None:
+                metrics.notify("responded", self, self._address,
+                               (monotonic.monotonic() - sent) * 1000.0)
+
+    def _receive(self, id_, timeout):
+        """Receive the response to a request.
 
-    def _receive(self, timeout):
-        """Receive messages from the server.
+        This blocks until the socket is readable or the remaining time
+        runs out, so no CPU time is used whilst waiting. The request must
+        be in the pending request table.
 
-        This will wait up to the configured timeout for a message to be
-        received.
+        :param int id_: the ID of the request.
 
         :raises RCONCommunicationError: if the socket is closed by the
             server or for any other unexpected socket-related error.
-        :raises RCONTimeoutError: if the desired number of messages are
-            not recieved in the configured timeout.
+        :raises RCONTimeoutError: if the response is not received in the
+            configured timeout. The request is removed from the pending
+            request table so the response will be dropped if it arrives
+            later.
 
         :returns: the :class:`RCONMessage` that was received.
         """
-        for _ in self._timer(timeout):
-            self._read()
-            try:
-                return self._responses.pop()
-            except RCONError:
-                continue
+        if timeout is not None:
+            deadline = monotonic.monotonic() + timeout
+        try:
+            while self._pending[id_] is None:
+                if timeout is None:
+                    self._read(None)
+                else:
+                    remaining = deadline - monotonic.monotonic()
+                    if remaining <= 0:
+                        raise RCONTimeoutError
+                    self._read(remaining)
+            return self._pending.pop(id_)
+        except RCONTimeoutError:
+            self._forget(id_)
+            if metrics.observers:
+                metrics.notify("timed_out", self, self._address)
+            raise
+        except RCONCommunicationError:
+            self._forget(id_)
+            raise
+
+    def _forget(self, id_):
+        """Stop waiting for the response to a request."""
+        self._pending.pop(id_, None)
+        self._sent.pop(id_, None)
 
     def _ensure(state, value=True):  # pylint: disable=no-self-argument
         """Decorator to ensure a connection is in a specific state.
@@ -476,11 +648,18 @@ class RCON(object):
     @_ensure('connected', False)
     @_ensure('closed', False)
     def connect(self):
-        """Create a connection to a server."""
+        """Create a connection to a server.
+
+        Connecting is subject to the connection-global timeout.
+        """
         log.debug("Connecting to %s", self._address)
         self._socket = socket.socket(
             socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        self._socket.settimeout(self._timeout)
         self._socket.connect(self._address)
+        self._socket.settimeout(None)
+        self._poller = _Poller()
+        self._poller.register(self._socket)
 
     @_ensure('connected')
     @_ensure('closed', False)
@@ -517,9 +696,11 @@ class RCON(object):
         """
         if timeout is None:
             timeout = self._timeout
-        self._request(RCONMessage.Type.AUTH, self._password)
+        self._authenticating = self._request(
+            RCONMessage.Type.AUTH, self._password)
+        self._pending[self._authenticating] = None
         try:
-            response = self._receive(timeout)
+            response = self._receive(self._authenticating, timeout)
         except RCONCommunicationError:
             raise RCONAuthenticationError(True)
         except RCONTimeoutError:
@@ -534,6 +715,8 @@ class RCON(object):
                 self.close()
                 raise RCONAuthenticationError
             self._authenticated = True
+        finally:
+            self._authenticating = None
 
     def close(self):
         """Close connection to a server."""
@@ -541,6 +724,9 @@ class RCON(object):
             self._socket.close()
             self._closed = True
             self._socket = None
+            self._poller = None
+            self._pending.clear()
+            self._sent.clear()
 
     @_ensure('connected')
     @_ensure('authenticated')
@@ -568,18 +754,98 @@ class RCON(object):
         """
         if timeout is None:
             timeout = self._timeout
-        self._request(RCONMessage.Type.EXECCOMMAND, command)
-        self._request(RCONMessage.Type.RESPONSE_VALUE, "")
+        id_ = self._command(command)
         if block:
-            try:
-                return self._receive(timeout)
-            except RCONTimeoutError:
-                self._responses.discard()
-                raise
+            self._pending[id_] = None
+            return self._receive(id_, timeout)
         else:
-            self._responses.discard()
             self._read()
 
+    @_ensure('connected')
+    @_ensure('authenticated')
+    def execute_many(self, commands, timeout=None, window=32):
+        """Invoke many commands, pipelining the requests.
+
+        Rather than waiting for the response to each command before
+        sending the next, up to ``window`` commands are sent ahead. So
+        executing many commands takes about one round trip plus the time
+        the server spends running them. The window keeps the server from
+        being flooded with more requests than it can respond to before the
+        client reads the responses.
+
+        .. code:: python
+
+            commands = ["sv_cheats 0", "mp_timelimit 30", "users"]
+            for command, response in zip(
+                    commands, rcon.execute_many(commands)):
+                print(command, response.text)
+
+        Nothing is sent until iteration of the returned iterator starts.
+        Responses are then collected as it's consumed. If the iterator is
+        closed early, the responses to any outstanding commands are
+        discarded.
+
+        :param commands: an iterable of commands to execute as strings.
+        :param timeout: the number of seconds to wait for each response.
+            If not given the connection-global timeout is used.
+        :param int window: the maximum number of commands to have sent
+            without having received their responses.
+
+        :raises RCONCommunicationError: if the socket is closed or in any
+            other erroneous state whilst issuing the requests or receiving
+            the responses.
+        :raises RCONTimeoutError: if the timeout is reached waiting for a
+            response. This doesn't close the connection but the responses
+            to the outstanding commands are lost.
+
+        :returns: an iterator of the response to each command as a
+            :class:`RCONMessage`, in the same order as the commands.
+        """
+        if window < 1:
+            raise ValueError("Window must be at least one")
+        if timeout is None:
+            timeout = self._timeout
+        return self._pipelined(iter(commands), window, timeout)
+
+    def _pipeline(self, commands, in_flight, window):
+        """Send commands until the window is full.
+
+        All the commands that fit are sent in a single write.
+        """
+        ids = []
+        requests = []
+        for command in itertools.islice(
+                commands, window - len(in_flight)):
+            id_ = next(self._ids)
+            ids.append(id_)
+            requests.append(
+                RCONMessage(id_, RCONMessage.Type.EXECCOMMAND, command))
+            requests.append(
+                RCONMessage(id_, RCONMessage.Type.RESPONSE_VALUE, ""))
+        if requests:
+            for id_ in ids:
+                self._pending[id_] = None
+            in_flight.extend(ids)
+            self._send(*requests)
+
+    def _pipelined(self, commands, window, timeout):
+        """Yield the responses to pipelined commands in order.
+
+        Requests are only sent once iteration starts, so that an iterator
+        which is never started doesn't leave its requests pending.
+        """
+        in_flight = collections.deque()
+        try:
+            self._pipeline(commands, in_flight, window)
+            while in_flight:
+                response = self._receive(in_flight[0], timeout)
+                in_flight.popleft()
+                self._pipeline(commands, in_flight, window)
+                yield response
+        finally:
+            for id_ in in_flight:
+                self._forget(id_)
+
     def cvarlist(self):
         """Get all ConVars for an RCON connection.
 
@@ -605,6 +871,654 @@ class RCON(object):
     del _ensure
 
 
+class RCONResult(collections.namedtuple(
+        "RCONResult",
+        ("connection", "command", "response", "error", "latency"))):
+    """The outcome of a command executed via :class:`RCONSelector`.
+
+    :ivar connection: the :class:`RCON` connection the command was
+        executed on.
+    :ivar str command: the command that was executed.
+    :ivar response: the response as a :class:`RCONMessage` or ``None`` if
+        the command failed.
+    :ivar error: the exception which caused the command to fail or
+        ``None`` if it was successful. This is either a
+        :exc:`RCONTimeoutError` or :exc:`RCONCommunicationError`.
+    :ivar latency: the number of milliseconds between sending the command
+        and receiving the response.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """Determine if the command was successful."""
+        return self.error is None
+
+
+class _Command(object):
+    """State of a command in progress on a :class:`RCONSelector`."""
+
+    def __init__(self, connection, id_, command, deadline):
+        self.connection = connection
+        self.id = id_
+        self.command = command
+        self.started = monotonic.monotonic()
+        self.deadline = deadline
+
+
+class RCONSelector(object):
+    """Wait for responses on many RCON connections from one thread.
+
+    Commands are started on authenticated :class:`RCON` connections via
+    :meth:`submit` and their results are collected via :meth:`poll` as
+    they complete. A single :func:`select.poll` (or :func:`select.select`)
+    waits on all the connections, so no CPU time is used between
+    responses regardless of the number of connections:
+
+    .. code-block:: python
+
+        selector = valve.rcon.RCONSelector(timeout=5.0)
+        for result in selector.execute(connections, "status"):
+            if result.ok:
+                print(result.connection, result.response.text)
+
+    Multiple commands can be in progress on the same connection at once.
+    Whilst a connection has commands in progress it mustn't be used
+    directly.
+
+    :param timeout: the default number of seconds to wait for the
+        response to each command. If ``None`` it will wait forever.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._poller = _Poller()
+        self._sockets = {}
+        self._connections = {}
+        self._commands = {}
+        self._deadlines = []
+        self._completed = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        """Get the number of commands in progress."""
+        return sum(len(commands) for commands in self._commands.values())
+
+    def _complete(self, command, response=None, error=None):
+        """Finish a command, recording its result."""
+        connection = command.connection
+        commands = self._commands[connection]
+        del commands[command.id]
+        connection._forget(command.id)
+        if not commands:
+            del self._commands[connection]
+            socket_ = self._sockets.pop(connection)
+            del self._connections[socket_]
+            self._poller.unregister(socket_)
+        self._completed.append(RCONResult(
+            connection, command.command, response, error,
+            (monotonic.monotonic() - command.started) * 1000.0))
+
+    def _fail(self, connection, error):
+        """Fail every command in progress on a connection."""
+        for command in list(self._commands[connection].values()):
+            self._complete(command, error=error)
+
+    def submit(self, connection, command, timeout=None):
+        """Start executing a command.
+
+        The result of the command will be returned by a subsequent call
+        to :meth:`poll`. If sending the command fails, the connection is
+        closed and the failure is reported as the result.
+
+        :param connection: the authenticated :class:`RCON` to execute the
+            command on.
+        :param str command: the command to execute.
+        :param timeout: the number of seconds to wait for the response.
+            If not given the selector's timeout is used.
+
+        :raises RCONError: if the connection isn't authenticated.
+        """
+        if not connection.connected or not connection.authenticated:
+            raise RCONError("Must be connected and authenticated")
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None
+        if timeout is not None:
+            deadline = monotonic.monotonic() + timeout
+        try:
+            id_ = connection._command(command)
+        except socket.error as exc:
+            connection.close()
+            self._completed.append(RCONResult(
+                connection, command, None, RCONCommunicationError(exc), 0.0))
+            return
+        connection._pending[id_] = None
+        if connection not in self._commands:
+            self._commands[connection] = collections.OrderedDict()
+            self._sockets[connection] = connection._socket
+            self._connections[connection._socket] = connection
+            self._poller.register(connection._socket)
+        self._commands[connection][id_] = _Command(
+            connection, id_, command, deadline)
+        if deadline is not None:
+            heapq.heappush(self._deadlines,
+                           (deadline, next(self._sequence), connection, id_))
+
+    def _read(self, connection):
+        """Read from a connection and complete any answered commands."""
+        if not connection.connected:
+            self._fail(connection, RCONCommunicationError("Closed"))
+            return
+        try:
+            connection._read()
+        except RCONCommunicationError as exc:
+            self._fail(connection, exc)
+            return
+        for command in list(self._commands[connection].values()):
+            response = connection._pending.get(command.id)
+            if response is not None:
+                self._complete(command, response=response)
+
+    def _expire(self):
+        """Fail all commands whose deadline has passed."""
+        now = monotonic.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, connection, id_ = heapq.heappop(self._deadlines)
+            command = self._commands.get(connection, {}).get(id_)
+            if command is not None:
+                if metrics.observers:
+                    metrics.notify(
+                        "timed_out", connection, connection._address)
+                self._complete(command, error=RCONTimeoutError())
+
+    def _next_deadline(self):
+        """Get the earliest deadline of any command in progress."""
+        while self._deadlines:
+            _, _, connection, id_ = self._deadlines[0]
+            if id_ in self._commands.get(connection, {}):
+                return self._deadlines[0][0]
+            heapq.heappop(self._deadlines)
+        return None
+
+    def poll(self, timeout=None):
+        """Wait for commands to complete.
+
+        This waits until at least one command completes, the given
+        timeout is reached or there are no more commands in progress.
+
+        :param timeout: the maximum number of seconds to wait. If ``None``
+            this will wait until the next command completes.
+
+        :returns: a list of :class:`RCONResult` which may be empty.
+        """
+        if timeout is not None:
+            poll_deadline = monotonic.monotonic() + timeout
+        while not self._completed and self._commands:
+            waits = [self._next_deadline()]
+            if timeout is not None:
+                waits.append(poll_deadline)
+            waits = [wait for wait in waits if wait is not None]
+            wait = None
+            if waits:
+                wait = min(waits) - monotonic.monotonic()
+            for socket_ in self._poller.wait(wait):
+                connection = self._connections.get(socket_)
+                if connection is not None:
+                    self._read(connection)
+            self._expire()
+            if timeout is not None and monotonic.monotonic() >= poll_deadline:
+                break
+        completed = self._completed
+        self._completed = []
+        return completed
+
+    def execute(self, connections, command, timeout=None):
+        """Execute a command on many connections.
+
+        :param connections: an iterable of authenticated :class:`RCON`.
+        :param str command: the command to execute on each connection.
+        :param timeout: the number of seconds to wait for each response.
+            If not given the selector's timeout is used.
+
+        :raises RCONError: if any of the connections aren't authenticated.
+
+        :returns: an iterator of :class:`RCONResult` in the order the
+            commands complete.
+        """
+        for connection in connections:
+            self.submit(connection, command, timeout)
+        while self._completed or self._commands:
+            for result in self.poll():
+                yield result
+
+
+class _PooledServer(object):
+    """Connections to a single server in a :class:`RCONPool`."""
+
+    def __init__(self, lock):
+        self.password = None
+        self.idle = collections.deque()
+        self.in_use = 0
+        self.available = threading.Condition(lock)
+
+
+class RCONPool(object):
+    """Pool of authenticated RCON connections.
+
+    Connecting and authenticating takes a TCP handshake and a round trip,
+    and failed authentication attempts risk the client being banned. The
+    pool keeps authenticated connections to each server open between
+    uses so that these costs are only paid once:
+
+    .. code-block:: python
+
+        with valve.rcon.RCONPool(max_connections=2) as pool:
+            for address in addresses:
+                print(pool.execute(address, password, "status").text)
+
+    Connections which have been idle for ``check_after`` seconds are
+    checked by executing ``check_command`` before they're used. Those
+    that fail are replaced by new connections. If a command fails because
+    the connection was lost it is retried on a new connection, up to
+    ``retries`` times.
+
+    .. note::
+        Retrying a command could run it twice if the connection was lost
+        after the server executed it but before the response was received.
+        Set ``retries`` to zero for commands where that matters.
+
+    The pool is safe to use from multiple threads. At most
+    ``max_connections`` connections are used for each server at once;
+    additional callers wait for a connection to be returned to the pool.
+
+    :param timeout: the default number of seconds to wait for responses
+        on pooled connections. If ``None`` it will wait forever.
+    :param int max_connections: the maximum number of connections to
+        use for each server at once.
+    :param check_after: the number of seconds a connection can be idle
+        before it's checked. If ``None`` connections are never checked.
+    :param str check_command: the command used to check connections.
+    :param int retries: the number of times to retry commands whose
+        connection was lost.
+    """
+
+    def __init__(self, timeout=None, max_connections=2,
+                 check_after=60.0, check_command="echo", retries=1):
+        if max_connections < 1:
+            raise ValueError("Need at least one connection per server")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.check_after = check_after
+        self.check_command = check_command
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, exception, traceback):
+        self.close()
+
+    def close(self):
+        """Close all the idle connections in the pool.
+
+        Connections which are in use are closed when they're returned.
+        """
+        with self._lock:
+            servers = list(self._servers.values())
+            self._servers.clear()
+        for server in servers:
+            while server.idle:
+                server.idle.popleft()[0].close()
+
+    def _acquire(self, address, password):
+        """Reserve a connection slot for a server.
+
+        :returns: a list of idle connections to try using, each as a
+            tuple of the connection and when it was last used. These are
+            removed from the pool.
+        """
+        with self._lock:
+            server = self._servers.get(address)
+            if server is None:
+                server = self._servers[address] = _PooledServer(self._lock)
+            while server.in_use >= self.max_connections:
+                server.available.wait()
+            server.in_use += 1
+            if server.password != password:
+                stale = list(server.idle)
+                server.idle.clear()
+                server.password = password
+            else:
+                stale = []
+            idle = []
+            if server.idle:
+                idle.append(server.idle.pop())
+        for connection, _ in stale:
+            connection.close()
+        return server, idle
+
+    def _release(self, address, server, connection):
+        """Return a connection slot and possibly a connection to the pool.
+
+        :param connection: the connection to return to the pool or
+            ``None`` if it was discarded.
+        """
+        with self._lock:
+            server.in_use -= 1
+            server.available.notify()
+            if (connection is not None
+                    and self._servers.get(address) is server):
+                server.idle.append((connection, monotonic.monotonic()))
+                connection = None
+        if connection is not None:
+            connection.close()
+
+    def _check(self, connection, last_used):
+        """Determine if an idle connection is still usable."""
+        if connection.closed:
+            return False
+        if (self.check_after is None
+                or monotonic.monotonic() - last_used < self.check_after):
+            return True
+        try:
+            connection.execute(self.check_command)
+        except (RCONError, socket.error) as exc:
+            log.debug("Discarding connection to %s: %r",
+                      connection._address, exc)
+            connection.close()
+            return False
+        return True
+
+    def _connect(self, address, password):
+        """Create a new authenticated connection.
+
+        :raises RCONCommunicationError: if a connection couldn't be made.
+        :raises RCONAuthenticationError: if authentication failed.
+        :raises RCONTimeoutError: if authentication timed out.
+        """
+        connection = RCON(address, password, self.timeout)
+        try:
+            connection.connect()
+        except socket.error as exc:
+            connection.close()
+            raise RCONCommunicationError(exc)
+        try:
+            connection.authenticate()
+        except RCONError:
+            connection.close()
+            raise
+        return connection
+
+    @contextlib.contextmanager
+    def connection(self, address, password):
+        """Borrow an authenticated connection to a server.
+
+        The connection is returned to the pool when the context exits,
+        unless it was lost.
+
+        .. code-block:: python
+
+            with pool.connection(address, password) as rcon:
+                rcon.execute("say Restarting")
+                rcon.execute("_restart")
+
+        :param address: the ``(host, port)`` address of the server.
+        :param str password: the RCON password. If it differs from the
+            password used for the server before, the idle connections to
+            the server are closed.
+
+        :raises RCONCommunicationError: if a connection couldn't be made.
+        :raises RCONAuthenticationError: if authentication failed.
+        :raises RCONTimeoutError: if authentication timed out.
+        """
+        server, idle = self._acquire(address, password)
+        connection = None
+        try:
+            for candidate, last_used in idle:
+                if self._check(candidate, last_used):
+                    connection = candidate
+                    break
+            if connection is None:
+                connection = self._connect(address, password)
+            try:
+                yield connection
+            except (RCONCommunicationError, socket.error):
+                connection.close()
+                raise
+        finally:
+            if connection is not None and connection.closed:
+                connection = None
+            self._release(address, server, connection)
+
+    def execute(self, address, password, command, timeout=None):
+        """Execute a command on a server using a pooled connection.
+
+        :param address: the ``(host, port)`` address of the server.
+        :param str password: the RCON password.
+        :param str command: the command to execute.
+        :param timeout: the number of seconds to wait for the response.
+            If not given the pool's timeout is used.
+
+        :raises RCONCommunicationError: if the connection was lost and
+            retrying failed.
+        :raises RCONAuthenticationError: if authentication failed. This
+            isn't retried.
+        :raises RCONTimeoutError: if the timeout is reached waiting for
+            the response.
+
+        :returns: the response to the command as a :class:`RCONMessage`.
+        """
+        for attempt in itertools.count():
+            try:
+                with self.connection(address, password) as connection:
+                    return connection.execute(command, timeout=timeout)
+            except (RCONCommunicationError, socket.error) as exc:
+                if attempt >= self.retries:
+                    if isinstance(exc, RCONCommunicationError):
+                        raise
+                    raise RCONCommunicationError(exc)
+                log.debug("Retrying %r on %s after %r",
+                          command, address, exc)
+
+
+class BroadcastResult(collections.namedtuple(
+        "BroadcastResult",
+        ("address", "command", "response", "error", "latency"))):
+    """The outcome of broadcasting a command to a single server.
+
+    :ivar address: the address of the server as given to :func:`broadcast`.
+    :ivar str command: the command that was executed.
+    :ivar response: the response as a :class:`RCONMessage` or ``None`` if
+        the command failed.
+    :ivar error: the exception which caused the command to fail or
+        ``None`` if it was successful.
+    :ivar latency: the number of milliseconds spent executing the
+        command, including connecting and authenticating if needed.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """Determine if the command was successful."""
+        return self.error is None
+
+
+class BroadcastReport(object):
+    """Summary of the results of a broadcast.
+
+    .. code-block:: python
+
+        report = valve.rcon.BroadcastReport()
+        for result in valve.rcon.broadcast(addresses, password, "status"):
+            report.add(result)
+        print(report.as_dict())
+
+    :ivar succeeded: a list of the successful :class:`BroadcastResult`.
+    :ivar failed: a list of the failed :class:`BroadcastResult`.
+    """
+
+    def __init__(self, results=()):
+        self.succeeded = []
+        self.failed = []
+        for result in results:
+            self.add(result)
+
+    def __len__(self):
+        return len(self.succeeded) + len(self.failed)
+
+    def add(self, result):
+        """Add a result to the report."""
+        if result.ok:
+            self.succeeded.append(result)
+        else:
+            self.failed.append(result)
+
+    def errors(self):
+        """Group the failures by the type of error.
+
+        :returns: a dictionary mapping the names of the exception types
+            to lists of failed :class:`BroadcastResult`.
+        """
+        errors = collections.OrderedDict()
+        for result in self.failed:
+            errors.setdefault(
+                type(result.error).__name__, []).append(result)
+        return errors
+
+    def as_dict(self):
+        """Get the report as a JSON-serialisable dictionary.
+
+        Addresses are formatted as ``host:port``.
+        """
+        return {
+            "total": len(self),
+            "succeeded": len(self.succeeded),
+            "failed": len(self.failed),
+            "errors": {
+                name: [{
+                    "address": "{0[0]}:{0[1]}".format(result.address),
+                    "error": six.text_type(result.error),
+                } for result in results]
+                for name, results in self.errors().items()
+            },
+        }
+
+
+_DONE = object()
+
+
+def _execute_once(address, password, command, timeout):
+    """Execute a command on a new connection which is then closed."""
+    connection = RCON(address, password, timeout)
+    try:
+        connection.connect()
+        connection.authenticate()
+        return connection.execute(command)
+    except socket.error as exc:
+        raise RCONCommunicationError(exc)
+    finally:
+        connection.close()
+
+
+def broadcast(addresses, password, command,
+              concurrency=32, timeout=5.0, pool=None):
+    """Execute a command on many servers concurrently.
+
+    Each server is connected to, authenticated with and has the command
+    executed by one of ``concurrency`` worker threads. Results are yielded
+    as soon as each server finishes, so they're in completion order:
+
+    .. code-block:: python
+
+        for result in valve.rcon.broadcast(
+                addresses, password, "changelevel cp_badlands"):
+            if not result.ok:
+                print(result.address, result.error)
+
+    Addresses are consumed from the iterable lazily. Closing the returned
+    iterator early stops any more servers from being started but waits
+    for those in progress to finish.
+
+    :param addresses: an iterable of ``(host, port)`` addresses.
+    :param password: the RCON password for all the servers, or a
+        dictionary mapping each address to its password. Servers missing
+        from the dictionary fail with :exc:`RCONError`.
+    :param str command: the command to execute.
+    :param int concurrency: the maximum number of servers to execute the
+        command on at once.
+    :param timeout: the number of seconds to wait for the response from
+        each server.
+    :param pool: the :class:`RCONPool` to take connections from. If not
+        given a new connection is made to each server, with the same
+        timeout, and closed once the command has been executed.
+
+    :raises ValueError: if the concurrency is less than one.
+
+    :returns: an iterator of :class:`BroadcastResult`.
+    """
+    if concurrency < 1:
+        raise ValueError("Concurrency must be at least one")
+    addresses = iter(addresses)
+    lock = threading.Lock()
+    stop = threading.Event()
+    results = queue.Queue()
+
+    def work():  # pylint: disable=missing-docstring
+        while not stop.is_set():
+            with lock:
+                address = next(addresses, _DONE)
+            if address is _DONE:
+                break
+            started = monotonic.monotonic()
+            response = None
+            error = None
+            try:
+                if isinstance(password, dict):
+                    try:
+                        server_password = password[tuple(address)]
+                    except KeyError:
+                        raise RCONError(
+                            "No password for {0}:{1}".format(*address))
+                else:
+                    server_password = password
+                if pool is None:
+                    response = _execute_once(
+                        address, server_password, command, timeout)
+                else:
+                    response = pool.execute(
+                        address, server_password, command, timeout=timeout)
+            except Exception as exc:  # pylint: disable=broad-except
+                # Any error is reported against the server, otherwise
+                # the worker would die without reporting it's done.
+                error = exc
+            results.put(BroadcastResult(
+                address, command, response, error,
+                (monotonic.monotonic() - started) * 1000.0))
+        results.put(_DONE)
+
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    try:
+        running = len(workers)
+        while running:
+            result = results.get()
+            if result is _DONE:
+                running -= 1
+            else:
+                yield result
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
 def execute(address, password, command):
     """Execute a command on an RCON server.
 
@@ -921,6 +1835,68 @@ def _parse_address(address):
     return host, port
 
 
+def _describe_error(error):
+    """Get a one-line description of an exception."""
+    message = six.text_type(error)
+    if message:
+        return "{}: {}".format(type(error).__name__, message)
+    return type(error).__name__
+
+
+def _broadcast(path, password, command, concurrency, timeout, json_):
+    """Broadcast a command to the servers listed in a file.
+
+    Blank lines and those starting with ``#`` are ignored.
+
+    :param str path: the path to the file of addresses or ``-`` to read
+        them from stdin.
+    :param bool json_: whether to print the results as JSON.
+
+    :returns: the exit status, which is ``1`` if any server failed.
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with io.open(path) as file_:
+            lines = file_.read().splitlines()
+    addresses = [_parse_address(line.strip()) for line in lines
+                 if line.strip() and not line.strip().startswith("#")]
+    report = BroadcastReport()
+    for result in broadcast(addresses, password, command,
+                            concurrency=concurrency, timeout=timeout):
+        report.add(result)
+        address = "{0[0]}:{0[1]}".format(result.address)
+        text = None
+        if result.ok:
+            text = result.response.body.decode("utf-8", "replace")
+        if json_:
+            print(json.dumps({
+                "address": address,
+                "ok": result.ok,
+                "response": text,
+                "error": (None if result.ok
+                          else _describe_error(result.error)),
+                "latency": round(result.latency, 3),
+            }, sort_keys=True))
+        elif result.ok:
+            print("[ok] {} ({:.0f} ms)".format(address, result.latency))
+            if text.strip():
+                print(text.rstrip("\n"))
+        else:
+            print("[failed] {}: {}".format(
+                address, _describe_error(result.error)))
+    if json_:
+        print(json.dumps({"report": report.as_dict()}, sort_keys=True))
+    else:
+        print("{} of {} servers succeeded".format(
+            len(report.succeeded), len(report)))
+        for name, results in report.errors().items():
+            print("{} ({}): {}".format(name, len(results), ", ".join(
+                "{0[0]}:{0[1]}".format(result.address)
+                for result in results)))
+    return 1 if report.failed else 0
+
+
 def _main(argv=None):
     """RCON client entry-point.
 
@@ -930,9 +1906,14 @@ def _main(argv=None):
     Alternately, if ``--execute`` *is not* given then an RCON shell will be
     spawed via :func:`shell`.
 
+    If ``--broadcast`` is given then the command is executed on all the
+    servers listed in the given file via :func:`broadcast`.
+
     :param argv: command line options.
 
     :raises ValueError: if an invalid ``--address`` is given.
+
+    :returns: the exit status when broadcasting, otherwise ``None``.
     """
     logging.disable(logging.CRITICAL)
     arguments = docopt.docopt(_USAGE.format(program=sys.argv[0]), argv)
@@ -942,6 +1923,11 @@ def _main(argv=None):
         address = _parse_address(arguments["ADDRESS"])
     password = arguments["--password"]
     command = arguments["--execute"]
+    if arguments["--broadcast"] is not None:
+        return _broadcast(arguments["--broadcast"], password, command,
+                          int(arguments["--concurrency"]),
+                          float(arguments["--timeout"]),
+                          arguments["--json"])
     if command is None:
         shell(address, password)
     else:
@@ -949,4 +1935,4 @@ def _main(argv=None):
 
 
 if __name__ == "__main__":
-    _main()
+    sys.exit(_main())
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""asyncio implementation of the RCON protocol.
+
+.. note::
+    This module requires Python 3.5 or later.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import asyncio
+import logging
+
+from . import metrics
+from .rcon import (RCONMessage, RCONError, RCONCommunicationError,
+                   RCONTimeoutError, RCONAuthenticationError,
+                   _ResponseBuffer, _request_ids)
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncRCON(object):
+    """RCON connection for asyncio.
+
+    Unlike :class:`valve.rcon.RCON`, many commands can be in progress on
+    the same connection at once. Each command is sent with a unique
+    request ID and responses are routed back to the coroutine awaiting
+    them by their ID:
+
+    .. code-block:: python
+
+        async with AsyncRCON(address, password) as rcon:
+            status, cvars = await asyncio.gather(
+                rcon.execute("status"), rcon.execute("cvarlist"))
+
+    Responses are read by a background task which is started when the
+    connection is made. Multi-part responses are reassembled in the same
+    way as :class:`valve.rcon.RCON` does, which relies on servers
+    responding to commands in the order they're sent.
+
+    :param address: the ``(host, port)`` address of the server.
+    :param password: the RCON password.
+    :param timeout: the default number of seconds to wait for a response
+        to a request. If ``None`` it will wait forever.
+    """
+
+    def __init__(self, address, password, timeout=None):
+        self._address = address
+        self._password = password
+        self._timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._authenticated = False
+        self._closed = False
+        self._responses = _ResponseBuffer()
+        self._pending = {}
+        self._sent = {}
+        self._authentication = None
+        self._ids = _request_ids()
+
+    async def __aenter__(self):
+        await self.connect()
+        await self.authenticate()
+        return self
+
+    async def __aexit__(self, type_, exception, traceback):
+        self.close()
+
+    @property
+    def connected(self):
+        """Determine if a connection has been made."""
+        return self._writer is not None
+
+    @property
+    def authenticated(self):
+        """Determine if the connection is authenticated."""
+        return self._authenticated
+
+    @property
+    def closed(self):
+        """Determine if the connection has been closed."""
+        return self._closed
+
+    def _ensure(self, connected=True, authenticated=None):
+        if self._closed:
+            raise RCONError("Must not be closed")
+        if self.connected is not connected:
+            raise RCONError("Must {} connected".format(
+                "be" if connected else "not be"))
+        if authenticated is not None \
+                and self._authenticated is not authenticated:
+            raise RCONError("Must {} authenticated".format(
+                "be" if authenticated else "not be"))
+
+    async def connect(self):
+        """Create a connection to the server.
+
+        :raises RCONError: if already connected or closed.
+        :raises RCONCommunicationError: if the connection can't be made.
+        """
+        self._ensure(connected=False)
+        log.debug("Connecting to %s", self._address)
+        try:
+            self._reader, self._writer = \
+                await asyncio.open_connection(*self._address)
+        except OSError as exc:
+            raise RCONCommunicationError(exc) from exc
+        self._read_task = asyncio.ensure_future(self._read_responses())
+
+    def close(self):
+        """Close the connection.
+
+        Any commands waiting for a response fail with
+        :exc:`valve.rcon.RCONCommunicationError`. It is safe to call this
+        multiple times.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._closed = True
+        self._fail(RCONCommunicationError("Connection closed"))
+
+    def _fail(self, error):
+        """Fail all requests waiting for responses."""
+        futures = list(self._pending.values())
+        if self._authentication is not None:
+            futures.append(self._authentication)
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        self._sent.clear()
+
+    def _route(self, message):
+        """Resolve the future waiting for a response."""
+        if message.type is RCONMessage.Type.AUTH_RESPONSE:
+            # Failed authentication is responded to with an ID of -1
+            # so authentication responses can't be matched by ID
+            future = self._authentication
+        else:
+            future = self._pending.pop(message.id, None)
+        sent = self._sent.pop(message.id, None)
+        if future is None or future.done():
+            log.debug("Discarding unexpected message %r", message)
+            return
+        if metrics.observers and sent is not None:
+            metrics.notify("responded", self, self._address,
+                           (asyncio.get_event_loop().time() - sent) * 1000.0)
+        future.set_result(message)
+
+    async def _read_responses(self):
+        """Read responses until the connection is closed."""
+        while True:
+            try:
+                data = await self._reader.read(4096)
+            except OSError as exc:
+                data = b""
+                log.debug("Error reading from %s: %s", self._address, exc)
+            if not data:
+                self._closed = True
+                self._fail(RCONCommunicationError("Connection closed"))
+                return
+            if metrics.observers:
+                metrics.notify("received", self, self._address, len(data))
+            metrics.timed(self, "rcon", self._responses.feed, data)
+            while True:
+                try:
+                    message = self._responses.pop()
+                except RCONError:
+                    break
+                self._route(message)
+
+    def _request(self, type_, body):
+        """Send a request with a new ID.
+
+        :returns: the ID of the request.
+        """
+        id_ = next(self._ids)
+        self._write(RCONMessage(id_, type_, body))
+        return id_
+
+    def _write(self, message):
+        encoded = message.encode()
+        self._writer.write(encoded)
+        if metrics.observers:
+            self._sent.setdefault(
+                message.id, asyncio.get_event_loop().time())
+            metrics.notify("sent", self, self._address, len(encoded))
+
+    async def _wait(self, future, timeout):
+        if timeout is None:
+            timeout = self._timeout
+        # The connection may have been closed whilst another coroutine
+        # was waiting on it, leaving no writer to drain
+        if self._writer is None:
+            raise RCONCommunicationError("Connection closed")
+        await self._writer.drain()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if metrics.observers:
+                metrics.notify("timed_out", self, self._address)
+            raise RCONTimeoutError
+
+    async def authenticate(self, timeout=None):
+        """Authenticate with the server.
+
+        See :meth:`valve.rcon.RCON.authenticate`.
+
+        :param timeout: the number of seconds to wait for a response. If
+            not given the connection-global timeout is used.
+
+        :raises RCONError: if not connected, closed or already
+            authenticated.
+        :raises RCONAuthenticationError: if authentication failed, either
+            due to being banned or providing the wrong password. The
+            connection is closed in this case.
+        :raises RCONTimeoutError: if the server takes too long to respond.
+            The connection will be closed in this case as well.
+        """
+        self._ensure(authenticated=False)
+        self._authentication = asyncio.get_event_loop().create_future()
+        id_ = self._request(RCONMessage.Type.AUTH, self._password)
+        try:
+            response = await self._wait(self._authentication, timeout)
+        except RCONCommunicationError:
+            raise RCONAuthenticationError(True)
+        except RCONTimeoutError:
+            self.close()
+            raise
+        finally:
+            self._authentication = None
+            self._sent.pop(id_, None)
+        # Some servers send an empty RESPONSE_VALUE before the
+        # AUTH_RESPONSE which is left in the multi-part buffer
+        self._responses.clear()
+        if response.id == -1:
+            self.close()
+            raise RCONAuthenticationError
+        self._authenticated = True
+
+    async def execute(self, command, timeout=None):
+        """Invoke a command.
+
+        Commands can be executed concurrently, each waiting for its own
+        response.
+
+        :param str command: the command to execute.
+        :param timeout: the number of seconds to wait for a response. If
+            not given the connection-global timeout is used.
+
+        :raises RCONError: if not connected and authenticated.
+        :raises RCONCommunicationError: if the connection is closed whilst
+            waiting for the response.
+        :raises RCONTimeoutError: if the timeout is reached waiting for a
+            response. This doesn't close the connection but the response
+            is discarded if it arrives later.
+
+        :returns: the response to the command as a
+            :class:`valve.rcon.RCONMessage`.
+        """
+        self._ensure(authenticated=True)
+        future = asyncio.get_event_loop().create_future()
+        id_ = self._request(RCONMessage.Type.EXECCOMMAND, command)
+        self._pending[id_] = future
+        # The empty RESPONSE_VALUE prompts the server to send the
+        # terminator of the multi-part response. It has the same ID so
+        # the terminator is attributed to the same command.
+        self._write(RCONMessage(id_, RCONMessage.Type.RESPONSE_VALUE, b""))
+        try:
+            return await self._wait(future, timeout)
+        finally:
+            self._pending.pop(id_, None)
+            self._sent.pop(id_, None)
@@ -9,8 +9,11 @@ import select
 import socket
 import warnings
 
+import monotonic
 import six
 
+from .. import metrics
+
 
 class NoResponseError(Exception):
     """Raised when a server querier doesn't receive a response."""
@@ -58,6 +61,8 @@ class BaseQuerier(object):
         self.timeout = timeout
         self._contextual = False
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._buffer = None
+        self._sent = None
 
     def __enter__(self):
         self._contextual = True
@@ -105,6 +110,10 @@ class BaseQuerier(object):
         """
         request_final = b"".join(segment.encode() for segment in request)
         self._socket.sendto(request_final, (self.host, self.port))
+        if metrics.observers:
+            self._sent = monotonic.monotonic()
+            metrics.notify("sent", self, (self.host, self.port),
+                           len(request_final))
 
     @_check_open
     def get_response(self):
@@ -116,13 +125,45 @@ class BaseQuerier(object):
 
         :returns: The raw response as a :class:`bytes`.
         """
+        if self._buffer is None:
+            self._buffer = bytearray(65536)
+        size = self.get_response_into(self._buffer)
+        return memoryview(self._buffer)[:size].tobytes()
+
+    @_check_open
+    def get_response_into(self, buffer):
+        """Wait for a response to a request and read it into a buffer.
+
+        Unlike :meth:`get_response` this doesn't allocate a new object
+        for each response, so the same buffer can be reused to receive
+        many responses. If the buffer is too small for a response then
+        it is truncated.
+
+        :param buffer: a writable bytes-like object such as a
+            :class:`bytearray` or :class:`memoryview` to read the
+            response into.
+
+        :raises NoResponseError: If the configured :attr:`timeout` is
+            reached before a response is received.
+        :raises QuerierClosedError: If the querier has been closed.
+
+        :returns: The size of the response in bytes.
+        """
         ready = select.select([self._socket], [], [], self.timeout)
         if not ready[0]:
+            if metrics.observers:
+                metrics.notify("timed_out", self, (self.host, self.port))
             raise NoResponseError("Timed out waiting for response")
         try:
-            data = ready[0][0].recv(65536)
+            size = self._socket.recv_into(buffer)
         except socket.error as exc:
-            six.raise_from(NoResponseError(exc))
-        return data
+            six.raise_from(NoResponseError(exc), exc)
+        if metrics.observers:
+            metrics.notify("received", self, (self.host, self.port), size)
+            if self._sent is not None:
+                metrics.notify(
+                    "responded", self, (self.host, self.port),
+                    (monotonic.monotonic() - self._sent) * 1000.0)
+        return size
 
     del _check_open
@@ -4,16 +4,673 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import bz2
+import sys
+import threading
+import zlib
+
 import monotonic
+import six
 
 import valve.source
+from .. import metrics
 from . import messages
 
 
+# BZ2Decompressor.decompress only accepts max_length from Python 3.5
+_BZ2_MAX_LENGTH = sys.version_info >= (3, 5)
+
+
 # NOTE: backwards compatability; remove soon(tm)
 NoResponseError = valve.source.NoResponseError
 
 
+class ChallengeCache(object):
+    """Cache of challenge numbers issued by servers.
+
+    A2S_PLAYER and A2S_RULES requests must include a challenge number
+    which is obtained by first making the request with a challenge of
+    ``-1``. Servers generally accept the same challenge number for some
+    time, so by remembering it subsequent requests can skip straight to
+    the real request, halving the number of round trips.
+
+    If a cached challenge is no longer valid the server responds with a
+    fresh one, which replaces the stale entry automatically.
+
+    Caches are thread-safe and are intended to be shared between queriers.
+    By default, all queriers use the same module-level cache,
+    :data:`challenge_cache`.
+
+    :param ttl: the number of seconds challenge numbers are remembered
+        for. Setting this to zero effectively disables the cache.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._challenges = {}
+        self._lock = threading.Lock()
+        self._next_prune = monotonic.monotonic() + ttl
+
+    def __len__(self):
+        return len(self._challenges)
+
+    def get(self, address):
+        """Get the challenge number for a server.
+
+        :param address: the ``(host, port)`` address of the server.
+
+        :returns: the challenge number as an integer or ``None`` if there
+            isn't one or it has expired.
+        """
+        address = tuple(address)
+        with self._lock:
+            entry = self._challenges.get(address)
+            if entry is None:
+                return None
+            challenge, expires = entry
+            if monotonic.monotonic() >= expires:
+                del self._challenges[address]
+                return None
+            return challenge
+
+    def set(self, address, challenge):
+        """Remember the challenge number for a server.
+
+        Any existing challenge for the server is replaced.
+
+        :param address: the ``(host, port)`` address of the server.
+        :param int challenge: the challenge number.
+        """
+        now = monotonic.monotonic()
+        with self._lock:
+            self._challenges[tuple(address)] = (challenge, now + self.ttl)
+            if now >= self._next_prune:
+                self._prune(now)
+
+    def invalidate(self, address, challenge=None):
+        """Forget the challenge number for a server.
+
+        It is safe to call this for servers which aren't in the cache.
+
+        :param address: the ``(host, port)`` address of the server.
+        :param int challenge: if given, the challenge number is only
+            forgotten if it's still this one, so that a newer challenge
+            isn't lost.
+        """
+        address = tuple(address)
+        with self._lock:
+            entry = self._challenges.get(address)
+            if entry is not None and challenge in (None, entry[0]):
+                del self._challenges[address]
+
+    def clear(self):
+        """Forget all challenge numbers."""
+        with self._lock:
+            self._challenges.clear()
+
+    def _prune(self, now):
+        """Remove all expired challenges."""
+        for address, (_, expires) in list(self._challenges.items()):
+            if now >= expires:
+                del self._challenges[address]
+        self._next_prune = now + self.ttl
+
+
+#: The challenge cache shared by all queriers by default.
+challenge_cache = ChallengeCache()
+
+
+class _Slab(object):
+    """A region of a :class:`_BufferPool` that datagrams are received into.
+
+    :ivar buffer: the underlying :class:`bytearray`.
+    :ivar offset: the index of the first unused byte of the buffer.
+    :ivar references: the number of received datagrams which are still
+        held.
+    """
+
+    __slots__ = ("buffer", "offset", "references")
+
+    def __init__(self, size):
+        self.buffer = bytearray(size)
+        self.offset = 0
+        self.references = 0
+
+
+class _BufferPool(object):
+    """Preallocated buffers which datagrams are received into.
+
+    Rather than allocating a new :class:`bytes` for every datagram, they
+    are received directly into large, reusable slabs one after the other.
+    Each received datagram is a :class:`memoryview` of the slab, which
+    remains valid until it's :meth:`release`-ed. This allows the fragments
+    of split responses to be held without copying them.
+
+    Once all the datagrams received into a slab have been released, the
+    slab is reused. Typically datagrams are released as soon as they're
+    decoded, so the same region of a single slab is used over and over.
+
+    :param slab_size: the size of each slab in bytes.
+    :param datagram_size: the largest datagram that can be received. A
+        slab must have at least this much space left for it to be
+        received into.
+    :param limit: the maximum number of unused slabs to keep.
+    """
+
+    def __init__(self, slab_size=131072, datagram_size=65536, limit=2):
+        if slab_size < datagram_size:
+            raise ValueError("Slabs must be able to hold a datagram")
+        self.slab_size = slab_size
+        self.datagram_size = datagram_size
+        self.limit = limit
+        self._current = None
+        self._free = []
+
+    def reserve(self):
+        """Get space to receive the next datagram into.
+
+        :returns: a writable :class:`memoryview` of at least
+            ``datagram_size`` bytes. Only the space claimed by a
+            subsequent call to :meth:`claim` is retained, which must be
+            made before any datagram is released.
+        """
+        slab = self._current
+        if (slab is None
+                or len(slab.buffer) - slab.offset < self.datagram_size):
+            if self._free:
+                slab = self._free.pop()
+            else:
+                slab = _Slab(self.slab_size)
+            self._current = slab
+        return memoryview(slab.buffer)[slab.offset:]
+
+    def claim(self, size):
+        """Claim a datagram that was received into the reserved space.
+
+        :param int size: the size of the received datagram.
+
+        :returns: a tuple of the datagram as a :class:`memoryview` and
+            the :class:`_Slab` it was received into, which must be passed
+            to :meth:`release` once the datagram is no longer needed.
+        """
+        slab = self._current
+        view = memoryview(slab.buffer)[slab.offset:slab.offset + size]
+        slab.offset += size
+        slab.references += 1
+        return view, slab
+
+    def release(self, slab):
+        """Release a datagram received into a slab.
+
+        Any views of the datagram must not be used after releasing it.
+
+        :param slab: the :class:`_Slab` returned by :meth:`claim`.
+        """
+        slab.references -= 1
+        if slab.references:
+            return
+        slab.offset = 0
+        if slab is not self._current and len(self._free) < self.limit:
+            self._free.append(slab)
+
+
+def _join(views):
+    """Join a sequence of bytes-like objects into a single :class:`bytes`."""
+    if six.PY2:
+        return b"".join(view.tobytes() for view in views)
+    return b"".join(views)
+
+
+class _FragmentBuffer(object):
+    """Utility class to reassemble split A2S responses.
+
+    Raw datagrams are :meth:`feed`-ed into the buffer as they are received.
+    Responses which aren't split are returned immediately. Otherwise the
+    fragments are held until all of them have arrived, at which point the
+    payloads are joined in order to form the complete response.
+
+    Fragments are grouped by their message ID so that the fragments of
+    multiple split responses may arrive interleaved.
+
+    Fragments are held as views of the datagrams they arrived in, so the
+    complete response is built with a single copy. If the datagrams were
+    received into a :class:`_BufferPool` then the buffer takes ownership
+    of them, releasing them back to the pool once they're no longer
+    needed.
+
+    Compressed responses are supported. The first fragment of such
+    responses carries the size and CRC32 checksum of the decompressed
+    message which are verified once the fragments have been streamed
+    through a bz2 decompressor.
+
+    :param pool: the :class:`_BufferPool` datagrams fed into the buffer
+        are received into, if any.
+    """
+
+    def __init__(self, pool=None):
+        self._pool = pool
+        self._messages = {}
+
+    def clear(self):
+        """Discard the fragments of all incomplete responses."""
+        for fragments in self._messages.values():
+            self._release(fragments.values())
+        self._messages.clear()
+
+    def _release(self, fragments):
+        for _, slab in fragments:
+            if slab is not None:
+                self._pool.release(slab)
+
+    def feed(self, data, slab=None):
+        """Feed a raw datagram into the buffer.
+
+        :param data: the datagram as a bytes-like object.
+        :param slab: the :class:`_Slab` the datagram was received into, as
+            returned by :meth:`_BufferPool.claim`. The datagram will be
+            released by the buffer, so the caller must not use it again.
+
+        :raises valve.source.messages.BrokenMessageError: if the datagram
+            couldn't be decoded or a compressed response couldn't be
+            decompressed or failed verification.
+
+        :returns: the complete response payload as a :class:`bytes` or
+            ``None`` if more fragments are needed.
+        """
+        held = False
+        try:
+            response = messages.Header.decode(memoryview(data))
+            if response["split"] != messages.SPLIT:
+                return response.payload.tobytes()
+            fragment = messages.Fragment.decode(response.payload)
+            fragments = self._messages.setdefault(fragment["message_id"], {})
+            replaced = fragments.get(fragment["fragment_id"])
+            if replaced is not None:
+                self._release([replaced])
+            fragments[fragment["fragment_id"]] = (fragment.payload, slab)
+            held = True
+            if len(fragments) < fragment["fragment_count"]:
+                return None
+            del self._messages[fragment["message_id"]]
+            try:
+                return self._assemble(
+                    [fragments[index][0] for index in sorted(fragments)],
+                    fragment.is_compressed)
+            finally:
+                self._release(fragments.values())
+        finally:
+            if not held and slab is not None:
+                self._pool.release(slab)
+
+    def _assemble(self, payloads, compressed):
+        """Build a complete response from the payloads of its fragments.
+
+        :param payloads: the fragments' payloads in order.
+        :param bool compressed: whether or not the response is compressed.
+
+        :returns: the payload of the response as a :class:`bytes`.
+        """
+        if compressed:
+            payload = self._decompress(payloads)
+        else:
+            # The reassembled payload may begin with the same header as
+            # responses which aren't split. This is stripped from the view
+            # of the first fragment to avoid copying the whole payload.
+            if payloads[0][:4].tobytes() == b"\xFF\xFF\xFF\xFF":
+                payloads[0] = payloads[0][4:]
+            return _join(payloads)
+        if payload.startswith(b"\xFF\xFF\xFF\xFF"):
+            payload = payload[4:]
+        return payload
+
+    def _decompress(self, payloads):
+        """Decompress the payloads of a compressed response.
+
+        :param payloads: the payloads of the response's fragments in order.
+
+        Decompression stops as soon as the output exceeds the expected
+        size, so a small response can't inflate to use excessive memory.
+
+        :raises valve.source.messages.BrokenMessageError: if the
+            decompressed payload is invalid.
+
+        :returns: the decompressed payload as a :class:`bytes`.
+        """
+        compression = messages.FragmentCompressionData.decode(payloads[0])
+        limit = max(compression["decompressed_size"], 0)
+        decompressor = bz2.BZ2Decompressor()
+        chunks = []
+        size = 0
+        crc32 = 0
+        try:
+            for i, payload in enumerate(payloads):
+                data = compression.payload if i == 0 else payload
+                if _BZ2_MAX_LENGTH:
+                    # One byte more than remains is enough to tell if
+                    # the limit is exceeded
+                    chunk = decompressor.decompress(
+                        data, max_length=limit - size + 1)
+                else:
+                    chunk = decompressor.decompress(data)
+                size += len(chunk)
+                if size > limit:
+                    raise messages.BrokenMessageError(
+                        "Decompressed size exceeds expected {}".format(
+                            compression["decompressed_size"]))
+                crc32 = zlib.crc32(chunk, crc32)
+                chunks.append(chunk)
+        except (IOError, OSError, EOFError) as exc:
+            six.raise_from(messages.BrokenMessageError(exc), exc)
+        payload = b"".join(chunks)
+        if len(payload) != compression["decompressed_size"]:
+            raise messages.BrokenMessageError(
+                "Decompressed size {} doesn't match expected {}".format(
+                    len(payload), compression["decompressed_size"]))
+        if crc32 & 0xFFFFFFFF != compression["crc32"]:
+            raise messages.BrokenMessageError(
+                "Checksum of decompressed payload doesn't match")
+        return payload
+
+
+class _Exchange(object):
+    """A single A2S request-response conversation.
+
+    Exchanges encapsulate the request sequence of a query independently
+    from how the requests are actually sent. :meth:`start` returns the
+    initial requests to send. Then each complete response payload is
+    passed to :meth:`feed` which returns any follow-up requests. Once the
+    exchange is :attr:`done` the decoded response is available as
+    :attr:`response`.
+
+    :param address: the address of the server the exchange is with.
+    :param challenges: the :class:`ChallengeCache` to use for exchanges
+        which require a challenge number.
+
+    :cvar name: the name of the exchange's query, used to label metrics.
+    """
+
+    name = None
+
+    def __init__(self, address, challenges):
+        self.address = address
+        self.challenges = challenges
+        self.response = None
+
+    @property
+    def done(self):
+        """Determine if the final response has been received."""
+        return self.response is not None
+
+    def fail(self, error):
+        """Abandon the exchange.
+
+        This is called when the exchange can't be completed, such as when
+        waiting for a response times out. By default it does nothing.
+
+        :param error: the exception which caused the failure.
+        """
+
+    def start(self):
+        """Get the initial requests for the exchange.
+
+        :returns: a list of :class:`valve.source.messages.Message`.
+        """
+        raise NotImplementedError
+
+    def feed(self, payload):
+        """Handle a complete response payload.
+
+        :raises valve.source.messages.BrokenMessageError: if the payload
+            couldn't be decoded.
+
+        :returns: a list of follow-up requests which may be empty.
+        """
+        raise NotImplementedError
+
+
+class _InfoExchange(_Exchange):
+    """A2S_INFO exchange.
+
+    :param bool lazy: whether to decode the response lazily. See
+        :meth:`valve.source.messages.Message.decode`.
+    """
+
+    name = "info"
+
+    def __init__(self, address, challenges, lazy=False):
+        super(_InfoExchange, self).__init__(address, challenges)
+        self.lazy = lazy
+
+    def start(self):
+        return [messages.InfoRequest()]
+
+    def feed(self, payload):
+        self.response = messages.InfoResponse.decode(payload, self.lazy)
+        return []
+
+
+class _ChallengeExchange(_Exchange):
+    """Exchange for requests which require a challenge number.
+
+    If the server's challenge number is cached then the real request is
+    sent straight away. Otherwise the first request is sent with a
+    challenge of ``-1``. In either case, if the server responds with a
+    ``GetChallengeResponse`` then the number it contains is cached and
+    used to repeat the request. A server may issue a new challenge once
+    more in response to that, but if it keeps doing so the exchange fails
+    rather than repeating the request indefinitely.
+
+    Servers ignore requests with a stale challenge number. So if the
+    exchange times out, or fails due to too many challenges, the challenge
+    number it used is forgotten and the next request for the server asks
+    for a new one.
+    """
+
+    request = None
+    response_type = None
+
+    #: The most challenge responses accepted by a single exchange.
+    MAX_CHALLENGES = 2
+
+    def __init__(self, address, challenges):
+        super(_ChallengeExchange, self).__init__(address, challenges)
+        self._challenge = -1
+        self._challenged = 0
+
+    def start(self):
+        # TF2 and L4D2's A2S_SERVERQUERY_GETCHALLENGE doesn't work so
+        # just use A2S_PLAYER or A2S_RULES to get challenge number which
+        # should work fine for all servers
+        challenge = self.challenges.get(self.address)
+        if challenge is None:
+            challenge = -1
+        self._challenge = challenge
+        return [self.request(challenge=challenge)]
+
+    def feed(self, payload):
+        if payload[:1] == b"\x41":
+            self._challenged += 1
+            if self._challenged > self.MAX_CHALLENGES:
+                # Don't leave a challenge cached which the server hasn't
+                # accepted for the next exchange to try again
+                self.challenges.invalidate(self.address, self._challenge)
+                raise messages.BrokenMessageError(
+                    "Server keeps issuing new challenges")
+            challenge = \
+                messages.GetChallengeResponse.decode(payload)["challenge"]
+            self.challenges.set(self.address, challenge)
+            self._challenge = challenge
+            return [self.request(challenge=challenge)]
+        self.response = self.response_type.decode(payload)
+        return []
+
+    def fail(self, error):
+        if (isinstance(error, valve.source.NoResponseError)
+                and self._challenge != -1):
+            self.challenges.invalidate(self.address, self._challenge)
+
+
+class _PlayersExchange(_ChallengeExchange):
+    """A2S_PLAYER exchange."""
+
+    name = "players"
+    request = messages.PlayersRequest
+    response_type = messages.PlayersResponse
+
+
+class _RulesExchange(_ChallengeExchange):
+    """A2S_RULES exchange."""
+
+    name = "rules"
+    request = messages.RulesRequest
+    response_type = messages.RulesResponse
+
+
+class Snapshot(object):
+    """Combined info, players and rules responses for a server.
+
+    Snapshots are returned by :meth:`ServerQuerier.snapshot`. Any of the
+    three sections may be missing if the server didn't respond in time or
+    the response was broken, in which case the section is ``None`` and the
+    cause is recorded in :attr:`errors`.
+
+    :ivar address: the address of the server.
+    :ivar info: the server's :meth:`ServerQuerier.info` response.
+    :ivar players: the server's :meth:`ServerQuerier.players` response.
+    :ivar rules: the server's :meth:`ServerQuerier.rules` response.
+    :ivar dict timings: maps section names to the number of milliseconds
+        between the snapshot starting and the section's response being
+        received. Only successful sections are included.
+    :ivar dict errors: maps section names to the exception that caused
+        the section to fail.
+    """
+
+    SECTIONS = ("info", "players", "rules")
+
+    def __init__(self, address):
+        self.address = address
+        self.info = None
+        self.players = None
+        self.rules = None
+        self.timings = {}
+        self.errors = {}
+
+    def __repr__(self):
+        return "<{0.__class__.__name__} {0.address} {1}>".format(
+            self, ",".join(section for section in self.SECTIONS
+                           if getattr(self, section) is not None) or "empty")
+
+    @property
+    def complete(self):
+        """Determine if all sections were retrieved successfully."""
+        return all(getattr(self, section) is not None
+                   for section in self.SECTIONS)
+
+
+class _SnapshotExchange(_Exchange):
+    """Exchange for all of info, players and rules at once.
+
+    All three requests are sent straight away, using a cached challenge
+    number for the players and rules requests if there is one. When a
+    challenge is received, whichever of the players and rules requests
+    haven't yet been sent with that challenge are repeated with it. As
+    with :class:`_ChallengeExchange`, each section accepts at most
+    :attr:`_ChallengeExchange.MAX_CHALLENGES` challenges; beyond that the
+    section fails rather than being repeated again. Responses are told
+    apart by their type byte.
+    """
+
+    name = "snapshot"
+
+    _RESPONSE_TYPES = {
+        b"\x49": ("info", messages.InfoResponse),
+        b"\x44": ("players", messages.PlayersResponse),
+        b"\x45": ("rules", messages.RulesResponse),
+    }
+
+    def __init__(self, address, challenges):
+        super(_SnapshotExchange, self).__init__(address, challenges)
+        self.response = Snapshot(address)
+        self._requests = {
+            "players": messages.PlayersRequest,
+            "rules": messages.RulesRequest,
+        }
+        self._challenges = {}
+        self._challenged = {section: 0 for section in self._requests}
+        self._started = None
+
+    @property
+    def done(self):
+        return all(section in self.response.timings
+                   or section in self.response.errors
+                   for section in Snapshot.SECTIONS)
+
+    def _pending(self):
+        return [section for section in sorted(self._requests)
+                if section not in self.response.timings
+                and section not in self.response.errors]
+
+    def start(self):
+        self._started = monotonic.monotonic()
+        challenge = self.challenges.get(self.address)
+        if challenge is None:
+            challenge = -1
+        requests = [messages.InfoRequest()]
+        for section in self._pending():
+            self._challenges[section] = challenge
+            requests.append(self._requests[section](challenge=challenge))
+        return requests
+
+    def feed(self, payload):
+        response_type = payload[:1]
+        # See RulesResponse.decode
+        if payload.startswith(b"\xFF\xFF\xFF\xFF"):
+            response_type = payload[4:5]
+        if response_type == b"\x41":
+            challenge = \
+                messages.GetChallengeResponse.decode(payload)["challenge"]
+            self.challenges.set(self.address, challenge)
+            requests = []
+            for section in self._pending():
+                if self._challenges[section] == challenge:
+                    continue
+                self._challenged[section] += 1
+                if (self._challenged[section]
+                        > _ChallengeExchange.MAX_CHALLENGES):
+                    self.response.errors[section] = \
+                        messages.BrokenMessageError(
+                            "Server keeps issuing new challenges")
+                    self.challenges.invalidate(self.address, challenge)
+                    continue
+                self._challenges[section] = challenge
+                requests.append(self._requests[section](challenge=challenge))
+            return requests
+        if response_type not in self._RESPONSE_TYPES:
+            raise messages.BrokenMessageError(
+                "Unexpected response type {!r}".format(response_type))
+        section, response_class = self._RESPONSE_TYPES[response_type]
+        try:
+            setattr(self.response, section, response_class.decode(payload))
+        except messages.BrokenMessageError as exc:
+            self.response.errors[section] = exc
+        else:
+            self.response.errors.pop(section, None)
+            self.response.timings[section] = \
+                (monotonic.monotonic() - self._started) * 1000.0
+        return []
+
+    def fail(self, error):
+        for section in Snapshot.SECTIONS:
+            if (section not in self.response.timings
+                    and section not in self.response.errors):
+                self.response.errors[section] = error
+                # See _ChallengeExchange.fail
+                challenge = self._challenges.get(section, -1)
+                if (isinstance(error, valve.source.NoResponseError)
+                        and challenge != -1):
+                    self.challenges.invalidate(self.address, challenge)
+
+
 class ServerQuerier(valve.source.BaseQuerier):
     """Implements the A2S Source server query protocol.
 
@@ -22,16 +679,25 @@ class ServerQuerier(valve.source.BaseQuerier):
     .. note::
         Instantiating this class creates a socket. Be sure to close the
         querier once finished with it. See :class:`valve.source.BaseQuerier`.
+
+    :param challenges: the :class:`ChallengeCache` to use for
+        :meth:`players` and :meth:`rules`. If not given the shared
+        :data:`challenge_cache` is used.
     """
 
+    def __init__(self, address, timeout=5.0, challenges=None):
+        super(ServerQuerier, self).__init__(address, timeout)
+        if challenges is None:
+            challenges = challenge_cache
+        self.challenges = challenges
+        self._buffers = _BufferPool()
+
     def request(self, request):
         super(ServerQuerier, self).request(
             messages.Header(split=messages.NO_SPLIT), request)
 
     def get_response(self):
 
-        data = valve.source.BaseQuerier.get_response(self)
-
         # According to https://developer.valvesoftware.com/wiki/Server_queries
         # "TF2 currently does not split replies, expect A2S_PLAYER and
         # A2S_RULES to be simply cut off after 1260 bytes."
@@ -41,21 +707,49 @@ class ServerQuerier(valve.source.BaseQuerier):
         # warning means that only one fragment of the message is sent
         # or that the warning is no longer valid.
 
-        response = messages.Header().decode(data)
-        if response["split"] == messages.SPLIT:
-            fragments = {}
-            fragment = messages.Fragment.decode(response.payload)
-            if fragment.is_compressed:
-                raise NotImplementedError("Fragments are compressed")
-            fragments[fragment["fragment_id"]] = fragment
-            while len(fragments) < fragment["fragment_count"]:
-                data = valve.source.BaseQuerier.get_response(self)
-                fragment = messages.Fragment.decode(
-                    messages.Header.decode(data).payload)
-                fragments[fragment["fragment_id"]] = fragment
-            return b"".join([frag[1].payload for frag in
-                            sorted(fragments.items(), key=lambda f: f[0])])
-        return response.payload
+        fragments = _FragmentBuffer(self._buffers)
+        try:
+            return self._reassemble(fragments)
+        finally:
+            fragments.clear()
+
+    def _reassemble(self, fragments):
+        """Receive datagrams until a complete response is assembled.
+
+        Datagrams are received directly into the querier's buffer pool.
+
+        :param fragments: the :class:`_FragmentBuffer` to feed datagrams to.
+
+        :returns: the complete response payload as a :class:`bytes`.
+        """
+        payload = None
+        while payload is None:
+            size = self.get_response_into(self._buffers.reserve())
+            payload = fragments.feed(*self._buffers.claim(size))
+        return payload
+
+    def _converse(self, exchange):
+        """Drive an exchange to completion over the querier's socket.
+
+        A single fragment buffer is used for the whole exchange as the
+        fragments of concurrent responses may be interleaved.
+
+        :returns: the final decoded response of the exchange.
+        """
+        fragments = _FragmentBuffer(self._buffers)
+        requests = exchange.start()
+        try:
+            while not exchange.done:
+                for request in requests:
+                    self.request(request)
+                requests = metrics.timed(self, exchange.name, exchange.feed,
+                                         self._reassemble(fragments))
+        except valve.source.NoResponseError as exc:
+            exchange.fail(exc)
+            raise
+        finally:
+            fragments.clear()
+        return exchange.response
 
     def ping(self):
         """Ping the server, returning the round-trip latency in milliseconds
@@ -67,11 +761,12 @@ class ServerQuerier(valve.source.BaseQuerier):
 
         time_sent = monotonic.monotonic()
         self.request(messages.InfoRequest())
-        messages.InfoResponse.decode(self.get_response())
+        metrics.timed(self, "info",
+                      messages.InfoResponse.decode, self.get_response())
         time_received = monotonic.monotonic()
         return (time_received - time_sent) * 1000.0
 
-    def info(self):
+    def info(self, lazy=False):
         """Retreive information about the server state
 
         This returns the response from the server which implements
@@ -82,6 +777,15 @@ class ServerQuerier(valve.source.BaseQuerier):
             with ServerQuerier(...) as server:
                 print(server.info()["server_name"])
 
+        If only a few fields are needed, the response can be decoded
+        lazily so that each field is only decoded when it's accessed:
+
+        .. code:: python
+
+            with ServerQuerier(...) as server:
+                info = server.info(lazy=True)
+                print(info["player_count"], info["max_players"])
+
         The following fields are available on the response:
 
         +--------------------+------------------------------------------------+
@@ -134,10 +838,13 @@ class ServerQuerier(valve.source.BaseQuerier):
         +--------------------+------------------------------------------------+
 
         Currently the *extra data field* (EDF) is not supported.
+
+        :param bool lazy: whether to decode the response lazily. See
+            :meth:`valve.source.messages.Message.decode`.
         """
 
-        self.request(messages.InfoRequest())
-        return messages.InfoResponse.decode(self.get_response())
+        return self._converse(
+            _InfoExchange((self.host, self.port), self.challenges, lazy))
 
     def players(self):
         """Retrive a list of all players connected to the server
@@ -191,13 +898,8 @@ class ServerQuerier(valve.source.BaseQuerier):
                     player_count = len(players)
         """
 
-        # TF2 and L4D2's A2S_SERVERQUERY_GETCHALLENGE doesn't work so
-        # just use A2S_PLAYER to get challenge number which should work
-        # fine for all servers
-        self.request(messages.PlayersRequest(challenge=-1))
-        challenge = messages.GetChallengeResponse.decode(self.get_response())
-        self.request(messages.PlayersRequest(challenge=challenge["challenge"]))
-        return messages.PlayersResponse.decode(self.get_response())
+        return self._converse(
+            _PlayersExchange((self.host, self.port), self.challenges))
 
     def rules(self):
         """Retreive the server's game mode configuration
@@ -222,7 +924,27 @@ class ServerQuerier(valve.source.BaseQuerier):
         +--------------------+------------------------------------------------+
         """
 
-        self.request(messages.RulesRequest(challenge=-1))
-        challenge = messages.GetChallengeResponse.decode(self.get_response())
-        self.request(messages.RulesRequest(challenge=challenge["challenge"]))
-        return messages.RulesResponse.decode(self.get_response())
+        return self._converse(
+            _RulesExchange((self.host, self.port), self.challenges))
+
+    def snapshot(self):
+        """Retrieve the server's info, players and rules all at once.
+
+        Rather than making each request in turn, which takes five round
+        trips, the info request and both challenge requests are sent
+        together. The real players and rules requests follow as soon as
+        the challenge arrives. A complete snapshot therefore takes about
+        two round trips, or one if the server's challenge number is
+        already cached.
+
+        If the server doesn't respond to some of the requests in time the
+        other sections are still returned. Check :attr:`Snapshot.errors`
+        for the sections which are missing.
+
+        :returns: a :class:`Snapshot` of the server.
+        """
+        exchange = _SnapshotExchange((self.host, self.port), self.challenges)
+        try:
+            return self._converse(exchange)
+        except valve.source.NoResponseError:
+            return exchange.response
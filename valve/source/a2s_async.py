@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""asyncio implementation of the A2S server query protocol.
+
+.. note::
+    This module requires Python 3.5 or later.
+"""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import asyncio
+
+import valve.source
+from . import a2s
+from . import messages
+from . import multiplex
+
+
+class _QuerierProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol which queues received datagrams."""
+
+    def __init__(self):
+        self.datagrams = asyncio.Queue()
+        self.error = None
+
+    def datagram_received(self, data, address):
+        self.datagrams.put_nowait(data)
+
+    def error_received(self, exc):
+        self.error = exc
+
+
+class AsyncServerQuerier(object):
+    """Implements the A2S Source server query protocol for asyncio.
+
+    This provides the same queries as :class:`valve.source.a2s.ServerQuerier`
+    but as coroutines which don't block the event loop:
+
+    .. code-block:: python
+
+        async with AsyncServerQuerier(address) as server:
+            info = await server.info()
+
+    The underlying datagram endpoint is created when the first request
+    is made. Be sure to :meth:`close` the querier once finished with it,
+    or use it as an asynchronous context manager.
+
+    :ivar host: Host requests will be sent to.
+    :ivar port: Port number requests will be sent to.
+    :ivar timeout: How long to wait for a response to a request.
+    :ivar challenges: The :class:`valve.source.a2s.ChallengeCache` used
+        for :meth:`players` and :meth:`rules`. By default this is the
+        shared :data:`valve.source.a2s.challenge_cache`.
+    """
+
+    def __init__(self, address, timeout=5.0, challenges=None):
+        self.host = address[0]
+        self.port = address[1]
+        self.timeout = timeout
+        if challenges is None:
+            challenges = a2s.challenge_cache
+        self.challenges = challenges
+        self._transport = None
+        self._protocol = None
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type_, exception, traceback):
+        self.close()
+
+    def close(self):
+        """Close the querier's transport.
+
+        It is safe to call this multiple times.
+        """
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self._closed = True
+
+    async def _connect(self):
+        if self._closed:
+            raise valve.source.QuerierClosedError
+        if self._transport is None:
+            loop = asyncio.get_event_loop()
+            try:
+                self._transport, self._protocol = \
+                    await loop.create_datagram_endpoint(
+                        _QuerierProtocol, remote_addr=(self.host, self.port))
+            except OSError as exc:
+                raise valve.source.NoResponseError(exc) from exc
+
+    async def request(self, request):
+        """Issue a request.
+
+        :param request: the request message to send.
+        :type request: valve.source.messages.Message
+
+        :raises QuerierClosedError: If the querier has been closed.
+        """
+        await self._connect()
+        self._transport.sendto(
+            messages.Header(split=messages.NO_SPLIT).encode()
+            + request.encode())
+
+    async def get_response(self):
+        """Wait for a response to a request.
+
+        Split responses are reassembled before being returned.
+
+        :raises NoResponseError: If the configured :attr:`timeout` is
+            reached before a response is received.
+        :raises QuerierClosedError: If the querier has been closed.
+
+        :returns: The response payload as a :class:`bytes`.
+        """
+        await self._connect()
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.timeout
+        fragments = a2s._FragmentBuffer()
+        payload = None
+        while payload is None:
+            if self._protocol.error is not None:
+                error, self._protocol.error = self._protocol.error, None
+                raise valve.source.NoResponseError(error)
+            try:
+                data = await asyncio.wait_for(
+                    self._protocol.datagrams.get(),
+                    max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                raise valve.source.NoResponseError(
+                    "Timed out waiting for response")
+            payload = fragments.feed(data)
+        return payload
+
+    async def _converse(self, exchange):
+        requests = exchange.start()
+        try:
+            while not exchange.done:
+                for request in requests:
+                    await self.request(request)
+                requests = exchange.feed(await self.get_response())
+        except valve.source.NoResponseError as exc:
+            exchange.fail(exc)
+            raise
+        return exchange.response
+
+    async def ping(self):
+        """Ping the server, returning the round-trip latency in milliseconds.
+
+        See :meth:`valve.source.a2s.ServerQuerier.ping`.
+        """
+        loop = asyncio.get_event_loop()
+        time_sent = loop.time()
+        await self.request(messages.InfoRequest())
+        messages.InfoResponse.decode(await self.get_response())
+        return (loop.time() - time_sent) * 1000.0
+
+    async def info(self):
+        """Retrieve information about the server state.
+
+        See :meth:`valve.source.a2s.ServerQuerier.info`.
+        """
+        return await self._converse(a2s._InfoExchange(
+            (self.host, self.port), self.challenges))
+
+    async def players(self):
+        """Retrieve a list of all players connected to the server.
+
+        See :meth:`valve.source.a2s.ServerQuerier.players`.
+        """
+        return await self._converse(a2s._PlayersExchange(
+            (self.host, self.port), self.challenges))
+
+    async def rules(self):
+        """Retrieve the server's game mode configuration.
+
+        See :meth:`valve.source.a2s.ServerQuerier.rules`.
+        """
+        return await self._converse(a2s._RulesExchange(
+            (self.host, self.port), self.challenges))
+
+
+async def query(addresses, request="info", concurrency=256, timeout=5.0):
+    """Query many servers concurrently.
+
+    Each server is queried with its own :class:`AsyncServerQuerier`, but
+    no more than ``concurrency`` queries are in progress at any one time.
+    Failures are reported in the results rather than raised.
+
+    .. code-block:: python
+
+        results = await query(addresses, "info", concurrency=500)
+        for result in results:
+            if result.ok:
+                print(result.response["server_name"])
+
+    :param addresses: an iterable of ``(host, port)`` addresses.
+    :param str request: the query to make: ``info``, ``players``, ``rules``
+        or ``ping``.
+    :param concurrency: the maximum number of queries in progress.
+    :param timeout: the timeout used for each querier.
+
+    :raises ValueError: if the request type is not valid.
+
+    :returns: a list of :class:`valve.source.multiplex.Result` in the
+        same order as the given addresses.
+    """
+    if request not in {"info", "players", "rules", "ping"}:
+        raise ValueError("Invalid request type {!r}".format(request))
+    semaphore = asyncio.BoundedSemaphore(concurrency)
+    loop = asyncio.get_event_loop()
+
+    async def query_one(address):
+        async with semaphore:
+            time_start = loop.time()
+            response = error = None
+            async with AsyncServerQuerier(address, timeout) as querier:
+                try:
+                    response = await getattr(querier, request)()
+                except (valve.source.NoResponseError,
+                        messages.BrokenMessageError) as exc:
+                    error = exc
+            return multiplex.Result(address, request, response, error,
+                                    (loop.time() - time_start) * 1000.0)
+
+    return await asyncio.gather(*[query_one(address)
+                                  for address in addresses])
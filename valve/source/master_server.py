@@ -4,12 +4,26 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import array
+import base64
+import collections
 import enum
+import functools
+import io
 import itertools
+import json
+import os
+import select
+import socket
+import tempfile
+import threading
+import time
 
+import monotonic
 import six
 
 import valve.source
+from .. import metrics
 from . import messages
 from . import util
 
@@ -26,6 +40,9 @@ REGION_REST = 0xFF
 
 MASTER_SERVER_ADDR = ("hl2master.steampowered.com", 27011)
 
+# os.replace isn't available on Python 2; os.rename is equivalent on POSIX
+_replace = getattr(os, "replace", os.rename)
+
 
 class Duplicates(enum.Enum):
     """Behaviour for duplicate addresses.
@@ -44,6 +61,499 @@ class Duplicates(enum.Enum):
     STOP = "stop"
 
 
+class RegionProgress(collections.namedtuple(
+        "RegionProgress",
+        ("region", "pages", "addresses", "done", "error"))):
+    """The progress of finding the servers in a region.
+
+    These are passed to the ``progress`` callback of
+    :meth:`MasterServerQuerier.find`.
+
+    :ivar region: the numeric ``REGION_`` identifier.
+    :ivar pages: the number of responses received from the master server.
+    :ivar addresses: the number of addresses received, including any
+        duplicates but not the terminating 0.0.0.0:0 address.
+    :ivar done: whether or not the region has finished.
+    :ivar error: the :exc:`valve.source.NoResponseError` which caused
+        the region to finish early, or ``None``.
+    """
+
+    __slots__ = ()
+
+
+class RateLimiter(object):
+    """Token bucket which paces requests to the master server.
+
+    Each request takes a token from the bucket, waiting for one if the
+    bucket is empty. Tokens are added at :attr:`rate` per second, up to
+    ``burst`` of them. The rate adapts to how the master server responds:
+    it increases by ``increase`` requests per second each time a response
+    is received and is multiplied by ``decrease`` each time a request
+    times out, within the bounds of ``minimum`` and ``maximum``. This
+    additive-increase, multiplicative-decrease approach settles close to
+    the fastest rate the master server will tolerate.
+
+    A rate limiter can be shared between queriers, including queriers
+    used by different threads, so that they're paced together.
+
+    :param rate: the initial number of requests per second.
+    :param burst: the maximum number of requests which can be made
+        without waiting.
+    :param minimum: the lowest the rate can be decreased to.
+    :param maximum: the highest the rate can be increased to.
+    :param increase: the number of requests per second the rate increases
+        by for each response.
+    :param decrease: the factor the rate is multiplied by for each
+        timeout.
+
+    :ivar rate: the current number of requests per second.
+    """
+
+    def __init__(self, rate=5.0, burst=5, minimum=0.2,
+                 maximum=50.0, increase=0.5, decrease=0.5):
+        if not 0 < minimum <= rate <= maximum:
+            raise ValueError(
+                "Rate must be between the minimum and maximum rates")
+        if not 0 < decrease < 1:
+            raise ValueError("Decrease must be between zero and one")
+        self.rate = rate
+        self.burst = burst
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self._tokens = float(burst)
+        self._updated = monotonic.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = monotonic.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take a token, waiting for one if necessary."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def success(self):
+        """Increase the rate after a response is received."""
+        with self._lock:
+            self._refill()
+            self.rate = min(self.maximum, self.rate + self.increase)
+
+    def timeout(self):
+        """Decrease the rate after a request times out.
+
+        Any burst of requests is also stopped, so that after retrying the
+        request the following ones are paced at the new rate.
+        """
+        with self._lock:
+            self._refill()
+            self.rate = max(self.minimum, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 1)
+
+
+class Cursor(object):
+    """The position of a search of the master server.
+
+    The master server returns addresses in pages. Each page is requested
+    by giving the last address of the previous page, so a search of a
+    region for a filter string can be continued from any page. Cursors
+    record this position so that interrupted searches can be resumed
+    with :meth:`MasterServerQuerier.resume`.
+
+    Cursors can be converted to and from dictionaries of JSON-compatible
+    values in order to persist them. See also :func:`save_cursors` and
+    :func:`load_cursors`.
+
+    :ivar region: the numeric ``REGION_`` identifier.
+    :ivar filter_string: the filter string sent to the master server.
+    :ivar address: the last address received as a ``host:port`` string.
+        Initially this is ``0.0.0.0:0``.
+    :ivar done: whether or not the final page has been received.
+    """
+
+    def __init__(self, region, filter_string="",
+                 address="0.0.0.0:0", done=False):
+        self.region = region
+        self.filter_string = filter_string
+        self.address = address
+        self.done = done
+
+    def __repr__(self):
+        return ("<{0.__class__.__name__} region={0.region} "
+                "filter={0.filter_string!r} address={0.address!r} "
+                "done={0.done}>".format(self))
+
+    def __eq__(self, other):
+        if not isinstance(other, Cursor):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def to_dict(self):
+        """Convert the cursor to a dictionary."""
+        return {
+            "region": self.region,
+            "filter": self.filter_string,
+            "address": self.address,
+            "done": self.done,
+        }
+
+    @classmethod
+    def from_dict(cls, cursor):
+        """Create a cursor from a dictionary.
+
+        :param cursor: a dictionary as returned by :meth:`to_dict`.
+
+        :raises ValueError: if the dictionary is missing any values.
+        """
+        try:
+            return cls(int(cursor["region"]),
+                       six.text_type(cursor["filter"]),
+                       six.text_type(cursor["address"]),
+                       bool(cursor["done"]))
+        except KeyError as exc:
+            raise ValueError("Cursor is missing {}".format(exc))
+
+
+def save_cursors(path, cursors):
+    """Save cursors to a file as JSON.
+
+    The cursors are written to a temporary file in the same directory
+    which then replaces the given file. So if writing is interrupted, the
+    previously saved cursors are left intact.
+
+    :param path: the path of the file to save to.
+    :param cursors: an iterable of :class:`Cursor`.
+    """
+    _save_json(path, {"cursors": [cursor.to_dict() for cursor in cursors]})
+
+
+def _save_json(path, document):
+    """Atomically replace a file with a JSON document."""
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(
+        prefix=".{}-".format(os.path.basename(path)),
+        suffix=".tmp", dir=directory)
+    try:
+        with io.open(descriptor, "w", encoding="utf-8") as file_:
+            file_.write(six.text_type(
+                json.dumps(document, indent=2, sort_keys=True)))
+            file_.flush()
+            os.fsync(file_.fileno())
+        _replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def load_cursors(path):
+    """Load cursors previously saved by :func:`save_cursors`.
+
+    :param path: the path of the file to load from.
+
+    :raises ValueError: if the file doesn't contain valid cursors.
+
+    :returns: a list of :class:`Cursor`.
+    """
+    with io.open(path, encoding="utf-8") as file_:
+        try:
+            return [Cursor.from_dict(cursor)
+                    for cursor in json.load(file_)["cursors"]]
+        except (KeyError, TypeError) as exc:
+            raise ValueError("Invalid cursors file: {}".format(exc))
+
+
+class FindCache(object):
+    """Cache of the addresses found by :meth:`MasterServerQuerier.find`.
+
+    Searches are cached by their regions and filter string. Only searches
+    which received every page of every region are cached, so searches
+    which time out or are stopped early are always repeated. Cached
+    searches expire after ``ttl`` seconds. Once there are more than
+    ``maxsize`` cached searches, the least recently used are evicted.
+
+    If a ``path`` is given then the cache is also saved to that file as
+    JSON whenever a search is added, and any unexpired searches in the
+    file are loaded when the cache is created. This allows the cache to
+    be shared between runs of a program.
+
+    The cache can be shared between many queriers, including queriers
+    used by different threads. If a search is made while an identical
+    search is already in progress in another thread, it waits for that one
+    to finish and then uses its result. Should the first search not
+    complete, or receive nothing for longer than the querier's timeout,
+    then the waiting search is made as normal.
+
+    .. code-block:: python
+
+        cache = FindCache(ttl=600)
+        with MasterServerQuerier(cache=cache) as msq:
+            servers = list(msq.find(gamedir="tf"))
+            # Returned from the cache without querying the master server
+            servers = list(msq.find(gamedir="tf"))
+
+    :param ttl: the number of seconds searches are cached for.
+    :param maxsize: the maximum number of searches to cache.
+    :param path: the path of the file to save the cache to.
+    """
+
+    def __init__(self, ttl=300.0, maxsize=128, path=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.path = path
+        self._entries = collections.OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._entries)
+
+    def _expire(self):
+        now = time.time()
+        for key, (expires, _) in list(self._entries.items()):
+            if expires <= now:
+                del self._entries[key]
+
+    def get(self, key):
+        """Get the addresses of a cached search.
+
+        :param key: a tuple of the sorted numeric regions and the filter
+            string of the search.
+
+        :returns: an array of packed addresses, or ``None`` if the search
+            isn't cached or has expired.
+        """
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return None
+        # Move to the end as the most recently used
+        del self._entries[key]
+        self._entries[key] = entry
+        return entry[1]
+
+    def put(self, key, addresses):
+        """Add the addresses of a complete search to the cache.
+
+        :param key: see :meth:`get`.
+        :param addresses: an iterable of packed addresses.
+        """
+        if messages._PACKED_ADDRESS_TYPE is None:
+            addresses = list(addresses)
+        else:
+            addresses = array.array(messages._PACKED_ADDRESS_TYPE, addresses)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, addresses)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            if self.path is not None:
+                self._save()
+
+    def clear(self):
+        """Remove all the cached searches."""
+        with self._lock:
+            self._entries.clear()
+            if self.path is not None:
+                self._save()
+
+    def _save(self):
+        field = messages.MSAddressArrayField("addresses")
+        _save_json(self.path, {"searches": [{
+            "regions": list(regions),
+            "filter": filter_string,
+            "expires": expires,
+            "addresses": base64.b64encode(
+                field.encode(addresses)).decode("ascii"),
+        } for (regions, filter_string), (expires, addresses)
+            in self._entries.items()]})
+
+    def _load(self):
+        field = messages.MSAddressArrayField("addresses")
+        with io.open(self.path, encoding="utf-8") as file_:
+            try:
+                searches = json.load(file_)["searches"]
+                for search in searches:
+                    key = (tuple(search["regions"]),
+                           six.text_type(search["filter"]))
+                    addresses, _ = field.decode(
+                        base64.b64decode(search["addresses"]))
+                    self._entries[key] = (search["expires"], addresses)
+            except (KeyError, TypeError, ValueError) as exc:
+                raise ValueError("Invalid cache file: {}".format(exc))
+        self._expire()
+
+    def _fetch(self, key, find, progress=None, timeout=None):
+        """Get the packed addresses for a search.
+
+        If the search isn't cached, ``find`` is called with a progress
+        callback to perform it. The addresses it returns are yielded as
+        they're received and the search is cached if it completes.
+
+        If an identical search is in progress in another thread then this
+        waits for it to finish. Should that search receive nothing for
+        ``timeout`` seconds, such as if it was abandoned without being
+        closed, the search is made again instead of waiting any longer.
+        """
+        while True:
+            with self._lock:
+                addresses = self._get(key)
+                if addresses is not None:
+                    break
+                search = self._in_flight.get(key)
+                if (search is None
+                        or search.thread is threading.current_thread()
+                        or search.stalled(timeout)):
+                    search = self._in_flight[key] = _Search()
+                    break
+            search.finished.wait(timeout)
+        if addresses is not None:
+            for address in addresses:
+                yield address
+            return
+        try:
+            failed = []
+
+            def on_progress(update):
+                search.touch()
+                if update.error is not None:
+                    failed.append(update)
+                if progress is not None:
+                    progress(update)
+
+            found = []
+            for address in find(on_progress):
+                search.touch()
+                found.append(address)
+                yield address
+            if not failed:
+                self.put(key, found)
+        finally:
+            with self._lock:
+                # The search may have been taken over by another
+                if self._in_flight.get(key) is search:
+                    del self._in_flight[key]
+            search.finished.set()
+
+
+class _Search(object):
+    """A search in progress which identical searches wait for."""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.finished = threading.Event()
+        self.active = monotonic.monotonic()
+
+    def touch(self):
+        """Record that the search is still receiving addresses."""
+        self.active = monotonic.monotonic()
+
+    def stalled(self, timeout):
+        """Check if nothing has been received for ``timeout`` seconds."""
+        return (timeout is not None
+                and monotonic.monotonic() - self.active >= timeout)
+
+
+class _RegionSweep(object):
+    """State of paging through the servers in a region.
+
+    The sweep advances the given :class:`Cursor` as pages are iterated
+    over.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.pages = 0
+        self.addresses = 0
+        self.error = None
+        self.attempt = 0
+        self.socket = None
+        self.sent = None
+        self.deadline = None
+        self.resend = False
+        self.next_address = None
+
+    @property
+    def region(self):
+        return self.cursor.region
+
+    @property
+    def done(self):
+        return self.cursor.done or self.error is not None
+
+    @property
+    def progress(self):
+        return RegionProgress(self.region, self.pages,
+                              self.addresses, self.done, self.error)
+
+    def request(self):
+        """Build the request for the next page of addresses."""
+        return messages.MasterServerRequest(
+            region=self.region, address=self.cursor.address,
+            filter=self.cursor.filter_string)
+
+    def feed(self, raw_response):
+        """Decode a page of addresses.
+
+        The cursor isn't moved past the page until :meth:`advance` is
+        called, which should be once all of the page's addresses have
+        been yielded.
+
+        :returns: an array of packed addresses, as created by
+            :func:`valve.source.util.pack_address`.
+        """
+        response = messages.MasterServerPackedResponse.decode(raw_response)
+        addresses = response["addresses"]
+        self.next_address = self.cursor.address
+        if addresses:
+            # Only the last address of each page needs formatting
+            self.next_address = "{}:{}".format(
+                *util.unpack_address(addresses[-1]))
+            if 0 in addresses:
+                addresses = [address for address in addresses if address]
+        self.pages += 1
+        self.addresses += len(addresses)
+        self.attempt = 0
+        return addresses
+
+    def advance(self):
+        """Move the cursor past the last page fed.
+
+        The cursor is done once the terminating 0.0.0.0:0 address has
+        been received.
+        """
+        self.cursor.address = self.next_address
+        self.cursor.done = self.cursor.address == "0.0.0.0:0"
+
+    def fail(self, error):
+        self.error = error
+
+
 class MasterServerQuerier(valve.source.BaseQuerier):
     """Implements the Source master server query protocol
 
@@ -52,10 +562,33 @@ class MasterServerQuerier(valve.source.BaseQuerier):
     .. note::
         Instantiating this class creates a socket. Be sure to close the
         querier once finished with it. See :class:`valve.source.BaseQuerier`.
+
+    Requests can be paced by a :class:`RateLimiter` to avoid being
+    throttled by the master server. If :attr:`retries` is set and the
+    master server doesn't respond to a request for a page of addresses
+    then it's retried up to that many times before giving up on that
+    region. Neither is done by default.
+
+    :param rate_limit: either a :class:`RateLimiter`, ``True`` to use a
+        new rate limiter with the default settings or ``False`` to not
+        limit the rate of requests.
+    :param int retries: how many times requests are retried by
+        :meth:`find`.
+
+    :ivar cache: the :class:`FindCache` used by :meth:`find`, or ``None``
+        if searches aren't cached.
+    :ivar rate_limiter: the :class:`RateLimiter` or ``None``.
+    :ivar retries: how many times requests are retried by :meth:`find`.
     """
 
-    def __init__(self, address=MASTER_SERVER_ADDR, timeout=10.0):
+    def __init__(self, address=MASTER_SERVER_ADDR, timeout=10.0,
+                 cache=None, rate_limit=False, retries=0):
         super(MasterServerQuerier, self).__init__(address, timeout)
+        self.cache = cache
+        if rate_limit is True:
+            rate_limit = RateLimiter()
+        self.rate_limiter = rate_limit or None
+        self.retries = retries
 
     def __iter__(self):
         """An unfitlered iterator of all Source servers
@@ -73,7 +606,7 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         """
         return self.find(region="all")
 
-    def _query(self, region, filter_string):
+    def _query(self, region, filter_string, progress=None, packed=False):
         """Issue a request to the master server
 
         Returns a generator which yields ``(host, port)`` addresses as
@@ -81,8 +614,9 @@ class MasterServerQuerier(valve.source.BaseQuerier):
 
         Addresses are returned in batches therefore multiple requests may be
         dispatched. Because of this any of these requests may result in a
-        :exc:`NotResponseError` raised. In such circumstances the iterator
-        will exit early. Otherwise the iteration continues until the final
+        :exc:`NotResponseError` raised. In such circumstances the request
+        is retried up to :attr:`retries` times before the iterator exits
+        early. Otherwise the iteration continues until the final
         address is reached which is indicated by the master server returning
         a 0.0.0.0:0 address.
 
@@ -94,24 +628,169 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         on the Valve develper wiki:
 
         https://developer.valvesoftware.com/wiki/Master_Server_Query_Protocol#Filter
+
+        If given, ``progress`` is called with a :class:`RegionProgress`
+        after each response and when the region finishes. If ``packed`` is
+        true then packed addresses are yielded instead of tuples, see
+        :func:`valve.source.util.pack_address`.
         """
-        last_addr = "0.0.0.0:0"
-        first_request = True
-        while first_request or last_addr != "0.0.0.0:0":
-            first_request = False
-            self.request(messages.MasterServerRequest(
-                region=region, address=last_addr, filter=filter_string))
-            try:
-                raw_response = self.get_response()
-            except valve.source.NoResponseError:
-                return
-            else:
-                response = messages.MasterServerResponse.decode(raw_response)
-                for address in response["addresses"]:
-                    last_addr = "{}:{}".format(
-                        address["host"], address["port"])
-                    if not address.is_null:
-                        yield address["host"], address["port"]
+        query = self._page(
+            Cursor(region, filter_string), progress, self.retries, 0)
+        if not packed:
+            query = six.moves.map(util.unpack_address, query)
+        return query
+
+    def _page(self, cursor, progress=None, retries=0, backoff=1.0):
+        """Page through the servers in a region, advancing a cursor.
+
+        Addresses are yielded as packed integers.
+
+        Requests are paced by the querier's rate limiter, if it has one.
+        If the master server doesn't respond to a request then it's
+        retried up to ``retries`` times, waiting ``backoff`` seconds
+        before the first retry and twice as long before each subsequent
+        one. If it still doesn't respond the iterator exits early, leaving
+        the cursor at the last page that was received.
+        """
+        sweep = _RegionSweep(cursor)
+        while not sweep.done:
+            request = sweep.request()
+            while True:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                self.request(request)
+                try:
+                    raw_response = self.get_response()
+                except valve.source.NoResponseError as exc:
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.timeout()
+                    if sweep.attempt >= retries:
+                        sweep.fail(exc)
+                        break
+                    time.sleep(backoff * 2 ** sweep.attempt)
+                    sweep.attempt += 1
+                else:
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.success()
+                    for address in metrics.timed(
+                            self, "addresses", sweep.feed, raw_response):
+                        yield address
+                    sweep.advance()
+                    break
+            if progress is not None:
+                progress(sweep.progress)
+
+    def _sweep(self, cursors, progress=None, retries=0, backoff=1.0):
+        """Page through the servers of many regions concurrently.
+
+        Each cursor is advanced using its own connected socket so that
+        responses can be attributed to the cursor they're for. Requests
+        for the next page of each cursor are sent as soon as the previous
+        page is received. Packed addresses are yielded in the order
+        they're received.
+
+        Otherwise this behaves like :meth:`._page`; requests which aren't
+        responded to in time are retried after backing off and, once out
+        of retries, the cursor's region finishes early.
+        """
+        if self._socket is None:
+            raise valve.source.QuerierClosedError
+        sweeps = []
+        buffer = bytearray(65536)
+        try:
+            for cursor in cursors:
+                if cursor.done:
+                    continue
+                sweep = _RegionSweep(cursor)
+                sweep.socket = socket.socket(
+                    socket.AF_INET, socket.SOCK_DGRAM)
+                sweeps.append(sweep)
+            for sweep in sweeps:
+                sweep.socket.connect((self.host, self.port))
+                self._send_page(sweep)
+            while True:
+                pending = [sweep for sweep in sweeps if not sweep.done]
+                if not pending:
+                    return
+                wait = min(sweep.deadline for sweep in pending)
+                ready, _, _ = select.select(
+                    [sweep.socket for sweep in pending], [], [],
+                    max(wait - monotonic.monotonic(), 0))
+                now = monotonic.monotonic()
+                for sweep in pending:
+                    error = None
+                    if sweep.socket in ready and sweep.resend:
+                        # A late response to the request which timed out.
+                        # It's discarded so that it isn't mistaken for the
+                        # response to the resent request, and so it doesn't
+                        # keep select returning while backing off.
+                        try:
+                            sweep.socket.recv_into(buffer)
+                        except socket.error:
+                            pass
+                    if sweep.socket in ready and not sweep.resend:
+                        try:
+                            size = sweep.socket.recv_into(buffer)
+                        except socket.error as exc:
+                            error = valve.source.NoResponseError(exc)
+                        else:
+                            if self.rate_limiter is not None:
+                                self.rate_limiter.success()
+                            if metrics.observers:
+                                master = (self.host, self.port)
+                                metrics.notify("received", self, master, size)
+                                metrics.notify("responded", self, master,
+                                               (now - sweep.sent) * 1000.0)
+                            for address in metrics.timed(
+                                    self, "addresses", sweep.feed,
+                                    memoryview(buffer)[:size]):
+                                yield address
+                            sweep.advance()
+                            if not sweep.done:
+                                self._send_page(sweep)
+                    elif sweep.deadline > now:
+                        continue
+                    elif sweep.resend:
+                        self._send_page(sweep)
+                        continue
+                    else:
+                        error = valve.source.NoResponseError(
+                            "Timed out waiting for response")
+                        if metrics.observers:
+                            metrics.notify(
+                                "timed_out", self, (self.host, self.port))
+                    if error is not None:
+                        if self.rate_limiter is not None:
+                            self.rate_limiter.timeout()
+                        if sweep.attempt < retries:
+                            # Wait before resending the request
+                            sweep.deadline = now + backoff * 2 ** sweep.attempt
+                            sweep.attempt += 1
+                            sweep.resend = True
+                            continue
+                        sweep.fail(error)
+                    if progress is not None:
+                        progress(sweep.progress)
+        finally:
+            for sweep in sweeps:
+                sweep.socket.close()
+
+    def _send_page(self, sweep):
+        """Request the next page of a parallel sweep."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        sweep.resend = False
+        sweep.sent = monotonic.monotonic()
+        sweep.deadline = sweep.sent + self.timeout
+        request = sweep.request().encode()
+        try:
+            sweep.socket.send(request)
+        except socket.error as exc:
+            sweep.fail(valve.source.NoResponseError(exc))
+            return
+        if metrics.observers:
+            metrics.notify(
+                "sent", self, (self.host, self.port), len(request))
 
     def _deduplicate(self, method, query):
         """Deduplicate addresses in a :meth:`._query`.
@@ -182,7 +861,8 @@ class MasterServerQuerier(valve.source.BaseQuerier):
                 raise ValueError("Invalid region identifier {!r}".format(reg))
         return regions
 
-    def find(self, region="all", duplicates=Duplicates.SKIP, **filters):
+    def find(self, region="all", duplicates=Duplicates.SKIP,
+             parallel=False, progress=None, packed=False, **filters):
         """Find servers for a particular region and set of filtering rules
 
         This returns an iterator which yields ``(host, port)`` server
@@ -287,13 +967,66 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         The master server may return duplicate addresses. By default, these
         duplicates are excldued from the iterator returned by this method.
         See :class:`Duplicates` for controller this behaviour.
+
+        Addresses are returned by the master server in pages. By default,
+        each region is paged through in turn. When ``parallel`` is true
+        all regions are paged through at the same time, each using its own
+        socket, which is much faster when finding servers in many
+        regions. The addresses of different regions are then interleaved
+        in the order they're received. Duplicates are handled the same
+        way in either case.
+
+        To monitor the progress of each region, a ``progress`` callable
+        can be given. It's called with a :class:`RegionProgress` each time
+        a page is received and when each region finishes.
+
+        Addresses are received and deduplicated as packed integers. When
+        finding many servers, setting ``packed`` to true yields these
+        instead of ``(host, port)`` tuples, which avoids formatting each
+        address. They can be unpacked with
+        :func:`valve.source.util.unpack_address`.
+
+        If the querier has a :class:`FindCache` then searches for the same
+        regions and filters are returned from the cache until they expire.
+        The ``progress`` callable isn't called for cached searches.
         """
-        if isinstance(region, (int, six.text_type)):
-            regions = self._map_region(region)
+        regions = self._regions(region)
+        filter_string = self._filter_string(filters)
+        find = functools.partial(
+            self._find, regions, filter_string, parallel)
+        if self.cache is None:
+            query = find(progress)
         else:
-            regions = []
-            for reg in region:
-                regions.extend(self._map_region(reg))
+            query = self.cache._fetch(
+                (tuple(sorted(set(regions))), filter_string),
+                find, progress, self.timeout)
+        query = self._deduplicate(Duplicates(duplicates), query)
+        if not packed:
+            query = six.moves.map(util.unpack_address, query)
+        for address in query:
+            yield address
+
+    def _find(self, regions, filter_string, parallel, progress):
+        """Find the packed addresses of servers in the given regions."""
+        if parallel:
+            return self._sweep(
+                [Cursor(region, filter_string) for region in regions],
+                progress, self.retries, 0)
+        return itertools.chain.from_iterable(
+            self._query(region, filter_string, progress, True)
+            for region in regions)
+
+    def _regions(self, region):
+        """Map a region, or list of regions, to numeric identifiers."""
+        if isinstance(region, (int, six.text_type)):
+            return self._map_region(region)
+        regions = []
+        for reg in region:
+            regions.extend(self._map_region(reg))
+        return regions
+
+    def _filter_string(self, filters):
+        """Build a filter string from :meth:`find` keyword arguments."""
         filter_ = {}
         for key, value in six.iteritems(filters):
             if key in {"secure", "linux", "empty",
@@ -318,10 +1051,93 @@ class MasterServerQuerier(valve.source.BaseQuerier):
         filter_string = "\\".join([part for pair in filter_ for part in pair])
         if filter_string:
             filter_string = "\\" + filter_string
-        queries = []
-        for region in regions:
-            queries.append(self._query(region, filter_string))
-        query = self._deduplicate(
-            Duplicates(duplicates), itertools.chain.from_iterable(queries))
+        return filter_string
+
+    def cursors(self, region="all", **filters):
+        """Create cursors for finding servers.
+
+        This accepts the same ``region`` and filter keyword arguments as
+        :meth:`find`. Rather than finding the servers, it returns a
+        :class:`Cursor` for each region which can be passed to
+        :meth:`resume`.
+
+        :returns: a list of :class:`Cursor`.
+        """
+        filter_string = self._filter_string(filters)
+        return [Cursor(region, filter_string)
+                for region in self._regions(region)]
+
+    def resume(self, cursors, duplicates=Duplicates.SKIP, parallel=False,
+               retries=3, backoff=1.0, checkpoint=None, progress=None,
+               packed=False):
+        """Find servers, continuing from the given cursors.
+
+        This behaves like :meth:`find` except the search for each region
+        starts from a :class:`Cursor`, which is advanced once all the
+        addresses of each page have been iterated over. Cursors which are
+        already done are skipped. If the search is interrupted, such as by
+        the master server not responding or by stopping iteration part way
+        through a page, the search can be continued by resuming with the
+        same cursors. Any addresses of a partially iterated page are then
+        returned again.
+
+        .. code-block:: python
+
+            cursors = msq.cursors(region="eu", gamedir="tf")
+            while not all(cursor.done for cursor in cursors):
+                for address in msq.resume(cursors):
+                    ...
+
+        Requests which the master server doesn't respond to are retried
+        up to ``retries`` times. Retries back off exponentially, waiting
+        ``backoff`` seconds before the first retry and twice as long
+        before each subsequent one. If a request is still unanswered then
+        that region's search stops and its cursor is left at the last page
+        received.
+
+        When ``checkpoint`` is given, all the cursors are saved to that
+        path with :func:`save_cursors` each time a page of addresses has
+        been iterated over, as well as when a region stops. They can be
+        loaded again with :func:`load_cursors`. Addresses in a page are
+        yielded before the checkpoint is written, so after resuming from
+        a checkpoint some addresses may be returned again.
+
+        Duplicates are only detected within a single call to this method.
+
+        :param cursors: a list of :class:`Cursor` as returned by
+            :meth:`cursors` or :func:`load_cursors`.
+        :param duplicates: how to treat duplicate addresses. See
+            :class:`Duplicates`.
+        :param bool parallel: whether to page through all the cursors at
+            the same time. See :meth:`find`.
+        :param int retries: how many times to retry each request.
+        :param float backoff: the number of seconds to wait before the
+            first retry.
+        :param checkpoint: the path of a file to save the cursors to.
+        :param progress: a callable which is passed a
+            :class:`RegionProgress` after each page and when each region
+            stops.
+        :param bool packed: whether to yield packed addresses. See
+            :meth:`find`.
+
+        :returns: an iterator of ``(host, port)`` addresses.
+        """
+        cursors = list(cursors)
+
+        def on_progress(update):
+            if checkpoint is not None:
+                save_cursors(checkpoint, cursors)
+            if progress is not None:
+                progress(update)
+
+        if parallel:
+            query = self._sweep(cursors, on_progress, retries, backoff)
+        else:
+            query = itertools.chain.from_iterable(
+                self._page(cursor, on_progress, retries, backoff)
+                for cursor in cursors if not cursor.done)
+        query = self._deduplicate(Duplicates(duplicates), query)
+        if not packed:
+            query = six.moves.map(util.unpack_address, query)
         for address in query:
             yield address
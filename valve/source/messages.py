@@ -4,8 +4,11 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import array
 import collections
+import re
 import struct
+import sys
 
 import six
 
@@ -15,6 +18,23 @@ from . import util
 NO_SPLIT = -1
 SPLIT = -2
 
+_TERMINATOR = re.compile(b"\x00")
+
+
+def _packed_address_type():
+    # Packed addresses need 48 bits. Python 2's array has no "Q" type
+    # code but "L" is 64 bits on most platforms.
+    for typecode in ("Q", "L"):
+        try:
+            if array.array(str(typecode)).itemsize == 8:
+                return str(typecode)
+        except ValueError:
+            pass
+    return None
+
+
+_PACKED_ADDRESS_TYPE = _packed_address_type()
+
 
 class BrokenMessageError(Exception):
     pass
@@ -42,6 +62,33 @@ def needs_buffer(func):
     return needs_buffer
 
 
+def find_terminator(buffer, offset):
+    """Find the null byte which terminates a string.
+
+    Unlike :meth:`bytes.find` this also supports buffers such as
+    :class:`memoryview` which don't have a ``find`` method.
+
+    :param buffer: the bytes-like object to search.
+    :param int offset: the index to start searching from.
+
+    :returns: the index of the null byte or -1 if there isn't one.
+    """
+    find = getattr(buffer, "find", None)
+    if find is not None:
+        return find(b"\x00", offset)
+    match = _TERMINATOR.search(buffer, offset)
+    if match is None:
+        return -1
+    return match.start()
+
+
+def decode_text(buffer, start, end):
+    """Decode part of a buffer as UTF-8, ignoring invalid sequences."""
+    if isinstance(buffer, memoryview):
+        return buffer[start:end].tobytes().decode("utf8", "ignore")
+    return buffer[start:end].decode("utf8", "ignore")
+
+
 class MessageField(object):
 
     fmt = None
@@ -132,6 +179,24 @@ class MessageField(object):
         except struct.error as exc:
             raise BrokenMessageError(exc)
 
+    def decode_from(self, buffer, offset, values={}):
+        """
+            Like decode() but decodes the field from the given offset
+            of the buffer rather than from its start. Instead of the
+            remaining data, the offset of the end of the field is
+            returned. The buffer may be any bytes-like object, such as
+            a memoryview, and is never copied.
+        """
+
+        field_size = struct.calcsize(self.format)
+        if len(buffer) - offset < field_size or offset >= len(buffer):
+            raise BufferExhaustedError
+        try:
+            value = struct.unpack_from(self.format, buffer, offset)[0]
+        except struct.error as exc:
+            raise BrokenMessageError(exc)
+        return self.validate(value), offset + field_size
+
 
 class ByteField(MessageField):
     fmt = "B"
@@ -154,6 +219,14 @@ class StringField(MessageField):
         left_overs = buffer[field_size:]
         return field_data.decode("utf8", "ignore"), left_overs
 
+    def decode_from(self, buffer, offset, values={}):
+        if offset >= len(buffer):
+            raise BufferExhaustedError
+        terminator = find_terminator(buffer, offset)
+        if terminator == -1:
+            raise BufferExhaustedError("No string terminator")
+        return decode_text(buffer, offset, terminator), terminator + 1
+
 
 class ShortField(MessageField):
     fmt = "h"
@@ -163,6 +236,10 @@ class LongField(MessageField):
     fmt = "l"
 
 
+class UnsignedLongField(MessageField):
+    fmt = "L"
+
+
 class FloatField(MessageField):
     fmt = "f"
 
@@ -175,6 +252,11 @@ class PlatformField(ByteField):
                                      self).decode(buffer, values)
         return util.Platform(byte), remnant_buffer
 
+    def decode_from(self, buffer, offset, values={}):
+        byte, offset = super(PlatformField,
+                             self).decode_from(buffer, offset, values)
+        return util.Platform(byte), offset
+
 
 class ServerTypeField(ByteField):
 
@@ -184,6 +266,11 @@ class ServerTypeField(ByteField):
                                      self).decode(buffer, values)
         return util.ServerType(byte), remnant_buffer
 
+    def decode_from(self, buffer, offset, values={}):
+        byte, offset = super(ServerTypeField,
+                             self).decode_from(buffer, offset, values)
+        return util.ServerType(byte), offset
+
 
 class MessageArrayField(MessageField):
     """
@@ -192,7 +279,7 @@ class MessageArrayField(MessageField):
         same message.)
     """
 
-    def __init__(self, name, element, count=None):
+    def __init__(self, name, element, count=None, compact=False):
         """
             element -- the Message subclass that will attempt to be decoded
 
@@ -212,6 +299,10 @@ class MessageArrayField(MessageField):
                 MessageArrayField("", SubMessage, MessageArrayField.all())
 
                 ... will decode all SubMessages within the buffer
+
+            compact -- if true then elements are decoded as the
+                element's Record type instead of instances of it. See
+                Message.record_type()
         """
 
         MessageField.__init__(self, name)
@@ -229,10 +320,14 @@ class MessageArrayField(MessageField):
             const_count.minimum = count
             self.count = const_count
         self.element = element
+        self.compact = compact
 
     def encode(self, elements, values={}):
         buf = []
         for i, element in enumerate(elements):
+            if (isinstance(element, Record)
+                    and issubclass(element.message, self.element)):
+                element = element.message(**element)
             if not isinstance(element, self.element):
                 raise BrokenMessageError(
                     "Element {} ({}) is not instance of {}".format(
@@ -245,12 +340,34 @@ class MessageArrayField(MessageField):
         return b"".join(buf)
 
     def decode(self, buffer, values={}):
+        entries, offset = self.decode_from(buffer, 0, values)
+        return entries, buffer[offset:]
+
+    def _element_decoder(self):
+        """Get a function which decodes an element from an offset.
+
+        The function returns a tuple of the decoded element and the
+        offset of the end of the element.
+        """
+        if not self.compact:
+            return self.element.decode_from
+        decode_values = self.element._decoder().decode_values
+        make = self.element.record_type()._make
+
+        def decode_record(buffer, offset):
+            values, offset = decode_values(buffer, offset)
+            return make(values), offset
+
+        return decode_record
+
+    def decode_from(self, buffer, offset, values={}):
+        decode_element = self._element_decoder()
         entries = []
         count = 0
         while count < self.count(values):
-            # Set start_buffer to the beginning of the buffer so that in
-            # the case of buffer exhaustion it can return from the
-            # start of the entry, not half-way through it.
+            # Each element is decoded from the end of the previous one,
+            # so if an element can't be decoded the offset is still at
+            # the beginning of it, not half-way through it.
             #
             # For example if you had the fields:
             #
@@ -267,17 +384,14 @@ class MessageArrayField(MessageField):
             # however ShortField will fail with BufferExhaustedError as
             # there's only one byte left. However, there is enough left
             # for the trailing ByteField. So when ComplexField
-            # propagates ShortField's BufferExhaustedError the buffer will
-            # only have the 00 byte remaining. The exception if caught
-            # and buffer reverted to FF FF FF FF 00. This is passed
-            # to ByteField which consumes one byte and the reamining
-            # FF FF FF 00 bytes and stored as message payload.
+            # propagates ShortField's BufferExhaustedError the offset is
+            # left pointing at FF FF FF FF 00. This is passed to ByteField
+            # which consumes one byte and the reamining FF FF FF 00 bytes
+            # and stored as message payload.
             #
             # This is very much an edge case. :/
-            start_buffer = buffer
             try:
-                entry = self.element.decode(buffer)
-                buffer = entry.payload
+                entry, offset = decode_element(buffer, offset)
                 entries.append(entry)
                 count += 1
             except (BufferExhaustedError, BrokenMessageError) as exc:
@@ -285,9 +399,8 @@ class MessageArrayField(MessageField):
                 # buffer is reached.
                 if count < self.count.minimum:
                     raise BrokenMessageError(exc)
-                buffer = start_buffer
                 break
-        return entries, buffer
+        return entries, offset
 
     @staticmethod
     def value_of(name):
@@ -349,6 +462,9 @@ class MessageDictField(MessageArrayField):
         Decodes a series of key-value pairs from a message. Functionally
         identical to MessageArrayField except the results are returned as
         a dictionary instead of a list.
+
+        The key-value pairs are decoded directly into the dictionary
+        without creating an intermediate message for each of them.
     """
 
     def __init__(self, name, key_field, value_field, count=None):
@@ -368,12 +484,551 @@ class MessageDictField(MessageArrayField):
         MessageArrayField.__init__(self, name, element, count)
 
     def decode(self, buffer, values={}):
-        entries, buffer = MessageArrayField.decode(self, buffer, values)
-        entries_dict = {}
-        for entry in entries:
-            entries_dict[entry[
-                self.key_field.name]] = entry[self.value_field.name]
-        return entries_dict, buffer
+        entries, offset = self.decode_from(buffer, 0, values)
+        return entries, buffer[offset:]
+
+    def _element_decoder(self):
+        decode_values = self.element._decoder().decode_values
+        key = self.key_field.name
+        value = self.value_field.name
+
+        def decode_pair(buffer, offset):
+            values, offset = decode_values(buffer, offset)
+            return (values[key], values[value]), offset
+
+        return decode_pair
+
+    def decode_from(self, buffer, offset, values={}):
+        entries, offset = MessageArrayField.decode_from(
+            self, buffer, offset, values)
+        return dict(entries), offset
+
+
+# Decoders of fields whose decoded value is a single struct value passed
+# through a converter, keyed by the field's decode function.
+_FIXED_FIELD_DECODERS = {
+    six.get_unbound_function(MessageField.decode): None,
+    six.get_unbound_function(PlatformField.decode): util.Platform,
+    six.get_unbound_function(ServerTypeField.decode): util.ServerType,
+}
+
+
+def _field_decoder(field):
+    """Get the decode function of a field's class, if it's a field."""
+    if not isinstance(field, MessageField):
+        return None
+    decode = getattr(type(field), "decode", None)
+    if decode is None:
+        return None
+    return six.get_unbound_function(decode)
+
+
+def _is_fixed(field):
+    """Determine if a field decodes to a single fixed-width value."""
+    if _field_decoder(field) not in _FIXED_FIELD_DECODERS:
+        return False
+    format_ = getattr(field, "format", None)
+    if not format_:
+        return False
+    try:
+        unpacked = struct.Struct(format_).unpack(
+            b"\x00" * struct.calcsize(format_))
+    except struct.error:
+        return False
+    return len(unpacked) == 1
+
+
+def _compile_fixed(fields):
+    """Compile a run of fixed-width fields into a single decoding step.
+
+    The fields' formats are combined into a single :class:`struct.Struct`
+    so that all their values are unpacked at once. Validators are then ran
+    and converters applied in field order.
+    """
+    format_ = fields[0].format
+    if len(fields) > 1:
+        format_ = format_[:1] + format_[:0].join(
+            field.format[1:] for field in fields)
+    unpack_from = struct.Struct(format_).unpack_from
+    size = struct.calcsize(format_)
+    names = tuple(field.name for field in fields)
+    post = tuple((i, field, _FIXED_FIELD_DECODERS[_field_decoder(field)])
+                 for i, field in enumerate(fields))
+    post = tuple((i, field, convert) for i, field, convert in post
+                 if field.validators or convert is not None)
+    if not post:
+
+        def decode_fixed(buffer, offset, values):
+            values.update(zip(names, unpack_from(buffer, offset)))
+            return buffer, offset + size
+
+        return decode_fixed
+
+    def decode_fixed(buffer, offset, values):
+        unpacked = list(unpack_from(buffer, offset))
+        for i, field, convert in post:
+            if field.validators:
+                field.validate(unpacked[i])
+            if convert is not None:
+                unpacked[i] = convert(unpacked[i])
+        values.update(zip(names, unpacked))
+        return buffer, offset + size
+
+    return decode_fixed
+
+
+def _compile_string(field):
+    """Compile a decoding step for a null-terminated string field."""
+    name = field.name
+
+    def decode_string(buffer, offset, values):
+        if offset >= len(buffer):
+            raise BufferExhaustedError
+        try:
+            terminator = buffer.find(b"\x00", offset)
+        except AttributeError:
+            terminator = find_terminator(buffer, offset)
+        if terminator == -1:
+            raise BufferExhaustedError("No string terminator")
+        try:
+            values[name] = buffer[offset:terminator].decode("utf8", "ignore")
+        except AttributeError:
+            values[name] = decode_text(buffer, offset, terminator)
+        return buffer, terminator + 1
+
+    return decode_string
+
+
+def _decode_group_text(data):
+    return data.decode("utf8", "ignore")
+
+
+def _fixed_group_decoder(field, validate):
+    """Get a function which decodes a fixed-width field from its bytes."""
+    unpack = struct.Struct(field.format).unpack
+    convert = _FIXED_FIELD_DECODERS[_field_decoder(field)]
+
+    def decode(data):
+        value = unpack(data)[0]
+        if validate:
+            value = field.validate(value)
+        if convert is not None:
+            value = convert(value)
+        return value
+
+    return decode
+
+
+def _compile_lazy_segment(fields, slot, layout):
+    """Compile a step which indexes a run of fixed-width and string fields.
+
+    The fields are converted to a single regular expression with a group
+    for each field, so finding them all is a single match. Fields are then
+    decoded from their group when accessed. Fields with validators are
+    decoded immediately so that invalid messages are still rejected.
+
+    :param fields: the fields to index.
+    :param slot: the index in :attr:`LazyValues.positions` that the match
+        is stored at.
+    :param layout: a dictionary which the deferred fields are added to.
+        See :class:`LazyValues`.
+    """
+    pattern = []
+    eager = []
+    for group, field in enumerate(fields, 1):
+        if _is_fixed(field):
+            pattern.append("(.{{{}}})".format(
+                struct.calcsize(field.format)).encode("ascii"))
+            if field.validators:
+                eager.append(
+                    (field.name, group, _fixed_group_decoder(field, True)))
+            else:
+                layout[field.name] = (
+                    slot, group, _fixed_group_decoder(field, False))
+        else:
+            pattern.append(b"([^\x00]*)\x00")
+            layout[field.name] = (slot, group, _decode_group_text)
+    match = re.compile(b"".join(pattern), re.DOTALL).match
+
+    def index_segment(buffer, offset, values):
+        found = match(buffer, offset)
+        if found is None:
+            # As if unpacking the fields, so that the message is decoded
+            # field-by-field to raise the appropriate exception.
+            raise struct.error("Couldn't index fields")
+        for name, group, decode in eager:
+            values[name] = decode(found.group(group))
+        values.positions.append(found)
+        return buffer, found.end()
+
+    return index_segment
+
+
+def _defined_by(class_, attribute):
+    """Get the index in a class' MRO of the class defining an attribute."""
+    for i, base in enumerate(class_.__mro__):
+        if attribute in vars(base):
+            return i
+    return len(class_.__mro__)
+
+
+def _decodes_from_offset(field):
+    """Determine if a field's ``decode_from`` can be used.
+
+    Fields which override ``decode`` without overriding ``decode_from``
+    would otherwise silently have their decoder skipped.
+    """
+    if not isinstance(field, MessageField):
+        return False
+    class_ = type(field)
+    return _defined_by(class_, "decode_from") <= _defined_by(class_, "decode")
+
+
+def _compile_offset(field):
+    """Compile a decoding step which uses the field's ``decode_from``."""
+    name = field.name
+    decode_from = field.decode_from
+
+    def decode_offset(buffer, offset, values):
+        values[name], offset = decode_from(buffer, offset, values)
+        return buffer, offset
+
+    return decode_offset
+
+
+def _is_string(field):
+    """Determine if a field is a null-terminated string."""
+    return _field_decoder(field) is six.get_unbound_function(
+        StringField.decode)
+
+
+def _compile_nested(field):
+    """Compile a decoding step for a field which isn't a simple value."""
+    if _decodes_from_offset(field):
+        return _compile_offset(field)
+    return _compile_generic(field)
+
+
+def _compile_generic(field):
+    """Compile a decoding step which defers to the field's own decoder."""
+    name = field.name
+    decode = field.decode
+
+    def decode_generic(buffer, offset, values):
+        values[name], buffer = decode(
+            buffer[offset:] if offset else buffer, values)
+        return buffer, 0
+
+    return decode_generic
+
+
+class _CompiledDecoder(object):
+    """A decoder specialised for the fields of a :class:`Message` class.
+
+    Decoding a message field-by-field is relatively slow as each field
+    slices the remaining buffer and unpacks its value individually. This
+    compiles a sequence of fields into a list of steps which share a
+    buffer and offset:
+
+    * Consecutive fixed-width fields with the same byte order are unpacked
+      by a single :meth:`struct.Struct.unpack_from`.
+    * :class:`StringField`\\ s are found by searching for their terminator
+      from the current offset.
+    * Fields which implement ``decode_from``, such as
+      :class:`MessageArrayField`, decode from the current offset.
+    * Any other fields are decoded by calling their ``decode`` method on
+      the remainder of the buffer as normal.
+
+    The decoded values are identical to those of decoding each field in
+    turn. If the buffer is too short for a run of fixed-width fields, the
+    message is instead decoded field-by-field so that the exact same
+    exception is raised.
+
+    :ivar fields: the fields the decoder was compiled for.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._steps = []
+        run = []
+        for field in fields:
+            if _is_fixed(field):
+                if run and not (field.format[:1] == run[0].format[:1]
+                                and field.format[:1] in "<>!"):
+                    self._steps.append(_compile_fixed(run))
+                    run = []
+                run.append(field)
+                continue
+            if run:
+                self._steps.append(_compile_fixed(run))
+                run = []
+            if _is_string(field):
+                self._steps.append(_compile_string(field))
+            else:
+                self._steps.append(_compile_nested(field))
+        if run:
+            self._steps.append(_compile_fixed(run))
+        self._names = tuple(field.name for field in fields)
+        self._lazy_steps = None
+        self._layout = {}
+
+    def _compile_lazy(self):
+        """Compile the steps used to decode messages lazily.
+
+        Consecutive fixed-width and string fields are indexed by a single
+        step which defers decoding them. Other fields are decoded as
+        normal.
+        """
+        segments = []
+        segment = None
+        for field in self.fields:
+            if _is_fixed(field) or _is_string(field):
+                if segment is None:
+                    segment = []
+                    segments.append(segment)
+                segment.append(field)
+            else:
+                segment = None
+                segments.append(field)
+        steps = []
+        slot = 0
+        for segment in segments:
+            if isinstance(segment, list):
+                steps.append(
+                    _compile_lazy_segment(segment, slot, self._layout))
+                slot += 1
+            else:
+                steps.append(_compile_nested(segment))
+        return steps
+
+    def decode_from(self, buffer, offset, lazy=False):
+        """Decode the fields of a message.
+
+        In lazy mode fixed-width fields without validators and strings
+        aren't decoded. Instead the returned values are a
+        :class:`LazyValues` which decodes them when they're accessed.
+
+        :param buffer: the bytes-like object to decode from.
+        :param int offset: the index of the start of the message.
+        :param bool lazy: whether or not to defer decoding fields.
+
+        :returns: a tuple containing the dictionary of decoded values, the
+            buffer and offset of the end of the message. If any field
+            doesn't support decoding from an offset then the returned
+            buffer will be a copy of the remainder of the original
+            buffer.
+        """
+        if lazy:
+            if self._lazy_steps is None:
+                self._lazy_steps = self._compile_lazy()
+            steps = self._lazy_steps
+            values = LazyValues(self._names, self._layout)
+        else:
+            steps = self._steps
+            values = {}
+        start = offset
+        try:
+            for step in steps:
+                buffer, offset = step(buffer, offset, values)
+        except struct.error:
+            remainder = buffer[start:]
+            if isinstance(remainder, memoryview):
+                # Field.decode expects bytes, e.g. to find terminators
+                remainder = remainder.tobytes()
+            values, buffer = _decode_fields(self.fields, remainder)
+            return values, buffer, 0
+        return values, buffer, offset
+
+    def decode_values(self, buffer, offset):
+        """Decode the fields of a message eagerly.
+
+        :returns: a tuple of the dictionary of decoded values and the
+            index of the end of the message in the given buffer.
+        """
+        values, remainder, end = self.decode_from(buffer, offset)
+        if remainder is not buffer:
+            end = len(buffer) - len(remainder) + end
+        return values, end
+
+
+def _decode_fields(fields, packet):
+    """Decode the fields of a message one at a time.
+
+    :returns: a tuple containing the dictionary of decoded values and
+        the remainder of the packet.
+    """
+    buffer = packet
+    values = {}
+    for field in fields:
+        values[field.name], buffer = field.decode(buffer, values)
+    return values, buffer
+
+
+# Marks values of LazyValues which have been deleted before being decoded.
+_DELETED = object()
+
+
+class LazyValues(collections.MutableMapping):
+    """Field values which are only decoded when first accessed.
+
+    This is used as the :attr:`Message.values` of messages decoded in lazy
+    mode. Rather than decoding fields, decoding records the position of
+    each field in the buffer. When a field is first accessed it's decoded
+    from that position and the decoded value is kept.
+
+    Values are iterated in field order. Checking whether a value exists
+    doesn't decode it.
+
+    :param names: the names of the message's fields in order.
+    :param layout: a dictionary which maps the names of deferred fields to
+        a tuple of the index of the match in :attr:`positions`, the group
+        of the match containing the field and a function which decodes
+        the field from the group's bytes.
+
+    :ivar positions: the regular expression matches of the segments of
+        the buffer containing the deferred fields.
+    """
+
+    def __init__(self, names, layout):
+        self._names = names
+        self._layout = layout
+        self._values = {}
+        self.positions = []
+
+    @property
+    def deferred(self):
+        """The names of the values which haven't been decoded yet."""
+        return frozenset(name for name, (slot, _, _) in self._layout.items()
+                         if slot < len(self.positions)
+                         and name not in self._values)
+
+    def __getitem__(self, name):
+        try:
+            value = self._values[name]
+        except KeyError:
+            slot, group, decode = self._layout[name]
+            if slot >= len(self.positions):
+                raise KeyError(name)
+            value = self._values[name] = decode(
+                self.positions[slot].group(group))
+        if value is _DELETED:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        if name in self._layout:
+            self._values[name] = _DELETED
+        else:
+            del self._values[name]
+
+    def __contains__(self, name):
+        if name in self._values:
+            return self._values[name] is not _DELETED
+        return (name in self._layout
+                and self._layout[name][0] < len(self.positions))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        names = set(self._names)
+        for name in self._names:
+            if name in self:
+                yield name
+        for name in list(self._values):
+            if name not in names and name in self:
+                yield name
+
+
+class Record(collections.Mapping):
+    """Compact, read-only field values of a decoded message.
+
+    Records are an alternative to :class:`Message` instances for small
+    messages which are decoded in bulk, such as :class:`PlayerEntry`. Each
+    message class has its own record type, see :meth:`Message.record_type`,
+    which stores the field values in ``__slots__``. They have no
+    :attr:`Message.payload` and can't be encoded or modified, but
+    otherwise have the same mapping interface and properties as the
+    message class. Records compare equal to messages with the same values.
+
+    :cvar message: the :class:`Message` subclass the record type is for.
+    """
+
+    __slots__ = ()
+    message = None
+    _source = ()
+    _fields = ()
+    _slots = {}
+    _setters = ()
+
+    @classmethod
+    def _make(cls, values):
+        """Create a record from a dictionary of field values."""
+        record = cls.__new__(cls)
+        for name, setter in cls._setters:
+            setter(record, values[name])
+        return record
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._slots[key])
+        except (KeyError, AttributeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, ", ".join(
+            "{}={!r}".format(name, self[name]) for name in self._fields))
+
+    def __reduce__(self):
+        return _restore_record, (self.message, dict(self))
+
+
+def _restore_record(message, values):
+    # Records are unpickled by recreating their (dynamically created)
+    # record type from their message class.
+    return message.record_type()._make(values)
+
+
+def _record_type(message):
+    """Create the record type for a message class.
+
+    Properties defined by the message class, or any of its bases other
+    than :class:`Message`, are copied to the record type.
+    """
+    names = tuple(field.name for field in message.fields)
+    slots = {name: str("_{}".format(index))
+             for index, name in enumerate(names)}
+    namespace = {}
+    for class_ in reversed(message.__mro__):
+        if issubclass(class_, Message) and class_ is not Message:
+            for attribute, value in vars(class_).items():
+                if isinstance(value, property):
+                    namespace[attribute] = value
+    namespace.update({
+        "__slots__": tuple(slots[name] for name in names),
+        "message": message,
+        "_source": message.fields,
+        "_fields": names,
+        "_slots": slots,
+    })
+    record_type = type(str(message.__name__), (Record,), namespace)
+    record_type._setters = tuple(
+        (name, getattr(record_type, slots[name]).__set__) for name in names)
+    return record_type
 
 
 class Message(collections.Mapping):
@@ -385,6 +1040,25 @@ class Message(collections.Mapping):
         self.payload = payload
         self.values = field_values
 
+    @property
+    def payload(self):
+        """Any data following the message's fields.
+
+        For decoded messages this is a slice of the decoded buffer, which
+        is only taken when first accessed. So if the buffer was a
+        :class:`memoryview` then so is the payload.
+        """
+        if self._remainder is not None:
+            buffer, offset = self._remainder
+            self._payload = buffer[offset:]
+            self._remainder = None
+        return self._payload
+
+    @payload.setter
+    def payload(self, payload):
+        self._payload = payload
+        self._remainder = None
+
     def __getitem__(self, key):
         return self.values[key]
 
@@ -394,6 +1068,9 @@ class Message(collections.Mapping):
     def __delitem__(self, key):
         del self.values[key]
 
+    def __contains__(self, key):
+        return key in self.values
+
     def __len__(self):
         return len(self.values)
 
@@ -408,12 +1085,86 @@ class Message(collections.Mapping):
         return b"".join(buf)
 
     @classmethod
-    def decode(cls, packet):
-        buffer = packet
-        values = {}
-        for field in cls.fields:
-            values[field.name], buffer = field.decode(buffer, values)
-        return cls(buffer, **values)
+    def _decoder(cls):
+        """Get the compiled decoder for the class' fields.
+
+        Decoders are compiled the first time a class is decoded and are
+        recompiled if the class' fields are replaced.
+        """
+        decoder = cls.__dict__.get("_compiled_decoder")
+        if decoder is None or decoder.fields is not cls.fields:
+            decoder = _CompiledDecoder(cls.fields)
+            cls._compiled_decoder = decoder
+        return decoder
+
+    @classmethod
+    def record_type(cls):
+        """Get the compact :class:`Record` type for the class' fields.
+
+        Like the compiled decoder, the record type is created when first
+        requested and is recreated if the class' fields are replaced.
+        """
+        record_type = cls.__dict__.get("_record_type")
+        if record_type is None or record_type._source is not cls.fields:
+            record_type = _record_type(cls)
+            cls._record_type = record_type
+        return record_type
+
+    @classmethod
+    def decode(cls, packet, lazy=False):
+        """Decode a message.
+
+        By default every field is decoded immediately. In lazy mode the
+        buffer is only scanned to find where each field is. Fields are
+        then decoded individually when they're first accessed, so
+        consumers which only use a few fields avoid most of the work. The
+        :attr:`values` of lazily decoded messages are a
+        :class:`LazyValues`.
+
+        Fields with validators, and fields like
+        :class:`MessageArrayField`, are always decoded immediately. So
+        lazily decoding a malformed message raises the same exceptions as
+        eager decoding, except for converting fields such as
+        :class:`PlatformField` which raise :exc:`ValueError` when
+        they're accessed instead.
+
+        :param packet: a bytes-like object to decode from. Lazily
+            decoded messages keep a reference to it.
+        :param bool lazy: whether or not to defer decoding fields.
+
+        :raises BrokenMessageError: if the message couldn't be decoded.
+
+        :returns: an instance of the message class.
+        """
+        return cls.decode_from(packet, lazy=lazy)[0]
+
+    @classmethod
+    def decode_from(cls, buffer, offset=0, lazy=False):
+        """Decode a message from part of a buffer.
+
+        The buffer isn't copied, so large buffers containing many messages
+        can be decoded in linear time.
+
+        :param buffer: a bytes-like object such as :class:`bytes` or
+            :class:`memoryview`.
+        :param int offset: the index of the start of the message.
+        :param bool lazy: whether or not to defer decoding fields. See
+            :meth:`decode`.
+
+        :returns: a tuple of the decoded message and the index of the end
+            of the message in the buffer.
+        """
+        values, remainder, end = cls._decoder().decode_from(
+            buffer, offset, lazy)
+        if isinstance(values, LazyValues):
+            message = cls(None)
+            message.values = values
+        else:
+            message = cls(None, **values)
+        message._remainder = (remainder, end)
+        if remainder is not buffer:
+            end = len(buffer) - len(remainder) + end
+        return message, end
 
 
 class Header(Message):
@@ -434,10 +1185,18 @@ class Fragment(Message):
 
     @property
     def is_compressed(self):
-        return bool(self["message_id"] & 2**(2*8))
+        # The most significant bit of the message ID is set for
+        # bz2-compressed responses.
+        return bool(self["message_id"] & 2**31)
+
 
+class FragmentCompressionData(Message):
+    """Precedes the payload of the first fragment of compressed messages."""
 
-# TODO: FragmentCompressionData
+    fields = (
+        LongField("decompressed_size"),
+        UnsignedLongField("crc32"),
+    )
 
 
 class InfoRequest(Message):
@@ -527,16 +1286,16 @@ class RulesResponse(Message):
     )
 
     @classmethod
-    def decode(cls, packet):
+    def decode_from(cls, buffer, offset=0, lazy=False):
         # A2S_RESPONSE misteriously seems to add a FF FF FF FF
         # long to the beginning of the response which isn't
         # mentioned on the wiki.
         #
         # Behaviour witnessed with TF2 server 94.23.226.200:2045
         # As of 2015-11-22, Quake Live servers on steam do not
-        if packet.startswith(b'\xff\xff\xff\xff'):
-            packet = packet[4:]
-        return super(cls, RulesResponse).decode(packet)
+        if buffer[offset:offset + 4] == b'\xff\xff\xff\xff':
+            offset += 4
+        return super(RulesResponse, cls).decode_from(buffer, offset, lazy)
 
 # For Master Server
 class MSAddressEntryPortField(MessageField):
@@ -554,6 +1313,64 @@ class MSAddressEntryIPField(MessageField):
         return (".".join(six.text_type(b) for b in
                 struct.unpack(b"<BBBB", field_data)), left_overs)
 
+    def decode_from(self, buffer, offset, values={}):
+        if len(buffer) - offset < 4 or offset >= len(buffer):
+            raise BufferExhaustedError
+        return (".".join(six.text_type(b) for b in
+                struct.unpack_from(b"<BBBB", buffer, offset)), offset + 4)
+
+
+class MSAddressArrayField(MessageField):
+    """
+        Decodes all the remaining master server addresses in a buffer as
+        packed addresses (see util.pack_address.) The addresses are all
+        decoded in a single pass rather than one at a time.
+
+        The addresses are returned as an array.array of integers, which
+        is far more compact than decoding each address as a message. If
+        the platform's array doesn't support 64-bit integers then a list
+        is returned instead.
+        Any trailing bytes which don't form a complete address are left
+        in the buffer.
+    """
+
+    fmt = ">IH"
+
+    def encode(self, addresses, values={}):
+        return b"".join(struct.pack(self.format, address >> 16,
+                                    address & 0xFFFF)
+                        for address in addresses)
+
+    def decode(self, buffer, values={}):
+        addresses, offset = self.decode_from(buffer, 0, values)
+        return addresses, buffer[offset:]
+
+    def decode_from(self, buffer, offset, values={}):
+        end = offset + (len(buffer) - offset) // 6 * 6
+        if _PACKED_ADDRESS_TYPE is None:
+            addresses = []
+            for position in range(offset, end, 6):
+                host, port = struct.unpack_from(
+                    self.format, buffer, position)
+                addresses.append(host << 16 | port)
+            return addresses, end
+        # Rather than unpacking each address, the six bytes of every
+        # address are copied into the low bytes of an eight byte
+        # big-endian integer at once, one byte position at a time. This
+        # is much faster as it leaves all the work to the slice
+        # assignments rather than the interpreter.
+        records = buffer[offset:end]
+        if six.PY2 and isinstance(records, memoryview):
+            # Python 2's memoryviews don't support extended slicing
+            records = records.tobytes()
+        widened = bytearray((end - offset) // 6 * 8)
+        for byte in range(6):
+            widened[byte + 2::8] = records[byte::6]
+        addresses = array.array(_PACKED_ADDRESS_TYPE, bytes(widened))
+        if sys.byteorder == "little":
+            addresses.byteswap()
+        return addresses, end
+
 
 class MasterServerRequest(Message):
 
@@ -584,5 +1401,27 @@ class MasterServerResponse(Message):
         # and can be ignored.
         MSAddressEntryIPField("start_host"),
         MSAddressEntryPortField("start_port"),
-        MessageArrayField("addresses", MSAddressEntry, MessageArrayField.all())
+        MessageArrayField("addresses", MSAddressEntry,
+                          MessageArrayField.all())
+    )
+
+
+class MasterServerCompactResponse(Message):
+    """MasterServerResponse with the addresses decoded as records."""
+
+    fields = (
+        MSAddressEntryIPField("start_host"),
+        MSAddressEntryPortField("start_port"),
+        MessageArrayField("addresses", MSAddressEntry,
+                          MessageArrayField.all(), compact=True)
+    )
+
+
+class MasterServerPackedResponse(Message):
+    """MasterServerResponse with the addresses decoded as packed integers."""
+
+    fields = (
+        MSAddressEntryIPField("start_host"),
+        MSAddressEntryPortField("start_port"),
+        MSAddressArrayField("addresses"),
     )
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Concurrent A2S queries over a small pool of sockets."""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import collections
+import errno
+import functools
+import heapq
+import itertools
+import select
+import socket
+import warnings
+
+import monotonic
+
+import valve.source
+from . import a2s
+from . import messages
+
+
+_EXCHANGES = {
+    "info": a2s._InfoExchange,
+    "players": a2s._PlayersExchange,
+    "rules": a2s._RulesExchange,
+    "snapshot": a2s._SnapshotExchange,
+}
+
+
+class Result(collections.namedtuple(
+        "Result", ("address", "request", "response", "error", "latency"))):
+    """The outcome of querying a single server.
+
+    :ivar address: the address of the server as given to
+        :meth:`MultiplexQuerier.submit`.
+    :ivar str request: the type of request that was made, e.g. ``info``.
+    :ivar response: the decoded response or ``None`` if the query failed.
+        For snapshots this is always set, although it may be incomplete.
+    :ivar error: the exception which caused the query to fail or ``None``
+        if it was successful. Timeouts are reported as
+        :exc:`valve.source.NoResponseError`.
+    :ivar latency: the number of milliseconds between sending the first
+        request and receiving the final response. This includes the
+        time taken by any intermediate challenge requests.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """Determine if the query was successful."""
+        return self.error is None
+
+
+class _Target(object):
+    """State of a single in-flight query."""
+
+    def __init__(self, address, key, request, exchange, socket_, buffers):
+        self.address = address
+        self.key = key
+        self.request = request
+        self.exchange = exchange
+        self.socket = socket_
+        self.fragments = a2s._FragmentBuffer(buffers)
+        self.started = None
+        self.deadline = None
+
+
+class MultiplexQuerier(object):
+    """Query many servers concurrently.
+
+    Unlike :class:`valve.source.a2s.ServerQuerier` which uses a socket
+    per server and waits for each response in turn, this querier sends
+    requests to any number of servers over a small pool of non-blocking
+    sockets. Responses are matched back to their query by the address they
+    were sent from and are returned as they arrive.
+
+    The simplest interface is through the :meth:`info`, :meth:`players`
+    and :meth:`rules` methods. Each accepts an iterable of addresses and
+    returns an iterator of :class:`Result`:
+
+    .. code-block:: python
+
+        with MultiplexQuerier(timeout=2.0) as querier:
+            for result in querier.info(addresses):
+                if result.ok:
+                    print(result.address, result.response["server_name"])
+
+    Addresses are consumed from the iterable lazily, so that at most
+    ``max_in_flight`` queries are outstanding at any one time. Results
+    are yielded in the order they complete, not the order the addresses
+    were given in.
+
+    For more control, queries can be started via :meth:`submit` and
+    their results collected via :meth:`poll`.
+
+    .. note::
+        Host names are resolved when queries are submitted, which blocks.
+        Prefer passing dotted-decimal IPv4 addresses.
+
+    :param timeout: the number of seconds to wait for each response to a
+        request before the query is considered to have failed.
+    :param max_in_flight: the maximum number of queries to have outstanding
+        when using :meth:`info`, :meth:`players` or :meth:`rules`.
+    :param sockets: the number of sockets to spread requests over.
+    :param challenges: the :class:`valve.source.a2s.ChallengeCache` to
+        use. If not given the shared
+        :data:`valve.source.a2s.challenge_cache` is used.
+    """
+
+    def __init__(self, timeout=5.0,
+                 max_in_flight=256, sockets=1, challenges=None):
+        if sockets < 1:
+            raise ValueError("Need at least one socket")
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        if challenges is None:
+            challenges = a2s.challenge_cache
+        self.challenges = challenges
+        self._contextual = False
+        self._sockets = []
+        for _ in range(sockets):
+            socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            socket_.setblocking(False)
+            self._sockets.append(socket_)
+        self._socket_cycle = itertools.cycle(self._sockets)
+        self._buffers = a2s._BufferPool()
+        self._in_flight = {}
+        self._backlog = collections.defaultdict(collections.deque)
+        self._deadlines = []
+        self._completed = []
+        self._sequence = itertools.count()
+
+    def __enter__(self):
+        self._contextual = True
+        return self
+
+    def __exit__(self, type_, exception, traceback):
+        self._contextual = False
+        self.close()
+
+    def __len__(self):
+        """Get the number of queries which haven't completed yet."""
+        return (len(self._in_flight)
+                + sum(len(queue) for queue in self._backlog.values()))
+
+    def _check_open(function):
+        # Wrap methods to raise QuerierClosedError when called
+        # after the querier has been closed.
+
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            if not self._sockets:
+                raise valve.source.QuerierClosedError
+            return function(self, *args, **kwargs)
+
+        return wrapper
+
+    def close(self):
+        """Close all the querier's sockets.
+
+        Any outstanding queries are abandoned. It is safe to call this
+        multiple times.
+        """
+        if self._contextual:
+            warnings.warn("{0.__class__.__name__} used as context "
+                          "manager but close called before exit".format(self))
+        for socket_ in self._sockets:
+            socket_.close()
+        del self._sockets[:]
+        self._in_flight.clear()
+        self._backlog.clear()
+        del self._deadlines[:]
+
+    def _complete(self, target, response=None, error=None):
+        """Finish a query, recording its result.
+
+        If there are other queries for the same address waiting on this
+        one then the next of them is started.
+        """
+        del self._in_flight[target.key]
+        target.fragments.clear()
+        latency = (monotonic.monotonic() - target.started) * 1000.0
+        self._completed.append(Result(
+            target.address, target.request, response, error, latency))
+        backlog = self._backlog.get(target.key)
+        if backlog:
+            address, request = backlog.popleft()
+            if not backlog:
+                del self._backlog[target.key]
+            self._start(address, target.key, request)
+
+    def _send(self, target, requests):
+        """Send requests for a query and reset its deadline."""
+        header = messages.Header(split=messages.NO_SPLIT).encode()
+        try:
+            for request in requests:
+                target.socket.sendto(
+                    header + request.encode(), target.key[1:])
+        except socket.error as exc:
+            self._complete(target, error=valve.source.NoResponseError(exc))
+            return
+        target.deadline = monotonic.monotonic() + self.timeout
+        heapq.heappush(self._deadlines,
+                       (target.deadline, next(self._sequence), target))
+
+    def _start(self, address, key, request):
+        socket_ = self._sockets[key[0]]
+        exchange = _EXCHANGES[request](address, self.challenges)
+        target = _Target(
+            address, key, request, exchange, socket_, self._buffers)
+        self._in_flight[key] = target
+        target.started = monotonic.monotonic()
+        self._send(target, target.exchange.start())
+
+    @_check_open
+    def submit(self, address, request="info"):
+        """Start querying a server.
+
+        The result of the query will be returned by a subsequent call to
+        :meth:`poll`. If a query for the same address is already in
+        progress, the new query will be started once the current one
+        completes.
+
+        :param address: the ``(host, port)`` address of the server.
+        :param str request: the type of request to make. Either ``info``,
+            ``players``, ``rules`` or ``snapshot``.
+
+        :raises ValueError: if the request type is not valid.
+        :raises QuerierClosedError: if the querier has been closed.
+        """
+        if request not in _EXCHANGES:
+            raise ValueError("Invalid request type {!r}".format(request))
+        socket_ = next(self._socket_cycle)
+        try:
+            host = socket.gethostbyname(address[0])
+        except socket.error as exc:
+            self._completed.append(Result(address, request, None,
+                                          valve.source.NoResponseError(exc),
+                                          0.0))
+            return
+        key = (self._sockets.index(socket_), host, address[1])
+        if key in self._in_flight:
+            self._backlog[key].append((address, request))
+        else:
+            self._start(address, key, request)
+
+    def _handle(self, socket_index, data, slab, source):
+        """Route a received datagram to its query.
+
+        The datagram is released back to the buffer pool once the query
+        no longer needs it.
+        """
+        target = self._in_flight.get((socket_index,) + source[:2])
+        if target is None:
+            self._buffers.release(slab)
+            return
+        try:
+            payload = target.fragments.feed(data, slab)
+            if payload is None:
+                return
+            requests = target.exchange.feed(payload)
+        except messages.BrokenMessageError as exc:
+            target.exchange.fail(exc)
+            self._complete(target, target.exchange.response, exc)
+            return
+        if target.exchange.done:
+            self._complete(target, response=target.exchange.response)
+        else:
+            self._send(target, requests)
+
+    def _drain(self, socket_):
+        """Read all the datagrams that are waiting on a socket."""
+        socket_index = self._sockets.index(socket_)
+        while True:
+            try:
+                size, source = socket_.recvfrom_into(self._buffers.reserve())
+            except socket.error as exc:
+                # Errors such as ECONNREFUSED from ICMP messages can't
+                # be attributed to a particular query, so just ignore
+                # them and let the query time out.
+                if exc.errno in (errno.ECONNREFUSED, errno.ECONNRESET):
+                    continue
+                return
+            data, slab = self._buffers.claim(size)
+            self._handle(socket_index, data, slab, source)
+
+    def _expire(self):
+        """Fail all queries whose deadline has passed."""
+        now = monotonic.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, _, target = heapq.heappop(self._deadlines)
+            if (self._in_flight.get(target.key) is target
+                    and target.deadline == deadline):
+                error = valve.source.NoResponseError(
+                    "Timed out waiting for response")
+                target.exchange.fail(error)
+                self._complete(target, target.exchange.response, error)
+
+    def _next_deadline(self):
+        """Get the earliest deadline of any in-flight query."""
+        while self._deadlines:
+            deadline, _, target = self._deadlines[0]
+            if (self._in_flight.get(target.key) is target
+                    and target.deadline == deadline):
+                return deadline
+            heapq.heappop(self._deadlines)
+        return None
+
+    @_check_open
+    def poll(self, timeout=None):
+        """Wait for queries to complete.
+
+        This waits until at least one query completes, the given timeout
+        is reached or there are no more queries in progress.
+
+        :param timeout: the maximum number of seconds to wait. If ``None``
+            this will wait until the next query completes.
+
+        :raises QuerierClosedError: if the querier has been closed.
+
+        :returns: a list of :class:`Result` which may be empty.
+        """
+        if timeout is not None:
+            poll_deadline = monotonic.monotonic() + timeout
+        while not self._completed and self._in_flight:
+            wait = self._next_deadline() - monotonic.monotonic()
+            if timeout is not None:
+                wait = min(wait, poll_deadline - monotonic.monotonic())
+            ready, _, _ = select.select(self._sockets, [], [], max(wait, 0))
+            for socket_ in ready:
+                self._drain(socket_)
+            self._expire()
+            if timeout is not None and monotonic.monotonic() >= poll_deadline:
+                break
+        completed = self._completed
+        self._completed = []
+        return completed
+
+    def query(self, addresses, request="info"):
+        """Query many servers.
+
+        :param addresses: an iterable of ``(host, port)`` addresses.
+        :param str request: the type of request to make to each server.
+            Either ``info``, ``players``, ``rules`` or ``snapshot``.
+
+        :raises QuerierClosedError: if the querier has been closed.
+
+        :returns: an iterator of :class:`Result` in the order the
+            queries complete.
+        """
+        addresses = iter(addresses)
+        exhausted = False
+        while True:
+            while not exhausted and len(self) < self.max_in_flight:
+                try:
+                    address = next(addresses)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    self.submit(address, request)
+            if exhausted and not self._completed and not len(self):
+                return
+            for result in self.poll():
+                yield result
+
+    def info(self, addresses):
+        """Retrieve information about many servers.
+
+        See :meth:`valve.source.a2s.ServerQuerier.info` for the fields
+        available on each response.
+
+        :returns: an iterator of :class:`Result`.
+        """
+        return self.query(addresses, "info")
+
+    def players(self, addresses):
+        """Retrieve the players connected to many servers.
+
+        See :meth:`valve.source.a2s.ServerQuerier.players` for the fields
+        available on each response.
+
+        :returns: an iterator of :class:`Result`.
+        """
+        return self.query(addresses, "players")
+
+    def rules(self, addresses):
+        """Retrieve the rules for many servers.
+
+        See :meth:`valve.source.a2s.ServerQuerier.rules` for the fields
+        available on each response.
+
+        :returns: an iterator of :class:`Result`.
+        """
+        return self.query(addresses, "rules")
+
+    def snapshot(self, addresses):
+        """Retrieve the info, players and rules for many servers.
+
+        See :meth:`valve.source.a2s.ServerQuerier.snapshot`. If a server
+        doesn't respond to every request then the result's error will be
+        set but its response will still be the partial
+        :class:`valve.source.a2s.Snapshot`.
+
+        :returns: an iterator of :class:`Result`.
+        """
+        return self.query(addresses, "snapshot")
+
+    del _check_open
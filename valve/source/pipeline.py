@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2017 Oliver Ainsworth
+
+"""Query servers as they're found by the master server."""
+
+from __future__ import (absolute_import,
+                        unicode_literals, print_function, division)
+
+import threading
+
+import six
+from six.moves import queue
+
+from . import master_server
+from . import multiplex
+from . import util
+
+
+# Marks the end of the addresses found by the discovery thread.
+_DONE = object()
+
+
+def _check_gamedir(info, value):
+    return info["folder"].lower() == six.text_type(value).lower()
+
+
+def _check_map(info, value):
+    return info["map"].lower() == six.text_type(value).lower()
+
+
+def _check_secure(info, value):
+    return bool(info["vac_enabled"]) == bool(value)
+
+
+def _check_linux(info, value):
+    return not value or info["platform"] == util.Platform.LINUX
+
+
+def _check_empty(info, value):
+    return not value or info["player_count"] > 0
+
+
+def _check_noplayers(info, value):
+    return not value or info["player_count"] == 0
+
+
+def _check_proxy(info, value):
+    return not value or info["server_type"] == util.ServerType.SOURCETV
+
+
+def _check_napp(info, value):
+    return info["app_id"] != int(value)
+
+
+def _check_type(info, value):
+    return info["server_type"] == value
+
+
+_CHECKS = {
+    "gamedir": _check_gamedir,
+    "map": _check_map,
+    "secure": _check_secure,
+    "linux": _check_linux,
+    "empty": _check_empty,
+    "noplayers": _check_noplayers,
+    "proxy": _check_proxy,
+    "napp": _check_napp,
+    "type": _check_type,
+}
+
+
+def matches(info, **filters):
+    """Check that a server's info satisfies master server filters.
+
+    The master server doesn't guarantee that the servers it returns
+    actually satisfy the filters given to
+    :meth:`valve.source.master_server.MasterServerQuerier.find`. This
+    re-checks the filters against the server's
+    :class:`valve.source.messages.InfoResponse`.
+
+    The ``gamedir``, ``map``, ``secure``, ``linux``, ``empty``,
+    ``noplayers``, ``proxy``, ``napp`` and ``type`` filters are checked.
+    Any other filters, such as ``gametype``, can't be determined from the
+    info response and are ignored.
+
+    :param info: the server's info response.
+    :param filters: the keyword arguments given to ``find``.
+
+    :returns: ``True`` if the server satisfies all the filters that can
+        be checked.
+    """
+    for key, value in six.iteritems(filters):
+        check = _CHECKS.get(key)
+        if check is not None and not check(info, value):
+            return False
+    return True
+
+
+class _Discovery(threading.Thread):
+    """Thread which feeds the addresses found by a search into a queue.
+
+    If the queue is full then the search is paused until the query stage
+    catches up. Exceptions raised by the search are put in the queue to
+    be re-raised by the query stage.
+    """
+
+    def __init__(self, find, addresses):
+        super(_Discovery, self).__init__()
+        self.daemon = True
+        self.find = find
+        self.addresses = addresses
+        self.stopped = threading.Event()
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.addresses.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def run(self):
+        try:
+            for address in self.find():
+                if not self._put(address):
+                    return
+        except Exception as exc:
+            self._put(exc)
+        else:
+            self._put(_DONE)
+
+
+def discover(master, request="info", concurrency=256, backlog=1024,
+             querier=None, where=None, region="all",
+             duplicates=master_server.Duplicates.SKIP, **filters):
+    """Find servers and query them as they're found.
+
+    Searching the master server and querying each server it returns
+    usually involves waiting for the search to finish before querying
+    the servers. Instead, this searches the master server in a background
+    thread and starts querying each server as soon as it's found. Up to
+    ``concurrency`` servers are queried at the same time using a
+    :class:`valve.source.multiplex.MultiplexQuerier`.
+
+    .. code-block:: python
+
+        with MasterServerQuerier() as msq:
+            for result in discover(msq, gamedir="tf", map="ctf_2fort"):
+                if result.ok:
+                    print(result.address, result.response["server_name"])
+
+    Found addresses which are waiting to be queried are buffered, up to
+    ``backlog`` of them. If the buffer fills up then the search is paused
+    until the queries catch up, so the addresses of a large search aren't
+    held in memory all at once.
+
+    The ``region``, ``duplicates`` and filter keyword arguments are
+    passed to :meth:`valve.source.master_server.MasterServerQuerier.find`.
+    The master server doesn't guarantee that servers satisfy the filters,
+    so for ``info`` and ``snapshot`` requests the responses are checked
+    using :func:`matches`. An additional ``where`` callable can be given
+    which is passed each info response and should return ``False`` to
+    skip the server. Failed queries are always returned.
+
+    :param master: the
+        :class:`valve.source.master_server.MasterServerQuerier` to search
+        with. It's used by the background thread until the search
+        completes, so it shouldn't be used for anything else until then.
+    :param str request: the type of query to make. Either ``info``,
+        ``players``, ``rules`` or ``snapshot``.
+    :param int concurrency: the maximum number of queries in progress.
+    :param int backlog: the maximum number of found addresses to buffer.
+    :param querier: the :class:`valve.source.multiplex.MultiplexQuerier`
+        to query the servers with. If not given, one is created using the
+        master server querier's timeout.
+    :param where: a callable used to filter info responses.
+
+    :raises ValueError: if the request type is not valid.
+
+    :returns: an iterator of :class:`valve.source.multiplex.Result` in the
+        order the queries complete.
+    """
+    if request not in multiplex._EXCHANGES:
+        raise ValueError("Invalid request type {!r}".format(request))
+    owns_querier = querier is None
+    if owns_querier:
+        querier = multiplex.MultiplexQuerier(timeout=master.timeout)
+    addresses = queue.Queue(backlog)
+    discovery = _Discovery(
+        lambda: master.find(region=region, duplicates=duplicates, **filters),
+        addresses)
+
+    def accept(result):
+        if not result.ok:
+            return True
+        info = result.response
+        if request == "snapshot":
+            info = info.info
+        elif request != "info":
+            return True
+        return matches(info, **filters) and (where is None or where(info))
+
+    discovery.start()
+    try:
+        found = True
+        while found or len(querier):
+            while found and len(querier) < concurrency:
+                try:
+                    # Only wait for an address if there's nothing else
+                    # to wait for
+                    address = addresses.get(block=not len(querier))
+                except queue.Empty:
+                    break
+                if address is _DONE:
+                    found = False
+                elif isinstance(address, Exception):
+                    raise address
+                else:
+                    querier.submit(address, request)
+            # Don't block polling if more addresses may be waiting
+            for result in querier.poll(timeout=0.01 if found else None):
+                if accept(result):
+                    yield result
+    finally:
+        discovery.stopped.set()
+        discovery.join()
+        if owns_querier:
+            querier.close()
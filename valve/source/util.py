@@ -4,6 +4,8 @@
 from __future__ import (absolute_import,
                         unicode_literals, print_function, division)
 
+import socket
+import struct
 import sys
 
 import six
@@ -254,3 +256,44 @@ class ServerType(object):
 ServerType.DEDICATED = ServerType(100)
 ServerType.NON_DEDICATED = ServerType(108)
 ServerType.SOURCETV = ServerType(112)
+
+
+def pack_address(host, port):
+    """Pack an IPv4 address into a single integer.
+
+    The packed address is the 48-bit integer formed from the four bytes
+    of the IP address followed by the two bytes of the port, as they're
+    sent by the master server. Packed addresses are much smaller than
+    ``(host, port)`` tuples and sort in the same order as the address
+    bytes. The null address ``0.0.0.0:0`` packs to zero.
+
+    :param host: the dotted-decimal IPv4 address.
+    :param int port: the port number.
+
+    :raises ValueError: if the host isn't a valid IPv4 address or the
+        port is out of range.
+
+    :returns: the packed address as an :class:`int`.
+    """
+    # inet_aton also accepts abbreviated forms such as 127.1
+    if host.count(".") != 3:
+        raise ValueError("Invalid IPv4 address {!r}".format(host))
+    try:
+        ip = struct.unpack(b">I", socket.inet_aton(host))[0]
+    except socket.error:
+        raise ValueError("Invalid IPv4 address {!r}".format(host))
+    if not 0 <= port <= 0xFFFF:
+        raise ValueError("Invalid port {!r}".format(port))
+    return ip << 16 | port
+
+
+def unpack_address(packed):
+    """Unpack an address packed by :func:`pack_address`.
+
+    :param int packed: the packed address.
+
+    :returns: a ``(host, port)`` tuple where the host is a dotted-decimal
+        string.
+    """
+    host = socket.inet_ntoa(struct.pack(b">I", packed >> 16))
+    return six.text_type(host), packed & 0xFFFF
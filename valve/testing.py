@@ -2,11 +2,21 @@
 
 import copy
 import functools
+import heapq
+import itertools
+import random
 import select
+import socket
+import struct
+import threading
 
+import monotonic
+import six
 import six.moves.socketserver as socketserver
 
 import valve.rcon
+from valve.source import messages
+from valve.source import util
 
 
 class UnexpectedRCONMessage(Exception):
@@ -125,20 +135,21 @@ class _TestRCONHandler(socketserver.BaseRequestHandler):
         the connection this method will exit.
         """
         while True:
-            ready, _, _ = select.select([self.request], [], [], 0)
-            if ready:
+            try:
                 received = self.request.recv(4096)
-                if not received:
-                    return
-                self._buffer += received
-                try:
-                    for message in self._decode_messages():
-                        self._handle_request(message)
-                except UnexpectedRCONMessage:
-                    return
+            except socket.error:
+                return
+            if not received:
+                return
+            self._buffer += received
+            try:
+                for message in self._decode_messages():
+                    self._handle_request(message)
+            except UnexpectedRCONMessage:
+                return
 
 
-class TestRCONServer(socketserver.TCPServer):
+class TestRCONServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """Stub RCON server for testing.
 
     This class provides a simple RCON server which can be configured to
@@ -151,7 +162,8 @@ class TestRCONServer(socketserver.TCPServer):
     server will expect the exact same requests.
 
     All expected requests should be configured *before* connecting the
-    client to the server.
+    client to the server. Each connection is handled by its own thread so
+    many clients can be connected at once.
 
     :param address: the address the server should bind to. By default it
         will use a random port on all interfaces. In such cases the actual
@@ -159,6 +171,8 @@ class TestRCONServer(socketserver.TCPServer):
         attribute.
     """
 
+    daemon_threads = True
+
     def __init__(self, address=('', 0)):
         socketserver.TCPServer.__init__(self, ('', 0), _TestRCONHandler)
         self._expectations = []
@@ -181,3 +195,339 @@ class TestRCONServer(socketserver.TCPServer):
             configured for the server.
         """
         return copy.deepcopy(self._expectations)
+
+
+class FakeUDPServer(object):
+    """Base for fake UDP servers which simulate network conditions.
+
+    A socket is bound for each server being simulated. Subclasses
+    implement :meth:`handle` to build the responses to each request.
+    Responses are delayed by ``latency`` plus up to ``jitter`` seconds
+    and each response datagram is dropped with a probability of
+    ``loss``. Jitter can reorder datagrams, including the fragments of
+    split responses.
+
+    The sockets are served by background threads, each of which serves
+    up to :attr:`SOCKETS_PER_THREAD` sockets. The randomness used for
+    jitter and loss is seeded so that simulations are repeatable.
+
+    :param int count: the number of sockets to bind.
+    :param host: the host to bind the sockets to.
+    :param float latency: the number of seconds to delay responses by.
+    :param float jitter: the maximum number of seconds to randomly delay
+        responses by in addition to ``latency``.
+    :param float loss: the probability of each response datagram being
+        dropped, between zero and one.
+    :param seed: the seed for the random number generators.
+
+    :raises ValueError: if the latency, jitter or loss are invalid.
+    """
+
+    SOCKETS_PER_THREAD = 256
+
+    def __init__(self, count, host="127.0.0.1",
+                 latency=0.0, jitter=0.0, loss=0.0, seed=0):
+        if latency < 0 or jitter < 0:
+            raise ValueError("Latency and jitter must not be negative")
+        if not 0 <= loss <= 1:
+            raise ValueError("Loss must be between zero and one")
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.received = 0
+        self.sent = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sockets = []
+        try:
+            for _ in range(count):
+                socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._sockets.append(socket_)
+                socket_.bind((host, 0))
+                socket_.setblocking(False)
+        except socket.error:
+            self._close_sockets()
+            raise
+        self.addresses = [socket_.getsockname()[:2]
+                          for socket_ in self._sockets]
+        self._threads = []
+        for offset in range(0, count, self.SOCKETS_PER_THREAD):
+            thread = threading.Thread(target=self._serve, args=(
+                offset, random.Random("{}:{}".format(seed, offset))))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, exception, traceback):
+        self.close()
+
+    def _close_sockets(self):
+        for socket_ in self._sockets:
+            socket_.close()
+        del self._sockets[:]
+
+    def close(self):
+        """Stop serving and close all the sockets.
+
+        Responses which haven't been sent yet are discarded.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        del self._threads[:]
+        self._close_sockets()
+
+    def handle(self, index, request):
+        """Respond to a request.
+
+        :param int index: the index of the socket the request was
+            received on, which is the same as its index in
+            :attr:`addresses`.
+        :param bytes request: the request datagram.
+
+        :returns: a list of response datagrams.
+        """
+        raise NotImplementedError
+
+    def _count(self, **counts):
+        with self._lock:
+            for counter, count in six.iteritems(counts):
+                setattr(self, counter, getattr(self, counter) + count)
+
+    def _serve(self, offset, random_):
+        sockets = self._sockets[offset:offset + self.SOCKETS_PER_THREAD]
+        indices = {socket_: offset + i for i, socket_ in enumerate(sockets)}
+        pending = []
+        sequence = itertools.count()
+        # Fleets can easily have more sockets than select() can handle,
+        # so poll() is preferred where it's available
+        if hasattr(select, "poll"):
+            poller = select.poll()
+            by_fd = {}
+            for socket_ in sockets:
+                poller.register(socket_, select.POLLIN)
+                by_fd[socket_.fileno()] = socket_
+
+            def wait(timeout):
+                return [by_fd[fd] for fd, _ in poller.poll(timeout * 1000)]
+        else:
+            def wait(timeout):
+                return select.select(sockets, [], [], timeout)[0]
+        while not self._stop.is_set():
+            timeout = 0.01
+            if pending:
+                timeout = min(
+                    timeout, max(pending[0][0] - monotonic.monotonic(), 0))
+            for socket_ in wait(timeout):
+                try:
+                    request, client = socket_.recvfrom(65536)
+                except socket.error:
+                    continue
+                responses = self.handle(indices[socket_], request)
+                dropped = 0
+                for response in responses:
+                    if random_.random() < self.loss:
+                        dropped += 1
+                        continue
+                    due = (monotonic.monotonic() + self.latency
+                           + random_.uniform(0, self.jitter))
+                    heapq.heappush(pending, (
+                        due, next(sequence), socket_, response, client))
+                self._count(received=1, dropped=dropped)
+            now = monotonic.monotonic()
+            while pending and pending[0][0] <= now:
+                _, _, socket_, response, client = heapq.heappop(pending)
+                try:
+                    socket_.sendto(response, client)
+                except socket.error:
+                    continue
+                self._count(sent=1)
+
+
+class FakeA2SFleet(FakeUDPServer):
+    """Many fake Source servers which answer A2S queries.
+
+    Each server is bound to its own port on ``host`` and answers
+    ``A2S_INFO``, ``A2S_PLAYER`` and ``A2S_RULES`` requests. The servers
+    are named after their index in :attr:`addresses`, e.g. ``Server 0``.
+    This can simulate thousands of servers on the local host, but the
+    process's file descriptor limit must allow for a socket per server.
+    Queriers wait on their sockets using :func:`select.select` which can
+    only handle file descriptors lower than ``FD_SETSIZE``, typically
+    1024. So queriers should be created before large fleets.
+
+    .. code-block:: python
+
+        with FakeA2SFleet(1000, latency=0.05, loss=0.01) as fleet:
+            with MultiplexQuerier() as querier:
+                results = list(querier.info(fleet.addresses))
+
+    If ``split`` is given then responses longer than it are sent as
+    multiple fragments. Otherwise each response is sent as a single
+    datagram.
+
+    See :class:`FakeUDPServer` for the parameters which simulate
+    network conditions.
+
+    :param int size: the number of servers.
+    :param int players: the number of players on each server.
+    :param dict rules: the rules of each server. By default each server
+        has a single ``sv_fake`` rule.
+    :param dict info: fields of the :class:`valve.source.messages.InfoResponse`
+        to override. ``server_name`` is formatted with the server's index.
+    :param int split: the maximum payload size of each fragment.
+    :param bool challenge: whether ``A2S_PLAYER`` and ``A2S_RULES``
+        requests must include the server's challenge number. If they
+        don't the server responds with its challenge number instead.
+
+    :raises ValueError: if the split size is invalid.
+    """
+
+    def __init__(self, size, players=0, rules=None, info=None,
+                 split=None, challenge=True, host="127.0.0.1",
+                 latency=0.0, jitter=0.0, loss=0.0, seed=0):
+        if split is not None and split < 1:
+            raise ValueError("Split size must be positive")
+        if rules is None:
+            rules = {"sv_fake": "1"}
+        fields = {
+            "response_type": 0x49,
+            "protocol": 17,
+            "server_name": "Server {}",
+            "map": "ctf_2fort",
+            "folder": "tf",
+            "game": "Team Fortress",
+            "app_id": 440,
+            "player_count": players,
+            "max_players": max(players, 24),
+            "bot_count": 0,
+            "server_type": 100,
+            "platform": 108,
+            "password_protected": 0,
+            "vac_enabled": 1,
+            "version": "1.0",
+        }
+        fields.update(info or {})
+        self.split = split
+        self.challenge = challenge
+        random_ = random.Random(seed)
+        self._challenges = [random_.randint(0, 2 ** 31 - 1)
+                            for _ in range(size)]
+        self._message_ids = itertools.count(1)
+        self._infos = [
+            messages.InfoResponse(**dict(
+                fields, server_name=fields["server_name"].format(index)
+            )).encode() for index in range(size)]
+        # PlayersResponse can't encode an empty list of players and
+        # RulesResponse can't encode its rules at all, so they're packed
+        # here instead
+        self._players = b"\x44" + struct.pack("<B", players) + b"".join(
+            messages.PlayerEntry(index=index, name="Player {}".format(index),
+                                 score=index, duration=60.0).encode()
+            for index in range(players))
+        self._rules = b"\x45" + struct.pack("<h", len(rules)) + b"".join(
+            six.text_type(part).encode("utf-8") + b"\x00"
+            for rule in sorted(rules.items()) for part in rule)
+        super(FakeA2SFleet, self).__init__(
+            size, host, latency, jitter, loss, seed)
+
+    def _respond(self, payload):
+        """Build the datagrams of a response, splitting it if need be."""
+        payload = b"\xFF\xFF\xFF\xFF" + payload
+        if self.split is None or len(payload) <= self.split:
+            return [payload]
+        chunks = [payload[i:i + self.split]
+                  for i in range(0, len(payload), self.split)]
+        message_id = next(self._message_ids) & 0x7FFFFFFF
+        header = messages.Header(split=messages.SPLIT).encode()
+        return [header + messages.Fragment(
+            message_id=message_id,
+            fragment_count=len(chunks),
+            fragment_id=index,
+            mtu=self.split,
+        ).encode() + chunk for index, chunk in enumerate(chunks)]
+
+    def handle(self, index, request):
+        if len(request) < 5 or request[:4] != b"\xFF\xFF\xFF\xFF":
+            return []
+        request_type = request[4:5]
+        if request_type == b"\x54":
+            return self._respond(self._infos[index])
+        if request_type not in {b"\x55", b"\x56"} or len(request) < 9:
+            return []
+        challenge = struct.unpack("<l", request[5:9])[0]
+        if self.challenge and challenge != self._challenges[index]:
+            return self._respond(messages.GetChallengeResponse(
+                response_type=0x41,
+                challenge=self._challenges[index],
+            ).encode())
+        if request_type == b"\x55":
+            return self._respond(self._players)
+        return self._respond(self._rules)
+
+
+class FakeMasterServer(FakeUDPServer):
+    """Fake master server which pages through a fixed set of addresses.
+
+    Requests are answered with pages of up to ``page_size`` addresses
+    following the request's cursor address. The final page of each
+    region is terminated by ``0.0.0.0:0``. Filters are ignored, so every
+    request for a region returns all of the region's addresses.
+
+    .. code-block:: python
+
+        with FakeA2SFleet(1000) as fleet, FakeMasterServer(
+                {REGION_EUROPE: fleet.addresses}) as master:
+            with MasterServerQuerier(master.address) as msq:
+                addresses = list(msq.find(region="eu"))
+
+    See :class:`FakeUDPServer` for the parameters which simulate
+    network conditions.
+
+    :param dict regions: maps numeric region codes to lists of
+        ``(host, port)`` addresses. Other regions have no addresses.
+    :param int page_size: the maximum number of addresses in each page.
+
+    :raises ValueError: if the page size isn't positive or an address is
+        invalid.
+    """
+
+    def __init__(self, regions, page_size=231, host="127.0.0.1",
+                 latency=0.0, jitter=0.0, loss=0.0, seed=0):
+        if page_size < 1:
+            raise ValueError("Page size must be positive")
+        self.page_size = page_size
+        self._regions = {}
+        for region, addresses in six.iteritems(regions):
+            packed = [util.pack_address(host_, port)
+                      for host_, port in addresses]
+            positions = {address: position + 1
+                         for position, address in enumerate(packed)}
+            self._regions[region] = packed, positions
+        super(FakeMasterServer, self).__init__(
+            1, host, latency, jitter, loss, seed)
+
+    @property
+    def address(self):
+        """The ``(host, port)`` address of the master server."""
+        return self.addresses[0]
+
+    def handle(self, index, request):
+        try:
+            request = messages.MasterServerRequest.decode(request)
+            host, port = request["address"].split(":")
+            cursor = util.pack_address(host, int(port))
+        except (messages.BrokenMessageError, ValueError):
+            return []
+        addresses, positions = self._regions.get(
+            request["region"], ([], {}))
+        start = positions.get(cursor, 0)
+        page = addresses[start:start + self.page_size]
+        if len(page) < self.page_size:
+            page = page + [0]
+        return [b"\xFF\xFF\xFF\xFF\x66\x0A"
+                + messages.MSAddressArrayField("addresses").encode(page)]